@@ -0,0 +1,194 @@
+"""
+Fixtures for the serializer / ORM benchmark suite.
+
+The dataset is seeded once per session. Its size is picked with
+``--bench-scale`` (or the HERMES_BENCH_SCALE environment variable):
+
+    smoke  -  50 stores,   5k documents,   5k queries (default, CI friendly)
+    full   - 10k stores,   1M documents,   1M queries
+
+Timings are compared against ``baseline.json``. Run with
+``--bench-update-baseline`` to record new numbers for the selected scale.
+The baseline holds each timing as a multiple of a calibration workload
+timed on the same machine, so it carries over between hosts.
+"""
+import json
+import os
+import statistics
+import time
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from django.utils import timezone
+
+from documents.models import VectorStore, Document, Query
+
+
+SCALES = {
+    'smoke': {'stores': 50, 'documents': 5_000, 'queries': 5_000},
+    'full': {'stores': 10_000, 'documents': 1_000_000, 'queries': 1_000_000},
+}
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+BATCH_SIZE = 5_000
+# Slack, in calibration units, so sub-millisecond timings don't flap on noisy machines
+MIN_SLACK = 5.0
+CALIBRATION_ROWS = [{'id': i, 'name': f'row {i}', 'tags': ['a', 'b', 'c']} for i in range(500)]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('hermesai benchmarks')
+    group.addoption(
+        '--bench-scale', choices=sorted(SCALES),
+        default=os.getenv('HERMES_BENCH_SCALE', 'smoke'),
+        help='Size of the seeded benchmark dataset',
+    )
+    group.addoption(
+        '--bench-update-baseline', action='store_true', default=False,
+        help='Write measured timings to benchmarks/baseline.json',
+    )
+    group.addoption(
+        '--bench-tolerance', type=float,
+        default=float(os.getenv('HERMES_BENCH_TOLERANCE', '1.0')),
+        help='Allowed slowdown over the baseline (1.0 means up to 2x slower)',
+    )
+
+
+def _seed(scale):
+    """Bulk insert the benchmark dataset and return a few handy rows."""
+    sizes = SCALES[scale]
+    now = timezone.now()
+
+    stores = [
+        VectorStore(
+            openai_vector_store_id=f'vs_bench_{i}',
+            name=f'Bench store {i}',
+            status='completed',
+            metadata={'seed': i},
+        )
+        for i in range(sizes['stores'])
+    ]
+    VectorStore.objects.bulk_create(stores, batch_size=BATCH_SIZE)
+
+    def documents():
+        for i in range(sizes['documents']):
+            yield Document(
+                title=f'Document {i}',
+                file=f'documents/bench_{i}.pdf',
+                file_size=1024 + i,
+                content_type='application/pdf',
+                status='completed' if i % 10 else 'processing',
+                openai_file_id=f'file-bench-{i}',
+                openai_vector_store_file_id=f'file-bench-{i}',
+                vector_store=stores[i % len(stores)],
+                processed_date=now,
+                attributes={'year': 2020 + i % 5},
+            )
+
+    def queries():
+        for i in range(sizes['queries']):
+            yield Query(
+                vector_store=stores[i % len(stores)],
+                query_text=f'benchmark question number {i % 997}',
+                response={'data': [{'file_id': f'file-bench-{i}', 'score': 0.5}]},
+                max_results=10,
+            )
+
+    for rows, model in ((documents(), Document), (queries(), Query)):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+
+    # Spread created_at so ordering work is representative.
+    Query.objects.filter(vector_store=stores[0]).update(created_at=now - timedelta(days=1))
+
+    return {
+        'scale': scale,
+        'store': stores[0],
+        'document': Document.objects.filter(vector_store=stores[0]).first(),
+        'query': Query.objects.filter(vector_store=stores[0]).first(),
+    }
+
+
+@pytest.fixture(scope='session')
+def bench_dataset(request, django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        dataset = _seed(request.config.getoption('--bench-scale'))
+    yield dataset
+    with django_db_blocker.unblock():
+        Query.objects.all().delete()
+        Document.objects.all().delete()
+        VectorStore.objects.all().delete()
+
+
+def calibrate(rounds=15):
+    """Seconds this machine takes for a fixed pure-Python workload (the fastest run)"""
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        [{key: str(value) for key, value in row.items()} for row in CALIBRATION_ROWS]
+        samples.append(time.perf_counter() - start)
+    return min(samples)
+
+
+class BenchRecorder:
+    def __init__(self, scale, tolerance, update):
+        self.scale = scale
+        self.tolerance = tolerance
+        self.update = update
+        self.unit = calibrate()
+        self.baseline = {}
+        if BASELINE_PATH.exists():
+            self.baseline = json.loads(BASELINE_PATH.read_text())
+        self.measured = {}
+
+    def __call__(self, name, func, rounds=5):
+        """Time ``func`` and fail when it regressed beyond the baseline."""
+        func()  # warm up caches, imports and query compilation
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        elapsed = statistics.median(samples)
+        relative = elapsed / self.unit
+        self.measured[name] = round(relative, 2)
+
+        expected = self.baseline.get(self.scale, {}).get(name)
+        if expected is not None and not self.update:
+            limit = expected * (1 + self.tolerance) + MIN_SLACK
+            assert relative <= limit, (
+                f'{name} took {elapsed * 1000:.2f} ms ({relative:.1f} units of {self.unit * 1000:.3f} ms), '
+                f'baseline is {expected:.1f} units (limit {limit:.1f})'
+            )
+        return elapsed
+
+    def save(self):
+        if not self.update or not self.measured:
+            return
+        self.baseline.setdefault(self.scale, {}).update(self.measured)
+        BASELINE_PATH.write_text(json.dumps(self.baseline, indent=2, sort_keys=True) + '\n')
+
+
+@pytest.fixture(scope='session')
+def bench(request):
+    recorder = BenchRecorder(
+        scale=request.config.getoption('--bench-scale'),
+        tolerance=request.config.getoption('--bench-tolerance'),
+        update=request.config.getoption('--bench-update-baseline'),
+    )
+    yield recorder
+    recorder.save()
+
+
+@pytest.fixture
+def api_client():
+    from rest_framework.test import APIClient
+    return APIClient()
+
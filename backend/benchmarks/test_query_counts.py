@@ -0,0 +1,75 @@
+"""
+Upper bounds on the number of SQL queries issued per endpoint.
+
+A bound that suddenly needs raising usually means an N+1 crept in.
+"""
+import pytest
+
+
+pytestmark = pytest.mark.django_db
+
+
+def test_vector_store_list_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    # The validator (stores only, counts included through their stamps), plus the list
+    with django_assert_max_num_queries(2):
+        response = api_client.get('/api/vector-stores/')
+    assert response.status_code == 200
+    with django_assert_max_num_queries(1):
+        response = api_client.get('/api/vector-stores/', HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+
+def test_vector_store_detail_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    store = bench_dataset['store']
+    with django_assert_max_num_queries(1):
+        response = api_client.get(f'/api/vector-stores/{store.pk}/')
+    assert response.status_code == 200
+    assert response.data['document_count'] == store.documents.count()
+
+
+def test_document_list_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    store = bench_dataset['store']
+    # The validator, plus the list
+    with django_assert_max_num_queries(2):
+        response = api_client.get('/api/documents/', {'vector_store': str(store.pk)})
+    assert response.status_code == 200
+    with django_assert_max_num_queries(1):
+        response = api_client.get(
+            '/api/documents/', {'vector_store': str(store.pk)}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+    assert response.status_code == 304
+
+
+def test_document_detail_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    document = bench_dataset['document']
+    with django_assert_max_num_queries(1):
+        response = api_client.get(f'/api/documents/{document.pk}/')
+    assert response.status_code == 200
+    with django_assert_max_num_queries(1):
+        response = api_client.get(f'/api/documents/{document.pk}/', HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
+
+
+def test_query_list_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    store = bench_dataset['store']
+    # The validator, plus the list
+    with django_assert_max_num_queries(2):
+        response = api_client.get('/api/queries/', {'vector_store': str(store.pk)})
+    assert response.status_code == 200
+
+
+def test_query_detail_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    query = bench_dataset['query']
+    # The query row, the validator of its hits' documents, and one bulk lookup to hydrate every hit
+    with django_assert_max_num_queries(3):
+        response = api_client.get(f'/api/queries/{query.pk}/')
+    assert response.status_code == 200
+    assert all(hit['document'] for hit in response.data['response']['data'])
+
+
+def test_stats_queries(api_client, bench_dataset, django_assert_max_num_queries):
+    # Totals, the time series, distinct texts across stores, top queries and
+    # their labels, whatever the history size
+    with django_assert_max_num_queries(5):
+        response = api_client.get('/api/stats/')
+    assert response.status_code == 200
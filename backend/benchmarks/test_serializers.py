@@ -0,0 +1,68 @@
+"""
+Serialization timings for every ViewSet, checked against baseline.json.
+"""
+import pytest
+
+from documents.models import VectorStore, Document, Query
+from documents.renderers import FastJSONRenderer
+from documents.serializers import VectorStoreSerializer, DocumentSerializer, QuerySerializer
+from documents.views import VectorStoreViewSet
+
+
+pytestmark = pytest.mark.django_db
+
+PAGE_SIZE = 100
+
+
+def test_vector_store_list_serialization(bench, bench_dataset):
+    queryset = VectorStoreViewSet.queryset
+
+    def run():
+        return VectorStoreSerializer(queryset[:PAGE_SIZE], many=True).data
+
+    bench('vector_store_list', run)
+
+
+def test_vector_store_detail_serialization(bench, bench_dataset):
+    store = VectorStoreViewSet.queryset.get(pk=bench_dataset['store'].pk)
+    bench('vector_store_detail', lambda: VectorStoreSerializer(store).data)
+
+
+def test_document_list_serialization(bench, bench_dataset):
+    queryset = Document.objects.filter(vector_store=bench_dataset['store'])
+
+    def run():
+        return DocumentSerializer(queryset[:PAGE_SIZE], many=True).data
+
+    bench('document_list', run)
+
+
+def test_document_detail_serialization(bench, bench_dataset):
+    document = bench_dataset['document']
+    bench('document_detail', lambda: DocumentSerializer(document).data)
+
+
+def test_query_list_serialization(bench, bench_dataset):
+    queryset = Query.objects.filter(vector_store=bench_dataset['store'])
+
+    def run():
+        return QuerySerializer(queryset[:PAGE_SIZE], many=True).data
+
+    bench('query_list', run)
+
+
+def test_query_list_rendering(bench, bench_dataset):
+    data = QuerySerializer(Query.objects.filter(vector_store=bench_dataset['store'])[:PAGE_SIZE], many=True).data
+    renderer = FastJSONRenderer()
+    bench('query_list_render', lambda: renderer.render(data))
+
+
+def test_query_detail_serialization(bench, bench_dataset):
+    query = bench_dataset['query']
+    bench('query_detail', lambda: QuerySerializer(query).data)
+
+
+def test_vector_store_full_list_serialization(bench, bench_dataset):
+    """The store list is not paginated, so time the whole thing."""
+    bench('vector_store_full_list', lambda: VectorStoreSerializer(VectorStoreViewSet.queryset, many=True).data, rounds=3)
+    assert VectorStore.objects.count() > 0
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import VectorStore, Document, Query
+from django.utils import timezone
+from .models import VectorStore, Document, Query, RemoteCleanup, UploadSession
+from .gc import schedule
+from .search import full_text_search
 
 
 @admin.register(VectorStore)
@@ -13,18 +16,53 @@ class VectorStoreAdmin(admin.ModelAdmin):
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ['title', 'vector_store', 'status', 'file_size', 'upload_date']
-    list_filter = ['status', 'content_type', 'upload_date', 'vector_store']
+    list_filter = ['status', 'extraction_status', 'content_type', 'upload_date', 'vector_store']
     search_fields = ['title', 'openai_file_id']
-    readonly_fields = ['id', 'file_size', 'content_type', 'upload_date', 'processed_date', 'openai_file_id', 'openai_vector_store_file_id']
+    readonly_fields = ['id', 'file_size', 'content_type', 'upload_date', 'processed_date', 'openai_file_id', 'openai_vector_store_file_id', 'pending_openai_file_id', 'retired_openai_file_id', 'content_hash', 'extraction_status', 'page_count', 'extracted_pages', 'token_count']
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if ' ' not in search_term and queryset.filter(openai_file_id=search_term).exists():
+            return queryset.filter(openai_file_id=search_term), False
+        return full_text_search(queryset, search_term, ranked=False), False
 
 
 @admin.register(Query)
 class QueryAdmin(admin.ModelAdmin):
-    list_display = ['query_text_short', 'vector_store', 'created_at', 'max_results']
+    list_display = ['query_text_short', 'vector_store', 'created_at', 'max_results', 'latency_ms']
     list_filter = ['created_at', 'vector_store']
     search_fields = ['query_text']
-    readonly_fields = ['id', 'created_at', 'response']
+    readonly_fields = ['id', 'created_at', 'response', 'latency_ms']
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return full_text_search(queryset, search_term, ranked=False), False
 
     def query_text_short(self, obj):
         return obj.query_text[:50] + "..." if len(obj.query_text) > 50 else obj.query_text
     query_text_short.short_description = 'Query'
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['filename', 'vector_store', 'status', 'offset', 'total_size', 'updated_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['filename', 'title']
+    readonly_fields = ['id', 'file_name', 'offset', 'document', 'created_at', 'updated_at']
+
+
+@admin.register(RemoteCleanup)
+class RemoteCleanupAdmin(admin.ModelAdmin):
+    list_display = ['remote_id', 'kind', 'backend', 'status', 'attempts', 'next_attempt_at']
+    list_filter = ['status', 'kind', 'backend']
+    search_fields = ['remote_id']
+    readonly_fields = ['created_at', 'updated_at', 'last_error']
+    actions = ['retry_now']
+
+    @admin.action(description='Retry selected cleanups now')
+    def retry_now(self, request, queryset):
+        queryset.update(status='pending', attempts=0, next_attempt_at=timezone.now())
+        schedule()
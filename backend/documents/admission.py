@@ -0,0 +1,186 @@
+"""
+Admission control for calls to the vector store backend
+
+Calls are split into classes, interactive (searches, status checks) and
+background (ingestion), each with its own slots so bulk uploads can't take
+the ones searches need. Within a class a store holds at most `per_store`
+slots, and freed slots go to waiting stores in weighted fair order. A call
+that would queue longer than its class's latency budget is refused at once
+with Overloaded, which DRF turns into a 429 with Retry-After; queueing never
+outlasts the request's deadline either.
+
+Limits are per process: each server worker and each management command
+keeps its own.
+"""
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework.exceptions import Throttled
+from .deadlines import DeadlineExceeded, expired, remaining
+
+# Weight of the last call in the running average of call durations
+SERVICE_TIME_ALPHA = 0.2
+
+
+class Overloaded(Throttled):
+    default_detail = 'The vector store is busy, try again later.'
+    default_code = 'overloaded'
+
+
+class _Waiter:
+    __slots__ = ('store', 'event', 'granted')
+
+    def __init__(self, store):
+        self.store = store
+        self.event = threading.Event()
+        self.granted = False
+
+
+class AdmissionClass:
+    """Slots of one class of calls, shared fairly between stores"""
+
+    def __init__(self, name: str, concurrency: int, per_store: int, budget: float,
+                 weights: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.per_store = max(min(per_store, self.concurrency), 1)
+        self.budget = budget
+        self.weights = weights or {}
+        self.lock = threading.Lock()
+        self.active = 0
+        self.active_by_store = defaultdict(int)
+        self.queues = {}
+        # Virtual time at which each waiting store is served next; a store
+        # advances by 1 / weight per grant, the lowest goes first
+        self.virtual = {}
+        self.clock = 0.0
+        self.service_time = 0.0
+
+    def weight(self, store) -> float:
+        return max(float(self.weights.get(str(store), 1)), 0.01)
+
+    def _free_for(self, store) -> bool:
+        return self.active < self.concurrency and self.active_by_store.get(store, 0) < self.per_store
+
+    def _grant(self, store) -> None:
+        self.active += 1
+        self.active_by_store[store] += 1
+
+    def estimated_wait(self, store) -> float:
+        """Seconds a new call for store would queue, from the calls ahead of it"""
+        waiting = sum(len(queue) for queue in self.queues.values())
+        own = len(self.queues.get(store, ()))
+        rounds = max((waiting + 1) / self.concurrency, (own + 1) / self.per_store)
+        return rounds * self.service_time
+
+    def acquire(self, store, shed: bool = True) -> None:
+        with self.lock:
+            if store not in self.queues and self._free_for(store):
+                self._grant(store)
+                return
+            wait = self.estimated_wait(store)
+            if shed and wait > self.budget:
+                raise Overloaded(wait=math.ceil(wait))
+            waiter = _Waiter(store)
+            if store not in self.queues:
+                self.queues[store] = deque()
+                self.virtual[store] = self.clock
+            self.queues[store].append(waiter)
+
+        timeout = self.budget if shed else None
+        left = remaining()
+        if left is not None:
+            timeout = max(left, 0) if timeout is None else max(min(timeout, left), 0)
+        if waiter.event.wait(timeout):
+            return
+        with self.lock:
+            if waiter.granted:
+                return
+            queue = self.queues[store]
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[store]
+                del self.virtual[store]
+            wait = max(self.estimated_wait(store), 1)
+        if expired():
+            raise DeadlineExceeded()
+        raise Overloaded(wait=math.ceil(wait))
+
+    def release(self, store, elapsed: float) -> None:
+        with self.lock:
+            self.active -= 1
+            self.active_by_store[store] -= 1
+            if not self.active_by_store[store]:
+                del self.active_by_store[store]
+            if self.service_time:
+                self.service_time += SERVICE_TIME_ALPHA * (elapsed - self.service_time)
+            else:
+                self.service_time = elapsed
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting stores, lowest virtual time first"""
+        while self.active < self.concurrency:
+            eligible = [store for store in self.queues if self.active_by_store.get(store, 0) < self.per_store]
+            if not eligible:
+                return
+            store = min(eligible, key=self.virtual.__getitem__)
+            queue = self.queues[store]
+            waiter = queue.popleft()
+            self.clock = self.virtual[store]
+            if queue:
+                self.virtual[store] += 1 / self.weight(store)
+            else:
+                del self.queues[store]
+                del self.virtual[store]
+            self._grant(store)
+            waiter.granted = True
+            waiter.event.set()
+
+
+_classes: Dict[str, AdmissionClass] = {}
+_classes_lock = threading.Lock()
+
+
+def get_class(name: str) -> AdmissionClass:
+    admission = _classes.get(name)
+    if admission is None:
+        with _classes_lock:
+            admission = _classes.get(name)
+            if admission is None:
+                config = settings.ADMISSION_CLASSES[name]
+                admission = AdmissionClass(
+                    name, config['concurrency'], config['per_store'], config['budget'],
+                    settings.ADMISSION_STORE_WEIGHTS,
+                )
+                _classes[name] = admission
+    return admission
+
+
+@contextmanager
+def admit(name: str, store, shed: bool = True):
+    """Hold a slot of class `name` for store (its local id) while the block runs
+
+    Raises Overloaded instead of queueing past the class budget, unless shed
+    is False, in which case it waits as long as it takes.
+    """
+    admission = get_class(name)
+    admission.acquire(store, shed)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        admission.release(store, time.monotonic() - started)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in ('ADMISSION_CLASSES', 'ADMISSION_STORE_WEIGHTS'):
+        with _classes_lock:
+            _classes.clear()
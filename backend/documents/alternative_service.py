@@ -2,17 +2,26 @@
 Alternative OpenAI service using requests directly
 This bypasses potential OpenAI client issues
 """
+import time
 import requests
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
 from django.utils import timezone
+from .backends import VectorStoreBackend
+from .deadlines import DeadlineSession
+from .filters import empty_search_page, matching_documents, to_openai, upstream_attributes
+from .gc import queue_cleanup
 from .models import VectorStore, Document, Query
+from .stores import get_store
 
 
-class AlternativeOpenAIService:
+class AlternativeOpenAIService(VectorStoreBackend):
     """OpenAI service using direct HTTP requests"""
+
+    has_remote = True
+    list_page_size = 100
     
     def __init__(self):
         if not settings.OPENAI_API_KEY:
@@ -30,6 +39,10 @@ class AlternativeOpenAIService:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+
+        # Shared session so the singleton reuses pooled TLS connections; the
+        # timeouts below are caps, shortened to the request's deadline
+        self.session = DeadlineSession()
     
     def create_vector_store(self, name: str, metadata: Optional[Dict] = None) -> VectorStore:
         """Create a new vector store via HTTP request"""
@@ -41,7 +54,7 @@ class AlternativeOpenAIService:
                 "metadata": metadata or {}
             }
             
-            response = requests.post(url, headers=self.headers, json=data, timeout=30)
+            response = self.session.post(url, headers=self.headers, json=data, timeout=30)
             response.raise_for_status()
             
             openai_vector_store = response.json()
@@ -75,7 +88,7 @@ class AlternativeOpenAIService:
                 "Authorization": f"Bearer {self.api_key}"
             }
             
-            response = requests.post(url, headers=headers, files=files, timeout=60)
+            response = self.session.post(url, headers=headers, files=files, timeout=60)
             response.raise_for_status()
             
             file_data = response.json()
@@ -84,13 +97,16 @@ class AlternativeOpenAIService:
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to upload file to OpenAI: {str(e)}")
     
-    def add_file_to_vector_store(self, vector_store_id: str, file_id: str) -> str:
+    def add_file_to_vector_store(self, vector_store_id: str, file_id: str,
+                                 attributes: Optional[Dict[str, Any]] = None) -> str:
         """Add a file to a vector store via HTTP request"""
         try:
             url = f"{self.base_url}/vector_stores/{vector_store_id}/files"
             data = {"file_id": file_id}
+            if attributes:
+                data["attributes"] = attributes
             
-            response = requests.post(url, headers=self.headers, json=data, timeout=30)
+            response = self.session.post(url, headers=self.headers, json=data, timeout=30)
             response.raise_for_status()
             
             vector_store_file = response.json()
@@ -99,50 +115,58 @@ class AlternativeOpenAIService:
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to add file to vector store: {str(e)}")
     
-    def search_vector_store(self, vector_store_id: str, query: str, max_results: int = 10) -> Dict[str, Any]:
+    def _post_search(self, vector_store_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self.base_url}/vector_stores/{vector_store_id}/search"
+        
+        response = self.session.post(url, headers=self.vector_store_headers, json=data, timeout=30)
+        
+        if response.status_code != 200:
+            try:
+                error_detail = response.json()
+                print(f"API Error details: {error_detail}")
+            except:
+                pass
+            
+        response.raise_for_status()
+        return response.json()
+    
+    def search_vector_store(self, vector_store_id: str, query: str, max_results: int = 10,
+                            filters: Optional[Dict[str, Any]] = None, record: bool = True) -> Dict[str, Any]:
         """Search in a vector store via HTTP request"""
         try:
             # Check if vector store exists and has documents
-            vector_store = VectorStore.objects.get(openai_vector_store_id=vector_store_id)
-            completed_docs = vector_store.documents.filter(status='completed').count()
-            print(f"Vector store has {completed_docs} completed documents")
+            vector_store = get_store(openai_id=vector_store_id)
+            if vector_store is None:
+                raise VectorStore.DoesNotExist()
             
-            if completed_docs == 0:
+            if vector_store.completed_documents == 0:
                 print("Warning: No completed documents in vector store")
             
-            url = f"{self.base_url}/vector_stores/{vector_store_id}/search"
-            data = {
-                "query": query,
-                "max_num_results": max_results
-            }
-            
-            print(f"Making search request to: {url}")
-            print(f"Request data: {data}")
-            print(f"Request headers: {self.vector_store_headers}")
-            
-            response = requests.post(url, headers=self.vector_store_headers, json=data, timeout=30)
-            
-            print(f"Response status: {response.status_code}")
-            print(f"Response headers: {response.headers}")
-            print(f"Response text: {response.text}")
-            
-            if response.status_code != 200:
-                try:
-                    error_detail = response.json()
-                    print(f"API Error details: {error_detail}")
-                except:
-                    pass
-                
-            response.raise_for_status()
-            
-            search_results = response.json()
+            latency_ms = None
+            if filters and not matching_documents(vector_store.id, filters).exists():
+                # No local document satisfies the filter, so upstream can't either
+                search_results = empty_search_page(query)
+            else:
+                data = {
+                    "query": query,
+                    "max_num_results": max_results
+                }
+                if filters:
+                    data["filters"] = to_openai(filters)
+                started = time.perf_counter()
+                search_results = self._post_search(vector_store_id, data)
+                latency_ms = (time.perf_counter() - started) * 1000
+            
+            if not record:
+                return {'query_id': None, 'results': search_results}
             
             # Save query to database
             query_obj = Query.objects.create(
-                vector_store=vector_store,
+                vector_store_id=vector_store.id,
                 query_text=query,
                 response=search_results,
-                max_results=max_results
+                max_results=max_results,
+                latency_ms=latency_ms
             )
             
             return {
@@ -165,7 +189,7 @@ class AlternativeOpenAIService:
         """Get the current status of a vector store from OpenAI"""
         try:
             url = f"{self.base_url}/vector_stores/{vector_store.openai_vector_store_id}"
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, headers=self.headers, timeout=30)
             response.raise_for_status()
             
             openai_vector_store = response.json()
@@ -185,7 +209,7 @@ class AlternativeOpenAIService:
                 raise ValueError("Document must have a vector store file ID")
             
             url = f"{self.base_url}/vector_stores/{document.vector_store.openai_vector_store_id}/files/{document.openai_vector_store_file_id}"
-            response = requests.get(url, headers=self.headers, timeout=30)
+            response = self.session.get(url, headers=self.headers, timeout=30)
             response.raise_for_status()
             
             file_status = response.json()
@@ -198,20 +222,112 @@ class AlternativeOpenAIService:
                 'cancelled': 'failed'
             }
             
+            # Only transitions are written; polling an unchanged file saves nothing
             if file_status.get('status') in status_mapping:
-                document.status = status_mapping[file_status['status']]
-                if file_status.get('status') == 'completed':
+                new_status = status_mapping[file_status['status']]
+                if new_status == 'completed' and document.status != 'completed':
                     document.processed_date = timezone.now()
-                elif file_status.get('status') in ['failed', 'cancelled'] and file_status.get('last_error'):
+                elif new_status == 'failed' and file_status.get('last_error'):
                     document.error_message = str(file_status['last_error'])
+                document.status = new_status
                 document.save()
             
             return file_status
         except requests.exceptions.RequestException as e:
             raise Exception(f"Failed to get file status: {str(e)}")
     
-    def process_document(self, document: Document, vector_store: VectorStore) -> Document:
+    def delete_vector_store(self, vector_store: VectorStore) -> bool:
+        """Delete a vector store from OpenAI and from the database"""
+        try:
+            url = f"{self.base_url}/vector_stores/{vector_store.openai_vector_store_id}"
+            response = self.session.delete(url, headers=self.headers, timeout=30)
+            response.raise_for_status()
+            
+            vector_store.delete()
+            return True
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Failed to delete vector store: {str(e)}")
+
+    def _delete(self, path: str) -> bool:
+        response = self.session.delete(f"{self.base_url}/{path}", headers=self.headers, timeout=30)
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+    def _list_pages(self, path: str, params: Dict[str, Any], fields=('id', 'created_at')):
+        """Follow the `after` cursor of an OpenAI list endpoint, one page at a time"""
+        params = dict(params, limit=self.list_page_size)
+        while True:
+            response = self.session.get(f"{self.base_url}/{path}", headers=self.headers, params=params, timeout=30)
+            response.raise_for_status()
+            page = response.json()
+            data = page.get('data', [])
+            yield [{field: item.get(field) for field in fields} for item in data]
+            if not page.get('has_more') or not data:
+                return
+            params['after'] = data[-1]['id']
+
+    def upload_replacement(self, document: Document) -> str:
+        """Upload a document's current file to OpenAI"""
+        with document.file.open('rb') as handle:
+            return self.upload_file_to_openai(handle.read(), document.file.name)
+
+    def attach_file(self, vector_store_id: str, file_id: str,
+                    attributes: Optional[Dict[str, Any]] = None) -> str:
+        return self.add_file_to_vector_store(vector_store_id, file_id, attributes)
+
+    def vector_store_file_state(self, vector_store_id: str, vector_store_file_id: str):
+        url = f"{self.base_url}/vector_stores/{vector_store_id}/files/{vector_store_file_id}"
+        response = self.session.get(url, headers=self.headers, timeout=30)
+        response.raise_for_status()
+        vector_store_file = response.json()
+        return vector_store_file.get('status'), vector_store_file.get('last_error')
+
+    def attach_files(self, vector_store_id: str, file_ids: List[str],
+                     attributes: Optional[Dict[str, Any]] = None) -> str:
+        url = f"{self.base_url}/vector_stores/{vector_store_id}/file_batches"
+        data = {"file_ids": file_ids}
+        if attributes:
+            data["attributes"] = attributes
+        response = self.session.post(url, headers=self.headers, json=data, timeout=60)
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def file_batch_state(self, vector_store_id: str, batch_id: str):
+        path = f"vector_stores/{vector_store_id}/file_batches/{batch_id}"
+        response = self.session.get(f"{self.base_url}/{path}", headers=self.headers, timeout=30)
+        response.raise_for_status()
+        batch = response.json()
+        failed = {}
+        if batch.get('status') != 'in_progress' and batch.get('file_counts', {}).get('failed'):
+            for page in self._list_pages(f"{path}/files", {'filter': 'failed'}, fields=('id', 'last_error')):
+                failed.update((item['id'], str(item['last_error'])) for item in page)
+        return batch.get('status'), failed
+
+    def detach_file(self, vector_store_id: str, file_id: str) -> bool:
+        """Remove a file from a vector store, keeping the file itself"""
+        return self._delete(f"vector_stores/{vector_store_id}/files/{file_id}")
+
+    def delete_remote_vector_store(self, vector_store_id: str) -> bool:
+        """Delete a vector store from OpenAI only"""
+        return self._delete(f"vector_stores/{vector_store_id}")
+
+    def delete_remote_file(self, file_id: str) -> bool:
+        """Delete a file from OpenAI, which also detaches it from its vector stores"""
+        return self._delete(f"files/{file_id}")
+
+    def list_remote_vector_stores(self):
+        """Yield pages of the account's vector stores"""
+        return self._list_pages('vector_stores', {})
+
+    def list_remote_files(self):
+        """Yield pages of the account's assistants files"""
+        return self._list_pages('files', {'purpose': 'assistants'})
+    
+    def ingest_document(self, document: Document, vector_store: VectorStore) -> Document:
         """Complete process: upload file to OpenAI and add to vector store"""
+        previous_file_id = document.openai_file_id
         try:
             # Read file content
             document.file.seek(0)
@@ -226,7 +342,8 @@ class AlternativeOpenAIService:
             # Add file to vector store
             vector_store_file_id = self.add_file_to_vector_store(
                 vector_store.openai_vector_store_id, 
-                openai_file_id
+                openai_file_id,
+                upstream_attributes(document.attributes)
             )
             document.openai_vector_store_file_id = vector_store_file_id
             document.save()
@@ -235,16 +352,10 @@ class AlternativeOpenAIService:
         except Exception as e:
             document.status = 'failed'
             document.error_message = str(e)
+            if document.openai_file_id != previous_file_id:
+                # The upload went through but the document won't use it
+                queue_cleanup(file_ids=[document.openai_file_id])
+                document.openai_file_id = previous_file_id
             document.save()
             raise e
 
-
-# Use this service as a fallback
-def get_openai_service():
-    """Get the appropriate OpenAI service"""
-    try:
-        from .services import OpenAIVectorStoreService
-        return OpenAIVectorStoreService()
-    except Exception as e:
-        print(f"Using alternative service due to error: {e}")
-        return AlternativeOpenAIService()
\ No newline at end of file
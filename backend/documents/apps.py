@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class DocumentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "documents"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .schema import create_database_objects
+        post_migrate.connect(create_database_objects, sender=self)
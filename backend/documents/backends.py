@@ -0,0 +1,149 @@
+"""
+Vector store backend registry
+
+Every backend implements VectorStoreBackend. The active one is chosen by
+settings.VECTOR_STORE_BACKEND, imported lazily from
+settings.VECTOR_STORE_BACKENDS and built once per process.
+"""
+import threading
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .extraction import extract_documents
+
+
+class VectorStoreBackend:
+    """Interface shared by all vector store backends
+
+    Instances are process-wide singletons, so implementations must not keep
+    per-request state on self.
+    """
+
+    # Backends that keep files and stores outside this database set this, so
+    # deleting rows leaves cleanup work for documents.gc
+    has_remote = False
+
+    def create_vector_store(self, name: str, metadata: Optional[Dict] = None):
+        """Create a vector store upstream and save it to the database"""
+        raise NotImplementedError
+
+    def delete_vector_store(self, vector_store) -> bool:
+        """Delete a vector store upstream and from the database"""
+        raise NotImplementedError
+
+    def delete_remote_vector_store(self, vector_store_id: str) -> bool:
+        """Delete only the upstream vector store; False if it was already gone"""
+        return False
+
+    def delete_remote_file(self, file_id: str) -> bool:
+        """Delete an upstream file; False if it was already gone"""
+        return False
+
+    def list_remote_vector_stores(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages of upstream vector stores as {'id', 'created_at'} dicts"""
+        return iter(())
+
+    def list_remote_files(self) -> Iterator[List[Dict[str, Any]]]:
+        """Yield pages of upstream files as {'id', 'created_at'} dicts"""
+        return iter(())
+
+    def search_vector_store(self, vector_store_id: str, query: str, max_results: int = 10,
+                            filters: Optional[Dict[str, Any]] = None, record: bool = True) -> Dict[str, Any]:
+        """Search a vector store by its upstream id and record the query
+
+        filters is a normalized attribute filter (see documents.filters).
+        Searches made with record=False, such as warm-ups, save no Query
+        and return a query_id of None.
+        """
+        raise NotImplementedError
+
+    def get_vector_store_status(self, vector_store) -> Dict[str, Any]:
+        """Get the upstream status of a vector store"""
+        raise NotImplementedError
+
+    def get_file_status(self, document) -> Dict[str, Any]:
+        """Get the upstream status of a document's vector store file"""
+        raise NotImplementedError
+
+    def upload_replacement(self, document) -> str:
+        """Upload a document's current file without touching the document; returns the file id"""
+        raise NotImplementedError
+
+    def attach_file(self, vector_store_id: str, file_id: str,
+                    attributes: Optional[Dict[str, Any]] = None) -> str:
+        """Add an uploaded file to a vector store; returns the vector store file id"""
+        raise NotImplementedError
+
+    def vector_store_file_state(self, vector_store_id: str, vector_store_file_id: str):
+        """(status, last_error) of a vector store file, status as reported upstream"""
+        raise NotImplementedError
+
+    def attach_files(self, vector_store_id: str, file_ids: List[str],
+                     attributes: Optional[Dict[str, Any]] = None) -> str:
+        """Add uploaded files to a vector store as one file batch; returns the batch id
+
+        Files of a batch are known upstream by their file ids.
+        """
+        raise NotImplementedError
+
+    def file_batch_state(self, vector_store_id: str, batch_id: str) -> Tuple[str, Dict[str, str]]:
+        """(status, {file id: error} of its failed files) of a file batch, status as reported upstream"""
+        raise NotImplementedError
+
+    def detach_file(self, vector_store_id: str, file_id: str) -> bool:
+        """Remove a file from a vector store but keep the file; False if it wasn't there"""
+        return False
+
+    def process_document(self, document, vector_store):
+        """Extract a document locally, then ingest it into a vector store
+
+        The status changes made while ingesting are written to the row once.
+        """
+        extract_documents([document])
+        with document.coalesced_saves():
+            return self.ingest_document(document, vector_store)
+
+    def ingest_document(self, document, vector_store):
+        """Upload a document and add it to a vector store"""
+        raise NotImplementedError
+
+
+_services: Dict[str, VectorStoreBackend] = {}
+_services_lock = threading.Lock()
+
+
+def get_service(name: Optional[str] = None) -> VectorStoreBackend:
+    """Return the process-wide instance of a vector store backend"""
+    name = name or settings.VECTOR_STORE_BACKEND
+    service = _services.get(name)
+    if service is not None:
+        return service
+
+    with _services_lock:
+        service = _services.get(name)
+        if service is None:
+            try:
+                path = settings.VECTOR_STORE_BACKENDS[name]
+            except KeyError:
+                raise ImproperlyConfigured(
+                    f"Unknown vector store backend '{name}'. "
+                    f"Choose one of: {', '.join(settings.VECTOR_STORE_BACKENDS)}"
+                )
+            service = import_string(path)()
+            _services[name] = service
+    return service
+
+
+def reset_services():
+    """Drop cached backend instances so the next call rebuilds them"""
+    with _services_lock:
+        _services.clear()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting in ('VECTOR_STORE_BACKEND', 'VECTOR_STORE_BACKENDS', 'OPENAI_API_KEY'):
+        reset_services()
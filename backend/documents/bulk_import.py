@@ -0,0 +1,218 @@
+"""
+Reading files for the import_documents command
+
+Sources are a directory tree, a zip archive or a tar archive (optionally
+compressed). Every file has a key, its path relative to the source root,
+which is what the import checkpoint records.
+
+Like extractors, this module does not touch Django, so its worker functions
+can run in a process pool.
+"""
+import json
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from typing import Iterator, NamedTuple, Optional, Tuple
+from . import extractors
+
+COPY_BUFFER = 1024 * 1024
+# Archive clutter and hidden files are never imported
+SKIPPED_PARTS = ('__MACOSX',)
+
+
+class SourceFile(NamedTuple):
+    key: str
+    size: int
+
+
+def _normalize(name: str) -> str:
+    # Archives made with `tar -C dir .` name their members ./file
+    return posixpath.normpath(name).lstrip('/')
+
+
+def _wanted(key: str) -> bool:
+    parts = key.split('/')
+    return not any(part.startswith('.') or part in SKIPPED_PARTS for part in parts)
+
+
+class DirectorySource:
+    random_access = True
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def files(self) -> Iterator[SourceFile]:
+        for root, dirs, names in os.walk(self.path):
+            dirs.sort()
+            for name in sorted(names):
+                full = os.path.join(root, name)
+                key = os.path.relpath(full, self.path).replace(os.sep, '/')
+                if _wanted(key) and os.path.isfile(full):
+                    yield SourceFile(key, os.path.getsize(full))
+
+    def open(self, key: str):
+        return open(os.path.join(self.path, *key.split('/')), 'rb')
+
+    def local_path(self, key: str) -> Optional[str]:
+        return os.path.join(self.path, *key.split('/'))
+
+
+class ZipSource:
+    random_access = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+
+    def files(self) -> Iterator[SourceFile]:
+        for info in self.archive.infolist():
+            if not info.is_dir() and _wanted(info.filename):
+                yield SourceFile(info.filename, info.file_size)
+
+    def open(self, key: str):
+        return self.archive.open(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+
+class TarSource:
+    """Tar archives are read front to back, so members can't be opened out of order"""
+    random_access = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def members(self) -> Iterator[Tuple[SourceFile, object]]:
+        with tarfile.open(self.path, 'r:*') as archive:
+            for member in archive:
+                key = _normalize(member.name)
+                if member.isfile() and _wanted(key):
+                    yield SourceFile(key, member.size), archive.extractfile(member)
+
+    def files(self) -> Iterator[SourceFile]:
+        for entry, _ in self.members():
+            yield entry
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None
+
+
+class Checkpoint:
+    """Append-only JSON lines record of what happened to each source file
+
+    The last line for a key wins. States are 'created' (the Document row
+    exists), 'done', 'failed' and 'skipped'.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.states = {}
+        self.handle = None
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line torn by a crash
+                    self.states[record['key']] = record
+
+    def record(self, key: str, state: str, **fields) -> None:
+        if self.handle is None:
+            self.handle = open(self.path, 'a+', encoding='utf-8')
+            if self.handle.tell():
+                self.handle.seek(self.handle.tell() - 1)
+                if self.handle.read(1) != '\n':
+                    # Start after a line torn by a crash, not on it
+                    self.handle.write('\n')
+        record = {'key': key, 'state': state, **fields}
+        self.handle.write(json.dumps(record) + '\n')
+        self.states[key] = record
+
+    def sync(self) -> None:
+        if self.handle is not None:
+            self.handle.flush()
+            os.fsync(self.handle.fileno())
+
+    def close(self) -> None:
+        if self.handle is not None:
+            self.sync()
+            self.handle.close()
+            self.handle = None
+
+
+def open_source(path: str):
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    if tarfile.is_tarfile(path):
+        return TarSource(path)
+    raise ValueError(f"{path} is not a directory, zip or tar archive")
+
+
+# One open source per worker process (or per thread pool) and path
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def _source(path: str):
+    with _sources_lock:
+        if path not in _sources:
+            _sources[path] = open_source(path)
+        return _sources[path]
+
+
+def copy_stream(stream, destination: str) -> int:
+    """Write a file object to destination and return the number of bytes"""
+    with open(destination, 'wb') as handle:
+        shutil.copyfileobj(stream, handle, COPY_BUFFER)
+        return handle.tell()
+
+
+def estimate_tokens(path: str, filename: str, encoding_name: str) -> Tuple[int, bool]:
+    """Token count of a file's text, and whether it was counted exactly
+
+    Files that can't be read locally are estimated at four bytes per token.
+    """
+    kind = extractors.detect_kind(filename)
+    try:
+        if kind is None:
+            raise extractors.UnsupportedDocument(filename)
+        pages = extractors.page_count(path, kind)
+        reader = extractors.READERS[kind][1]
+        return sum(extractors.count_tokens(text, encoding_name) for _, text in reader(path, 0, pages)), True
+    except Exception:
+        return os.path.getsize(path) // extractors.BYTES_PER_TOKEN, False
+
+
+def copy_file(source_path: str, key: str, destination: str) -> Tuple[str, int]:
+    """Pool task: copy one source file to its place in storage"""
+    with _source(source_path).open(key) as stream:
+        return key, copy_stream(stream, destination)
+
+
+def measure_file(source_path: str, key: str, encoding_name: str, local_path: Optional[str] = None):
+    """Pool task: (key, tokens, exact) for one source file, copying nothing into storage
+
+    local_path is a temporary copy already made by the caller (tar members);
+    it is removed afterwards, like the copies made here for zip members.
+    """
+    temporary = local_path
+    if local_path is None:
+        local_path = _source(source_path).local_path(key)
+    if local_path is None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(key)[1]) as handle:
+            with _source(source_path).open(key) as stream:
+                shutil.copyfileobj(stream, handle, COPY_BUFFER)
+        local_path = temporary = handle.name
+    try:
+        return (key,) + estimate_tokens(local_path, key, encoding_name)
+    finally:
+        if temporary is not None:
+            os.remove(temporary)
@@ -0,0 +1,93 @@
+"""
+Conditional GET for list and detail endpoints
+
+A response's validator is computed from the rows behind it rather than from
+the rendered body: the latest change timestamps and the row counts of the
+filtered querysets (counts catch deletions, which move no timestamp). When a
+client's If-None-Match still matches, it gets a 304 before anything is
+serialized.
+
+Lists are only checked against the ETag. Last-Modified is sent on every
+response, but If-Modified-Since is honoured for single objects only, since
+a deleted row leaves a list's latest timestamp where it was.
+"""
+import hashlib
+from datetime import datetime
+from typing import Iterable, List, Optional, Sequence, Tuple
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+def queryset_state(queryset, fields: Sequence[str]) -> List:
+    """Row count and latest value of each timestamp field, in one aggregate query"""
+    if not queryset.query.is_sliced:
+        queryset = queryset.order_by()
+    aggregates = {'count': Count('pk')}
+    aggregates.update((f'max_{field}', Max(field)) for field in fields)
+    values = queryset.aggregate(**aggregates)
+    return [values[name] for name in aggregates]
+
+
+class ConditionalGetMixin:
+    """ViewSet mixin adding ETag, Last-Modified and Cache-Control to list and retrieve
+
+    `modified_fields` name the timestamps that change whenever a row's
+    representation does. Views whose output depends on other rows extend
+    list_state() or object_state().
+    """
+
+    modified_fields: Tuple[str, ...] = ()
+
+    def list_state(self) -> List:
+        return queryset_state(self.filter_queryset(self.get_queryset()), self.modified_fields)
+
+    def object_state(self, obj) -> List:
+        return [getattr(obj, field) for field in self.modified_fields]
+
+    def _validators(self, state: Iterable) -> Tuple[str, Optional[int]]:
+        state = list(state)
+        request = self.request
+        key = '|'.join([
+            request.build_absolute_uri(),
+            request.accepted_renderer.format,
+            *(value.isoformat() if isinstance(value, datetime) else str(value) for value in state),
+        ])
+        etag = quote_etag(hashlib.sha1(key.encode()).hexdigest())
+        # HTTP dates have whole seconds
+        timestamps = [int(value.timestamp()) for value in state if isinstance(value, datetime)]
+        return etag, max(timestamps) if timestamps else None
+
+    def _conditional(self, request, state, render, by_date: bool):
+        etag, last_modified = self._validators(state)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified if by_date else None
+        )
+        if response is None:
+            response = render()
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, **settings.API_CACHE_CONTROL)
+        patch_vary_headers(response, ['Accept'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(
+            request, self.list_state(), lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+            by_date=False,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self._conditional(
+            request, self.object_state(instance),
+            lambda: self.render_object(request, instance), by_date=True,
+        )
+
+    def render_object(self, request, instance):
+        return Response(self.get_serializer(instance).data)
@@ -0,0 +1,224 @@
+"""
+Per-request deadlines
+
+DeadlineMiddleware gives every request a time budget: its endpoint's entry
+in REQUEST_DEADLINES, by URL name and method or by URL name alone (else
+REQUEST_DEADLINE_DEFAULT), shortened by an
+X-Request-Timeout header in seconds if the client will give up sooner.
+Whatever runs for the request takes its timeouts from what is left:
+outbound HTTP calls (DeadlineSession, call_timeout), admission queueing,
+and database queries, which are refused once time is up and cut off by a
+statement timeout on PostgreSQL or a progress handler on SQLite.
+
+Work outside a request (commands, background threads) has no deadline
+unless it sets one with `deadline()`.
+"""
+import contextvars
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+import requests
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+TIMEOUT_HEADER = 'HTTP_X_REQUEST_TIMEOUT'
+# SQLite virtual machine instructions between two deadline checks
+SQLITE_PROGRESS_STEPS = 10000
+# statement_timeout is lowered again once it is this much (ms) above what's left
+STATEMENT_TIMEOUT_SLACK_MS = 1000
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'The request ran out of time.'
+    default_code = 'deadline_exceeded'
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one"""
+    deadline_at = _deadline.get()
+    return None if deadline_at is None else deadline_at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def check_deadline() -> None:
+    if expired():
+        raise DeadlineExceeded()
+
+
+def call_timeout(default: Optional[float] = None) -> Optional[float]:
+    """Timeout for one outbound call: default, or what's left of the deadline if less"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded()
+    return left if default is None else min(default, left)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Run the block with a deadline `seconds` from now; an earlier outer deadline still wins"""
+    deadline_at = None if seconds is None else time.monotonic() + seconds
+    outer = _deadline.get()
+    if outer is not None and (deadline_at is None or outer < deadline_at):
+        deadline_at = outer
+    token = _deadline.set(deadline_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class DeadlineSession(requests.Session):
+    """requests.Session whose per-call timeouts never outlast the deadline"""
+
+    def request(self, method, url, **kwargs):
+        kwargs['timeout'] = call_timeout(kwargs.get('timeout'))
+        try:
+            return super().request(method, url, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            if expired():
+                raise DeadlineExceeded() from e
+            raise
+
+
+class DatabaseDeadline:
+    """Execute wrapper holding the queries of one request to its deadline"""
+
+    def __init__(self):
+        # connection -> the DB-API connection its progress handler is set on
+        self.sqlite = {}
+        # connection -> (DB-API connection the session timeout is set on, timeout in ms)
+        self.postgresql_session = {}
+        # connection -> (transaction the timeout was set in, timeout in ms)
+        self.postgresql = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        left = remaining()
+        if left is None:
+            return execute(sql, params, many, context)
+        if left <= 0:
+            raise DeadlineExceeded()
+        connection = context['connection']
+        if connection.vendor == 'sqlite':
+            self._watch_sqlite(connection)
+        elif connection.vendor == 'postgresql':
+            if not connection.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS'):
+                self._limit_postgresql_session(connection, left)
+            elif not connection.in_atomic_block:
+                # Behind a transaction pooler, in autocommit a transaction-local
+                # setting would end with itself, so the statement gets a
+                # transaction of its own
+                with transaction.atomic(using=connection.alias):
+                    self._limit_postgresql(connection, left)
+                    return self._execute(execute, sql, params, many, context)
+            else:
+                self._limit_postgresql(connection, left)
+        return self._execute(execute, sql, params, many, context)
+
+    def _execute(self, execute, sql, params, many, context):
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError as e:
+            if expired():
+                raise DeadlineExceeded() from e
+            raise
+
+    def _watch_sqlite(self, connection) -> None:
+        # Tracked by DB-API connection, so one reopened mid-request is watched too
+        if self.sqlite.get(connection) is connection.connection:
+            return
+        deadline_at = _deadline.get()
+        # A true return value interrupts the running statement
+        connection.connection.set_progress_handler(lambda: time.monotonic() > deadline_at, SQLITE_PROGRESS_STEPS)
+        self.sqlite[connection] = connection.connection
+
+    def _limit_postgresql_session(self, connection, left: float) -> None:
+        """Set statement_timeout on the session, once per request and connection
+
+        close() resets it. Used unless the connection goes through a
+        transaction pooler (DISABLE_SERVER_SIDE_CURSORS), where the next
+        client of the server connection would inherit it.
+        """
+        timeout_ms = max(int(left * 1000), 1)
+        raw, current = self.postgresql_session.get(connection, (None, None))
+        if raw is connection.connection and current - timeout_ms < STATEMENT_TIMEOUT_SLACK_MS:
+            return
+        if connection.in_atomic_block:
+            # A session SET is undone if the transaction rolls back, so lower
+            # it for this transaction only; autocommit catches the session up
+            self._limit_postgresql(connection, left)
+            return
+        with connection.connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, false)", [str(timeout_ms)])
+        self.postgresql_session[connection] = (connection.connection, timeout_ms)
+
+    def _limit_postgresql(self, connection, left: float) -> None:
+        """Set statement_timeout for the current transaction only (set_config(..., true))
+
+        Django starts a new run_on_commit list at every commit and rollback,
+        which tells whether a timeout set earlier is still in effect.
+        """
+        timeout_ms = max(int(left * 1000), 1)
+        hooks, current = self.postgresql.get(connection, (None, None))
+        if hooks is connection.run_on_commit and current - timeout_ms < STATEMENT_TIMEOUT_SLACK_MS:
+            return
+        with connection.connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)", [str(timeout_ms)])
+        self.postgresql[connection] = (connection.run_on_commit, timeout_ms)
+
+    def close(self) -> None:
+        """Remove progress handlers and session timeouts, since connections outlive the request"""
+        for connection, raw in self.sqlite.items():
+            if connection.connection is raw:
+                raw.set_progress_handler(None, 0)
+        for connection, (raw, _) in self.postgresql_session.items():
+            if connection.connection is not raw:
+                continue
+            try:
+                with raw.cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+            except Exception as e:
+                # Rather than leave the request's timeout on a reused connection
+                print(f"Failed to reset the statement timeout, closing the connection: {e}")
+                connection.close()
+        self.sqlite.clear()
+        self.postgresql_session.clear()
+        self.postgresql.clear()
+
+    @classmethod
+    @contextmanager
+    def installed(cls):
+        wrapper = cls()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(wrapper))
+            try:
+                yield wrapper
+            finally:
+                wrapper.close()
+
+
+def request_budget(request) -> float:
+    """Seconds a request may take, from its endpoint, its method and X-Request-Timeout"""
+    try:
+        url_name = resolve(request.path_info).url_name
+    except Resolver404:
+        url_name = None
+    deadlines = settings.REQUEST_DEADLINES
+    budget = deadlines.get((url_name, request.method), deadlines.get(url_name, settings.REQUEST_DEADLINE_DEFAULT))
+    try:
+        requested = float(request.META.get(TIMEOUT_HEADER, ''))
+    except ValueError:
+        return budget
+    return min(budget, requested) if requested > 0 else budget
@@ -0,0 +1,166 @@
+"""
+File responses for document downloads
+
+Files are handed to the web server when DOCUMENT_SENDFILE_BACKEND is set
+(nginx X-Accel-Redirect or Apache/lighttpd X-Sendfile). Otherwise Django
+serves them itself through FileResponse, which WSGI servers such as gunicorn
+turn into a zero-copy sendfile(), including for single byte ranges.
+"""
+import mimetypes
+import os
+import re
+from typing import Optional, Tuple
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe
+from .models import Document
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class _RangeFile:
+    """Read-only view of [start, start + length) of an open file
+
+    It exposes fileno() so WSGI file wrappers can still sendfile() from the
+    current offset, bounded by the Content-Length of the response.
+    """
+
+    def __init__(self, handle, start: int, length: int):
+        self.handle = handle
+        self.remaining = length
+        self.name = handle.name
+        handle.seek(start)
+
+    def fileno(self):
+        return self.handle.fileno()
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.handle.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.handle.close()
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into inclusive (start, end)
+
+    Returns None for headers we do not handle (e.g. multiple ranges), in
+    which case the whole file is sent.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def file_etag(document: Document, stat: os.stat_result) -> str:
+    """Strong validator from the file identity, size and modification time"""
+    return f'"{document.id.hex}-{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def _not_modified(request, etag: str, last_modified: int) -> bool:
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+def _range_applies(request, etag: str, last_modified: int) -> bool:
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_document_file(request, document: Document, as_attachment: bool):
+    """Build the response that sends a document's file to the client"""
+    if not document.file:
+        raise Http404("Document has no file")
+    try:
+        path = document.file.path
+        stat = os.stat(path)
+    except (FileNotFoundError, NotImplementedError, ValueError):
+        raise Http404("Document file is not available")
+
+    etag = file_etag(document, stat)
+    last_modified = int(stat.st_mtime)
+    filename = os.path.basename(document.file.name)
+    content_type = (
+        document.content_type
+        or mimetypes.guess_type(filename)[0]
+        or 'application/octet-stream'
+    )
+    validators = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'private, no-cache',
+    }
+
+    if _not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+        for header, value in validators.items():
+            response[header] = value
+        return response
+
+    backend = settings.DOCUMENT_SENDFILE_BACKEND
+    if backend:
+        # The web server reads the file and handles Range/If-Range itself
+        response = HttpResponse(content_type=content_type)
+        if backend == 'nginx':
+            response['X-Accel-Redirect'] = settings.DOCUMENT_SENDFILE_URL + quote(document.file.name)
+        else:
+            response['X-Sendfile'] = path
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and _range_applies(request, etag, last_modified):
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        handle = open(path, 'rb')
+        if byte_range is None:
+            response = FileResponse(handle, content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = FileResponse(_RangeFile(handle, start, length), content_type=content_type, status=206)
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    for header, value in validators.items():
+        response[header] = value
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    return response
@@ -0,0 +1,39 @@
+"""
+Streaming NDJSON exports
+
+Rows are read with QuerySet.iterator() and serialized one at a time, so an
+export of any size holds only one database chunk and one output buffer in
+memory.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from .renderers import dumps
+
+# Bytes gathered before handing a piece of the body to the server
+FLUSH_SIZE = 64 * 1024
+
+
+def ndjson_lines(queryset, serializer_class, context, chunk_size: int):
+    buffer = []
+    size = 0
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        line = dumps(serializer_class(obj, context=context).data) + b'\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def ndjson_response(queryset, serializer_class, context, filename: str) -> StreamingHttpResponse:
+    """Stream a queryset as one JSON object per line"""
+    response = StreamingHttpResponse(
+        ndjson_lines(queryset, serializer_class, context, settings.EXPORT_CHUNK_SIZE),
+        content_type='application/x-ndjson',
+    )
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
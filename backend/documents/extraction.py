@@ -0,0 +1,184 @@
+"""
+Local text extraction stage
+
+Uploaded files are read into DocumentChunk rows by a process pool. Each file
+is split into windows of pages; every finished window is written right away
+and Document.extracted_pages records how many leading pages are stored, so
+an interrupted run picks up where it stopped. Several documents, and several
+windows of one large document, are extracted at the same time.
+"""
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Optional
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from . import extractors
+from .models import Document, DocumentChunk
+
+# Single small files are cheaper to extract in-process than to ship to a worker
+INLINE_MAX_BYTES = 2 * 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the process-wide extraction pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.DOCUMENT_EXTRACTION_WORKERS or os.cpu_count())
+        return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+class _InlineExecutor:
+    """Executor that runs work immediately in the calling process"""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class _Job:
+    def __init__(self, document: Document, kind: str, path: str):
+        self.document = document
+        self.kind = kind
+        self.path = path
+        self.finished_windows = set()
+        self.failed = False
+
+
+def _store_window(document: Document, start: int, stop: int, pages) -> None:
+    """Replace the chunks of pages [start, stop) with freshly extracted ones"""
+    chunks = [
+        DocumentChunk(
+            document=document,
+            page_number=page + 1,
+            index=index,
+            text=text,
+            token_count=tokens,
+        )
+        for page, page_chunks in pages
+        for index, (text, tokens) in enumerate(page_chunks)
+    ]
+    with transaction.atomic():
+        DocumentChunk.objects.filter(
+            document=document, page_number__gt=start, page_number__lte=stop
+        ).delete()
+        DocumentChunk.objects.bulk_create(chunks)
+
+
+def _set_status(document: Document, status: str, **fields) -> None:
+    document.extraction_status = status
+    for name, value in fields.items():
+        setattr(document, name, value)
+    document.save(update_fields=['extraction_status', *fields])
+
+
+def _finish(job: _Job) -> None:
+    total = job.document.chunks.aggregate(total=Sum('token_count'))['total'] or 0
+    _set_status(job.document, 'completed', token_count=total)
+
+
+def _fail(job: _Job, error: Exception) -> None:
+    job.failed = True
+    status = 'unsupported' if isinstance(error, extractors.UnsupportedDocument) else 'failed'
+    print(f"Extraction {status} for document {job.document.id}: {type(error).__name__}: {error}")
+    _set_status(job.document, status)
+
+
+def _prepare(document: Document) -> Optional[_Job]:
+    if document.extraction_status in ('completed', 'unsupported'):
+        return None
+    kind = extractors.detect_kind(document.file.name, document.content_type)
+    try:
+        path = document.file.path
+    except (NotImplementedError, ValueError):
+        # Only storages with local paths can be handed to worker processes
+        kind = None
+    if kind is None:
+        _set_status(document, 'unsupported')
+        return None
+    return _Job(document, kind, path)
+
+
+def extract_documents(documents: Iterable[Document]) -> None:
+    """Extract the text of documents into chunks, resuming partial runs
+
+    Failures are recorded on each document and never raised, since ingestion
+    does not depend on local extraction.
+    """
+    if not settings.DOCUMENT_EXTRACTION_ENABLED:
+        return
+
+    jobs = [job for job in map(_prepare, documents) if job is not None]
+    if not jobs:
+        return
+
+    inline = len(jobs) == 1 and (jobs[0].document.file_size or 0) <= INLINE_MAX_BYTES
+    executor = _InlineExecutor() if inline else get_pool()
+    window_pages = settings.DOCUMENT_EXTRACTION_WINDOW_PAGES
+    window_args = (settings.DOCUMENT_CHUNK_TOKENS, settings.DOCUMENT_TOKEN_ENCODING)
+
+    futures = {}
+    for job in jobs:
+        _set_status(job.document, 'extracting')
+        futures[executor.submit(extractors.page_count, job.path, job.kind)] = (job, None)
+
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            job, start = futures.pop(future)
+            if job.failed:
+                continue
+            try:
+                result = future.result()
+            except BrokenProcessPool as e:
+                _discard_pool()
+                _fail(job, e)
+                continue
+            except Exception as e:
+                _fail(job, e)
+                continue
+
+            document = job.document
+            if start is None:
+                # Page count probe: fan the remaining windows out to the pool
+                _set_status(document, 'extracting', page_count=result)
+                for window in range(document.extracted_pages, result, window_pages):
+                    stop = min(window + window_pages, result)
+                    future = executor.submit(
+                        extractors.extract_window, job.path, job.kind, window, stop, *window_args
+                    )
+                    futures[future] = (job, window)
+                if document.extracted_pages >= result:
+                    _finish(job)
+                continue
+
+            stop = min(start + window_pages, document.page_count)
+            _store_window(document, start, stop, result)
+            job.finished_windows.add(start)
+
+            cursor = document.extracted_pages
+            while cursor in job.finished_windows:
+                cursor = min(cursor + window_pages, document.page_count)
+            if cursor != document.extracted_pages:
+                document.extracted_pages = cursor
+                document.save(update_fields=['extracted_pages'])
+            if cursor >= document.page_count:
+                _finish(job)
@@ -0,0 +1,314 @@
+"""
+Text extractors for uploaded documents
+
+These functions run inside extraction worker processes, so this module must
+not import Django or anything that needs configured settings. Every format
+exposes its content as numbered pages that can be read in windows, which is
+what lets a large file be split across several workers and resumed.
+"""
+import os
+import zipfile
+from functools import lru_cache, wraps
+from typing import List, Optional, Tuple
+
+# Plain text and HTML have no real pages, so they are cut into fixed slices
+TEXT_PAGE_BYTES = 16 * 1024
+HTML_PAGE_CHARS = 16 * 1024
+# DOCX files without explicit page breaks are grouped by paragraph count
+DOCX_PARAGRAPHS_PER_PAGE = 40
+# Rough size of a token, for files whose text can't be counted
+BYTES_PER_TOKEN = 4
+# Whole-file parses kept per worker process (see _parsed)
+PARSED_CACHE_SIZE = 2
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+EXTENSION_KINDS = {
+    '.pdf': 'pdf',
+    '.docx': 'docx',
+    '.xlsx': 'xlsx',
+    '.xlsm': 'xlsx',
+    '.html': 'html',
+    '.htm': 'html',
+    '.txt': 'text',
+    '.md': 'text',
+    '.csv': 'text',
+    '.json': 'text',
+    '.py': 'text',
+}
+
+CONTENT_TYPE_KINDS = {
+    'application/pdf': 'pdf',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+    'text/html': 'html',
+}
+
+
+class UnsupportedDocument(Exception):
+    """Raised when a file cannot be read by any extractor"""
+
+
+def detect_kind(filename: str, content_type: Optional[str] = None) -> Optional[str]:
+    """Pick an extractor from the file extension, then the content type"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in EXTENSION_KINDS:
+        return EXTENSION_KINDS[extension]
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in CONTENT_TYPE_KINDS:
+        return CONTENT_TYPE_KINDS[content_type]
+    if content_type.startswith('text/'):
+        return 'text'
+    return None
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str):
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(name)
+    except Exception:
+        # tiktoken missing, or its encoding file could not be fetched
+        return None
+
+
+def count_tokens(text: str, encoding_name: str = 'cl100k_base') -> int:
+    """Count tokens with tiktoken, or estimate them when it is unavailable"""
+    if not text:
+        return 0
+    encoding = _encoding(encoding_name)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _split_long(text: str, max_tokens: int, encoding_name: str) -> List[Tuple[str, int]]:
+    encoding = _encoding(encoding_name)
+    if encoding is None:
+        step = max_tokens * 4
+        return [(text[i:i + step], count_tokens(text[i:i + step], encoding_name))
+                for i in range(0, len(text), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [(encoding.decode(tokens[i:i + max_tokens]), len(tokens[i:i + max_tokens]))
+            for i in range(0, len(tokens), max_tokens)]
+
+
+def split_chunks(text: str, max_tokens: int, encoding_name: str = 'cl100k_base') -> List[Tuple[str, int]]:
+    """Split text on paragraph boundaries into (chunk, token_count) pairs"""
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append(('\n\n'.join(current), current_tokens))
+        current, current_tokens = [], 0
+
+    for paragraph in text.split('\n\n'):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        tokens = count_tokens(paragraph, encoding_name)
+        if tokens > max_tokens:
+            flush()
+            chunks.extend(_split_long(paragraph, max_tokens, encoding_name))
+            continue
+        if current_tokens + tokens > max_tokens:
+            flush()
+        current.append(paragraph)
+        current_tokens += tokens
+    flush()
+    return chunks
+
+
+def _parsed(parse):
+    """Cache a whole-file parse by path, modification time and size
+
+    HTML and DOCX have to be parsed whole to find any page, so without this a
+    worker would parse a file again for its page count and for every window.
+    """
+    cached = lru_cache(maxsize=PARSED_CACHE_SIZE)(lambda path, mtime, size: parse(path))
+
+    @wraps(parse)
+    def wrapper(path: str):
+        stat = os.stat(path)
+        return cached(path, stat.st_mtime_ns, stat.st_size)
+    return wrapper
+
+
+# Plain text
+
+def _text_page_count(path: str) -> int:
+    size = os.path.getsize(path)
+    return (size + TEXT_PAGE_BYTES - 1) // TEXT_PAGE_BYTES
+
+
+def _read_text_page(handle, page: int) -> str:
+    # Pages are byte slices widened to the next newline on both ends, so
+    # every line belongs to exactly one page however the file is windowed.
+    start, end = page * TEXT_PAGE_BYTES, (page + 1) * TEXT_PAGE_BYTES
+    handle.seek(start)
+    if page:
+        handle.seek(start - 1)
+        if handle.read(1) != b'\n':
+            handle.readline()
+    data = bytearray()
+    while handle.tell() < end:
+        line = handle.readline()
+        if not line:
+            break
+        data += line
+    return data.decode('utf-8', errors='replace')
+
+
+def _text_pages(path: str, start: int, stop: int):
+    with open(path, 'rb') as handle:
+        for page in range(start, stop):
+            yield page, _read_text_page(handle, page)
+
+
+# HTML
+
+@_parsed
+def _html_text(path: str) -> str:
+    from bs4 import BeautifulSoup
+
+    with open(path, 'rb') as handle:
+        soup = BeautifulSoup(handle, 'lxml')
+    for tag in soup(['script', 'style', 'noscript']):
+        tag.decompose()
+    lines = (line.strip() for line in soup.get_text('\n').splitlines())
+    return '\n\n'.join(line for line in lines if line)
+
+
+def _html_page_count(path: str) -> int:
+    text = _html_text(path)
+    return (len(text) + HTML_PAGE_CHARS - 1) // HTML_PAGE_CHARS
+
+
+def _html_pages(path: str, start: int, stop: int):
+    text = _html_text(path)
+    for page in range(start, stop):
+        yield page, text[page * HTML_PAGE_CHARS:(page + 1) * HTML_PAGE_CHARS]
+
+
+# PDF
+
+def _pdf_reader(path: str):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedDocument("PDF extraction needs the pypdf package")
+    return PdfReader(path)
+
+
+def _pdf_page_count(path: str) -> int:
+    return len(_pdf_reader(path).pages)
+
+
+def _pdf_pages(path: str, start: int, stop: int):
+    reader = _pdf_reader(path)
+    for page in range(start, min(stop, len(reader.pages))):
+        yield page, reader.pages[page].extract_text() or ''
+
+
+# DOCX
+
+@_parsed
+def _docx_page_texts(path: str) -> List[str]:
+    from lxml import etree
+
+    try:
+        with zipfile.ZipFile(path) as archive:
+            root = etree.fromstring(archive.read('word/document.xml'))
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise UnsupportedDocument(f"Not a valid DOCX file: {e}")
+
+    pages, paragraphs, explicit_breaks = [], [], False
+    for paragraph in root.iter(f'{WORD_NS}p'):
+        for element in paragraph.iter(f'{WORD_NS}br', f'{WORD_NS}lastRenderedPageBreak'):
+            if element.tag.endswith('lastRenderedPageBreak') or element.get(f'{WORD_NS}type') == 'page':
+                explicit_breaks = True
+                if paragraphs:
+                    pages.append(paragraphs)
+                    paragraphs = []
+                break
+        text = ''.join(node.text or '' for node in paragraph.iter(f'{WORD_NS}t'))
+        if text.strip():
+            paragraphs.append(text)
+    if paragraphs:
+        pages.append(paragraphs)
+
+    if not explicit_breaks:
+        flat = [text for page in pages for text in page]
+        pages = [flat[i:i + DOCX_PARAGRAPHS_PER_PAGE] for i in range(0, len(flat), DOCX_PARAGRAPHS_PER_PAGE)]
+    return ['\n\n'.join(page) for page in pages]
+
+
+def _docx_page_count(path: str) -> int:
+    return len(_docx_page_texts(path))
+
+
+def _docx_pages(path: str, start: int, stop: int):
+    texts = _docx_page_texts(path)
+    for page in range(start, min(stop, len(texts))):
+        yield page, texts[page]
+
+
+# XLSX, one page per worksheet
+
+def _xlsx_workbook(path: str):
+    from openpyxl import load_workbook
+
+    return load_workbook(path, read_only=True, data_only=True)
+
+
+def _xlsx_page_count(path: str) -> int:
+    workbook = _xlsx_workbook(path)
+    try:
+        return len(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def _xlsx_pages(path: str, start: int, stop: int):
+    workbook = _xlsx_workbook(path)
+    try:
+        for page, sheet in enumerate(workbook.worksheets):
+            if page < start or page >= stop:
+                continue
+            rows = []
+            for row in sheet.iter_rows(values_only=True):
+                cells = [str(cell) for cell in row if cell is not None]
+                if cells:
+                    rows.append('\t'.join(cells))
+            yield page, f"{sheet.title}\n\n" + '\n'.join(rows)
+    finally:
+        workbook.close()
+
+
+READERS = {
+    'text': (_text_page_count, _text_pages),
+    'html': (_html_page_count, _html_pages),
+    'pdf': (_pdf_page_count, _pdf_pages),
+    'docx': (_docx_page_count, _docx_pages),
+    'xlsx': (_xlsx_page_count, _xlsx_pages),
+}
+
+
+def page_count(path: str, kind: str) -> int:
+    """Number of pages a file is split into"""
+    if kind not in READERS:
+        raise UnsupportedDocument(f"No extractor for '{kind}' files")
+    return READERS[kind][0](path)
+
+
+def extract_window(path: str, kind: str, start: int, stop: int,
+                   max_tokens: int, encoding_name: str) -> List[Tuple[int, List[Tuple[str, int]]]]:
+    """Extract pages [start, stop) as (page, [(chunk, token_count), ...]) pairs"""
+    if kind not in READERS:
+        raise UnsupportedDocument(f"No extractor for '{kind}' files")
+    return [
+        (page, split_chunks(text, max_tokens, encoding_name))
+        for page, text in READERS[kind][1](path, start, stop)
+    ]
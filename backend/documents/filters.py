@@ -0,0 +1,156 @@
+"""
+Structured attribute filters for vector store search
+
+Filters use the OpenAI vector store shape, plus two shortcuts:
+
+    {"type": "eq", "key": "kind", "value": "contract"}       eq, ne, gt, gte, lt, lte
+    {"type": "in", "key": "year", "values": [2023, 2024]}    in, nin
+    {"type": "range", "key": "year", "gte": 2020, "lt": 2025}
+    {"type": "and", "filters": [...]}                        and, or
+
+The same filter is sent upstream (to_openai) and evaluated against
+Document.attributes in the database (to_q), which lets a search that can
+match nothing return without calling upstream at all. Like upstream, ne and
+nin match documents that lack the key.
+"""
+import re
+from typing import Any, Dict
+from django.db.models import Q
+from .models import Document
+
+COMPARISONS = ('eq', 'ne', 'gt', 'gte', 'lt', 'lte')
+SET_OPERATORS = ('in', 'nin')
+COMPOUNDS = ('and', 'or')
+RANGE_BOUNDS = ('gt', 'gte', 'lt', 'lte')
+
+KEY_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+MAX_DEPTH = 5
+MAX_VALUES = 100
+
+# Limits OpenAI applies to vector store file attributes
+MAX_UPSTREAM_ATTRIBUTES = 16
+MAX_UPSTREAM_STRING = 512
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _check_key(key: Any) -> str:
+    # Double underscores would be read as nested lookups by the ORM
+    if not isinstance(key, str) or not KEY_RE.match(key) or '__' in key:
+        raise FilterError(f"Invalid attribute key: {key!r}")
+    return key
+
+
+def _check_value(value: Any) -> Any:
+    if isinstance(value, bool) or isinstance(value, (int, float, str)):
+        return value
+    raise FilterError(f"Attribute values must be strings, numbers or booleans, got {value!r}")
+
+
+def validate_filter(data: Any, depth: int = 0) -> Dict[str, Any]:
+    """Check a filter and return it in normalized form"""
+    if depth > MAX_DEPTH:
+        raise FilterError(f"Filters can be nested at most {MAX_DEPTH} levels deep")
+    if not isinstance(data, dict):
+        raise FilterError("A filter must be an object")
+
+    kind = data.get('type')
+    if kind in COMPARISONS:
+        return {'type': kind, 'key': _check_key(data.get('key')), 'value': _check_value(data.get('value'))}
+
+    if kind in SET_OPERATORS:
+        values = data.get('values')
+        if not isinstance(values, list) or not values or len(values) > MAX_VALUES:
+            raise FilterError(f"'{kind}' needs a list of 1 to {MAX_VALUES} values")
+        return {'type': kind, 'key': _check_key(data.get('key')), 'values': [_check_value(v) for v in values]}
+
+    if kind == 'range':
+        bounds = {bound: _check_value(data[bound]) for bound in RANGE_BOUNDS if bound in data}
+        if not bounds:
+            raise FilterError("'range' needs at least one of gt, gte, lt, lte")
+        return {'type': 'range', 'key': _check_key(data.get('key')), **bounds}
+
+    if kind in COMPOUNDS:
+        filters = data.get('filters')
+        if not isinstance(filters, list) or not filters:
+            raise FilterError(f"'{kind}' needs a non-empty list of filters")
+        return {'type': kind, 'filters': [validate_filter(f, depth + 1) for f in filters]}
+
+    raise FilterError(f"Unknown filter type: {kind!r}")
+
+
+def to_openai(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate a normalized filter to the OpenAI filters parameter"""
+    kind = data['type']
+    if kind in COMPARISONS:
+        return dict(data)
+    if kind in SET_OPERATORS:
+        comparison, compound = ('eq', 'or') if kind == 'in' else ('ne', 'and')
+        parts = [{'type': comparison, 'key': data['key'], 'value': v} for v in data['values']]
+        return parts[0] if len(parts) == 1 else {'type': compound, 'filters': parts}
+    if kind == 'range':
+        parts = [{'type': bound, 'key': data['key'], 'value': data[bound]}
+                 for bound in RANGE_BOUNDS if bound in data]
+        return parts[0] if len(parts) == 1 else {'type': 'and', 'filters': parts}
+    return {'type': kind, 'filters': [to_openai(f) for f in data['filters']]}
+
+
+def to_q(data: Dict[str, Any]) -> Q:
+    """Translate a normalized filter to a Q object over Document.attributes"""
+    kind = data['type']
+    if kind in COMPOUNDS:
+        parts = [to_q(f) for f in data['filters']]
+        combined = parts[0]
+        for part in parts[1:]:
+            combined = combined & part if kind == 'and' else combined | part
+        return combined
+
+    lookup = f"attributes__{data['key']}"
+    if kind == 'eq':
+        return Q(**{lookup: data['value']})
+    # A missing key compares as NULL, which a negation alone would not match
+    missing = ~Q(attributes__has_key=data['key'])
+    if kind == 'ne':
+        return ~Q(**{lookup: data['value']}) | missing
+    if kind in ('gt', 'gte', 'lt', 'lte'):
+        return Q(**{f'{lookup}__{kind}': data['value']})
+    if kind == 'in':
+        return Q(**{f'{lookup}__in': data['values']})
+    if kind == 'nin':
+        return ~Q(**{f'{lookup}__in': data['values']}) | missing
+    q = Q()
+    for bound in RANGE_BOUNDS:
+        if bound in data:
+            q &= Q(**{f'{lookup}__{bound}': data[bound]})
+    return q
+
+
+def matching_documents(vector_store_id, data: Dict[str, Any]):
+    """Searchable documents of a vector store (by primary key) that satisfy a filter"""
+    return Document.objects.filter(vector_store_id=vector_store_id, status='completed').filter(to_q(data))
+
+
+def empty_search_page(query: str) -> Dict[str, Any]:
+    """Search response for a filter that no document satisfies"""
+    return {
+        'object': 'vector_store.search_results.page',
+        'search_query': query,
+        'data': [],
+        'has_more': False,
+        'next_page': None,
+    }
+
+
+def upstream_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """Subset of Document.attributes that OpenAI accepts on a vector store file"""
+    result = {}
+    for key, value in (attributes or {}).items():
+        if len(result) >= MAX_UPSTREAM_ATTRIBUTES:
+            break
+        if isinstance(value, str):
+            result[key[:64]] = value[:MAX_UPSTREAM_STRING]
+        elif isinstance(value, (bool, int, float)):
+            result[key[:64]] = value
+    return result
@@ -0,0 +1,211 @@
+"""
+Deleting upstream files and vector stores that nothing refers to anymore
+
+Deleting a store or document only removes rows; its upstream objects are
+queued as RemoteCleanup tasks and deleted afterwards, in a background thread
+of the web process or by the gc_remote command. That command also lists the
+upstream account page by page and queues whatever the database doesn't know
+about, e.g. files left behind by a crash between upload and save.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .backends import get_service
+from .models import Document, RemoteCleanup, VectorStore
+from .uploads import expire_sessions
+
+# Tasks claimed per round of run_cleanups
+BATCH_SIZE = 100
+MAX_RETRY_DELAY = 24 * 3600
+
+# Upstream id columns each kind of object is referenced by
+REFERENCES = {
+    'file': (Document, ('openai_file_id', 'pending_openai_file_id', 'retired_openai_file_id')),
+    'vector_store': (VectorStore, ('openai_vector_store_id',)),
+}
+
+
+class RateLimiter:
+    """Token bucket shared by threads: `rate` calls per second, at most `burst` at once"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+
+def has_remote(backend: Optional[str] = None) -> bool:
+    """Whether a backend keeps objects upstream, without building it"""
+    backend = backend or settings.VECTOR_STORE_BACKEND
+    path = settings.VECTOR_STORE_BACKENDS.get(backend)
+    return bool(path) and getattr(import_string(path), 'has_remote', False)
+
+
+def enqueue(kind: str, remote_ids: Iterable[str], backend: Optional[str] = None) -> int:
+    """Queue upstream objects for deletion; ids already queued are left as they are"""
+    backend = backend or settings.VECTOR_STORE_BACKEND
+    remote_ids = list(dict.fromkeys(remote_id for remote_id in remote_ids if remote_id))
+    if not remote_ids or not has_remote(backend):
+        return 0
+    RemoteCleanup.objects.bulk_create(
+        [RemoteCleanup(backend=backend, kind=kind, remote_id=remote_id) for remote_id in remote_ids],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return len(remote_ids)
+
+
+def queue_cleanup(file_ids: Iterable[str] = (), vector_store_ids: Iterable[str] = ()) -> None:
+    """Delete upstream objects once the current transaction commits"""
+    file_ids = [file_id for file_id in file_ids if file_id]
+    vector_store_ids = [store_id for store_id in vector_store_ids if store_id]
+    if not file_ids and not vector_store_ids:
+        return
+    backend = settings.VECTOR_STORE_BACKEND
+
+    def commit():
+        if enqueue('file', file_ids, backend) + enqueue('vector_store', vector_store_ids, backend):
+            schedule()
+
+    transaction.on_commit(commit)
+
+
+def due_cleanups(now=None):
+    """Pending tasks whose time has come, and claimed ones whose worker went away"""
+    now = now or timezone.now()
+    stale = now - timedelta(seconds=settings.REMOTE_GC_CLAIM_TIMEOUT)
+    return RemoteCleanup.objects.filter(
+        Q(status='pending', next_attempt_at__lte=now) | Q(status='running', updated_at__lt=stale)
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    return min(settings.REMOTE_GC_RETRY_DELAY * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+
+
+def run_cleanup(pk, limiter: RateLimiter) -> Optional[str]:
+    """Claim and run one task; returns its outcome, or None if someone else has it"""
+    try:
+        now = timezone.now()
+        claimed = due_cleanups(now).filter(pk=pk).update(
+            status='running', attempts=F('attempts') + 1, updated_at=now
+        )
+        if not claimed:
+            return None
+        task = RemoteCleanup.objects.get(pk=pk)
+        try:
+            service = get_service(task.backend)
+            limiter.acquire()
+            if task.kind == 'vector_store':
+                found = service.delete_remote_vector_store(task.remote_id)
+            else:
+                found = service.delete_remote_file(task.remote_id)
+        except Exception as e:
+            print(f"Failed to delete {task.kind} {task.remote_id} (attempt {task.attempts}): {e}")
+            failed = task.attempts >= settings.REMOTE_GC_MAX_ATTEMPTS
+            now = timezone.now()
+            RemoteCleanup.objects.filter(pk=pk).update(
+                status='failed' if failed else 'pending',
+                last_error=str(e),
+                next_attempt_at=now + timedelta(seconds=retry_delay(task.attempts)),
+                updated_at=now,
+            )
+            return 'failed' if failed else 'retrying'
+        RemoteCleanup.objects.filter(pk=pk).delete()
+        return 'deleted' if found else 'missing'
+    finally:
+        connection.close()
+
+
+def run_cleanups(workers: Optional[int] = None, rate: Optional[float] = None) -> Dict[str, int]:
+    """Run every due task, `workers` deletes at a time under a shared rate limit
+
+    Abandoned resumable uploads are expired on the way, since their
+    reserved files are just as much leftovers.
+    """
+    workers = workers or settings.REMOTE_GC_WORKERS
+    limiter = RateLimiter(settings.REMOTE_GC_RATE if rate is None else rate, burst=workers)
+    counts = {'deleted': 0, 'missing': 0, 'retrying': 0, 'failed': 0, 'expired_uploads': expire_sessions()}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='remote-gc') as pool:
+        while True:
+            # Tasks that fail get a later next_attempt_at, so this runs dry
+            batch = list(due_cleanups().order_by('next_attempt_at').values_list('pk', flat=True)[:BATCH_SIZE])
+            if not batch:
+                break
+            for outcome in pool.map(lambda pk: run_cleanup(pk, limiter), batch):
+                if outcome:
+                    counts[outcome] += 1
+    return counts
+
+
+def find_orphans(kind: str, min_age: Optional[int] = None, service=None) -> Iterator[List[str]]:
+    """Yield, page by page, upstream ids of one kind that no row refers to"""
+    service = service or get_service()
+    model, fields = REFERENCES[kind]
+    cutoff = time.time() - (settings.REMOTE_GC_MIN_AGE if min_age is None else min_age)
+    pages = service.list_remote_files() if kind == 'file' else service.list_remote_vector_stores()
+    for page in pages:
+        remote_ids = [item['id'] for item in page if (item.get('created_at') or 0) <= cutoff]
+        if not remote_ids:
+            continue
+        known = set()
+        for field in fields:
+            known.update(model.objects.filter(**{f'{field}__in': remote_ids}).values_list(field, flat=True))
+        orphans = [remote_id for remote_id in remote_ids if remote_id not in known]
+        if orphans:
+            yield orphans
+
+
+_executor = None
+_scheduled = False
+_executor_lock = threading.Lock()
+
+
+def schedule() -> None:
+    """Drain the queue in this process's background thread, unless a drain is already waiting"""
+    global _executor, _scheduled
+    if not settings.REMOTE_GC_BACKGROUND:
+        return
+    with _executor_lock:
+        if _scheduled:
+            return
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='remote-gc-drain')
+        _scheduled = True
+        _executor.submit(_drain)
+
+
+def _drain() -> None:
+    global _scheduled
+    with _executor_lock:
+        # Anything queued from here on needs a drain of its own
+        _scheduled = False
+    try:
+        run_cleanups()
+    except Exception as e:
+        print(f"Remote cleanup failed: {e}")
+    finally:
+        connection.close()
@@ -0,0 +1,113 @@
+"""
+Attach local Document data to search hits
+
+Search responses carry only upstream file ids. Every hit gets the matching
+Document (id, title, content_type, attributes, download URL) from a single
+bulk lookup on openai_file_id, with a per-process file id map in front of it.
+Hits on a file that is being swapped in or out for a replaced document
+(see documents.reingest) are dropped, so the document shows up only once.
+
+Like the store metadata in documents.stores, map entries carry the version
+stamp their file id had in the shared Django cache when they were loaded:
+saving or deleting a document bumps the stamps of its file ids, and an entry
+whose stamp moved, or that is older than DOCUMENT_SUMMARY_TTL, is reloaded.
+"""
+import time
+import uuid
+from typing import Any, Dict, Iterable, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.urls import reverse
+from .cache import LRUCache, MISSING
+from .models import Document
+
+SUMMARY_FIELDS = ('id', 'title', 'content_type', 'attributes', 'status', 'openai_file_id')
+VERSION_KEY = 'documents:file-version:{}'
+
+# file_id -> (document summary or None for file ids with no local document, version, loaded at)
+document_cache = LRUCache(settings.DOCUMENT_SUMMARY_CACHE_SIZE)
+# Summary of pending or retired file ids; short-lived, so never cached
+STALE = object()
+
+
+def summarize(document: Document) -> Dict[str, Any]:
+    return {
+        'id': str(document.id),
+        'title': document.title,
+        'content_type': document.content_type,
+        'attributes': document.attributes,
+        'status': document.status,
+        'download_url': reverse('document-download', args=[document.id]),
+    }
+
+
+def _versions(file_ids) -> Dict[str, str]:
+    keys = {VERSION_KEY.format(file_id): file_id for file_id in file_ids}
+    return {keys[key]: version for key, version in cache.get_many(keys).items()}
+
+
+def document_summaries(file_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Map upstream file ids to document summaries (or STALE), usually with one query"""
+    file_ids = {file_id for file_id in file_ids if file_id}
+    if not file_ids:
+        return {}
+    # Stamps first: a change made meanwhile leaves the new entries already stale
+    versions = _versions(file_ids)
+    now = time.monotonic()
+    summaries = {
+        file_id: summary
+        for file_id, (summary, version, loaded_at) in document_cache.get_many(file_ids).items()
+        if now - loaded_at <= settings.DOCUMENT_SUMMARY_TTL and versions.get(file_id) == version
+    }
+    missing = file_ids - summaries.keys()
+    if missing:
+        # The map outlives the request, so it's filled from the primary
+        # rather than from a replica that may lag behind it
+        documents = Document.objects.using(DEFAULT_DB_ALIAS)
+        found = documents.only(*SUMMARY_FIELDS).in_bulk(missing, field_name='openai_file_id')
+        unknown = missing - found.keys()
+        stale = set()
+        if unknown:
+            swapping = documents.filter(
+                Q(pending_openai_file_id__in=unknown) | Q(retired_openai_file_id__in=unknown)
+            ).values_list('pending_openai_file_id', 'retired_openai_file_id')
+            stale = {file_id for pair in swapping for file_id in pair} & unknown
+        for file_id in missing:
+            if file_id in stale:
+                summaries[file_id] = STALE
+                continue
+            summary = summarize(found[file_id]) if file_id in found else None
+            document_cache.set(file_id, (summary, versions.get(file_id), now))
+            summaries[file_id] = summary
+    return summaries
+
+
+def forget_document(*file_ids: Optional[str], publish: bool = True) -> None:
+    """Drop file ids here and, with `publish`, make other processes reload them"""
+    file_ids = [file_id for file_id in file_ids if file_id]
+    document_cache.delete(*file_ids)
+    if publish and file_ids:
+        version = uuid.uuid4().hex
+        cache.set_many({VERSION_KEY.format(file_id): version for file_id in file_ids}, None)
+
+
+def hydrate_search_results(results: Dict[str, Any], request=None) -> Dict[str, Any]:
+    """Return a copy of a search results page with a 'document' on every hit"""
+    hits = (results or {}).get('data')
+    if not isinstance(hits, list):
+        return results
+
+    summaries = document_summaries(hit.get('file_id') for hit in hits)
+    hydrated = []
+    for hit in hits:
+        summary = summaries.get(hit.get('file_id'))
+        if summary is STALE:
+            continue
+        if summary is not None:
+            summary = dict(summary)
+            if request is not None:
+                summary['download_url'] = request.build_absolute_uri(summary['download_url'])
+        hydrated.append({**hit, 'document': summary})
+    return {**results, 'data': hydrated}
@@ -0,0 +1,357 @@
+"""
+Ingestion planner for bulk loads
+
+Each document is sized before it goes upstream: its bytes, and its tokens
+as counted by local extraction (tiktoken), else estimated from the size of
+text files. Files over OpenAI's per-file limits fail right away instead of
+after an upload; the token limit is only applied to counted tokens, since
+a guess from the size of a binary file (PDF, DOCX) says little. The rest
+are packed, in arrival order, into file batches that stay under
+INGEST_BATCH_MAX_FILES, _BYTES and _TOKENS, and each batch is added to the
+vector store with a single call once its files are uploaded.
+
+Two concurrency limits adapt as the load runs (AdaptiveLimit): how many
+files are uploaded at once follows the bytes per second uploads achieve,
+and how many batches OpenAI processes at once follows the tokens per
+second it indexes. A limit grows by one while throughput keeps improving,
+shrinks by one when it falls, and halves on errors.
+
+store_progress() gives the time left for a store's documents that are
+still on their way, from the rate its documents were completed lately.
+"""
+import json
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, Count, F, IntegerField, Min, Sum, When
+from django.utils import timezone
+from . import extractors
+from .backends import get_service
+from .extraction import extract_documents
+from .filters import upstream_attributes
+from .gc import queue_cleanup
+from .models import Document, VectorStore
+
+# Relative change in throughput that counts as better or worse
+THROUGHPUT_TOLERANCE = 0.05
+
+
+# Kinds whose bytes are mostly their text, so bytes / BYTES_PER_TOKEN is a fair guess
+TEXT_KINDS = ('text', 'html')
+
+
+class Size(NamedTuple):
+    bytes: int
+    tokens: int
+    # Whether tokens were counted by extraction rather than estimated
+    counted: bool
+
+
+class TooLarge(Exception):
+    """A file that upstream would refuse"""
+
+
+def estimate(document: Document) -> Size:
+    """Bytes and tokens of a document, counted if extraction has run, else estimated
+
+    Binary files that weren't extracted count no tokens.
+    """
+    size = document.file_size or 0
+    if document.extraction_status == 'completed' and document.token_count is not None:
+        return Size(size, document.token_count, True)
+    if extractors.detect_kind(document.file.name, document.content_type) in TEXT_KINDS:
+        return Size(size, size // extractors.BYTES_PER_TOKEN, False)
+    return Size(size, 0, False)
+
+
+def check_limits(size: Size) -> None:
+    if size.bytes > settings.INGEST_MAX_FILE_BYTES:
+        raise TooLarge(f"File is larger than the {settings.INGEST_MAX_FILE_BYTES} byte upload limit")
+    if size.counted and size.tokens > settings.INGEST_MAX_FILE_TOKENS:
+        raise TooLarge(f"File has {size.tokens} tokens, over the {settings.INGEST_MAX_FILE_TOKENS} token limit")
+
+
+class AdaptiveLimit:
+    """A concurrency limit between minimum and maximum, steered by throughput"""
+
+    def __init__(self, minimum: int, maximum: int):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = self.minimum
+        self.previous = None
+
+    def observe(self, throughput: float, failed: bool = False) -> None:
+        if failed:
+            self.limit = max(self.minimum, self.limit // 2)
+        elif self.previous is None or throughput > self.previous * (1 + THROUGHPUT_TOLERANCE):
+            self.limit = min(self.maximum, self.limit + 1)
+        elif throughput < self.previous * (1 - THROUGHPUT_TOLERANCE):
+            self.limit = max(self.minimum, self.limit - 1)
+        self.previous = throughput
+
+
+class _Meter:
+    """Work done since the last observation"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.started = time.monotonic()
+        self.amount = 0
+        self.count = 0
+        self.failed = False
+
+    def rate(self) -> float:
+        return self.amount / max(time.monotonic() - self.started, 1e-6)
+
+
+class _Batch:
+    def __init__(self):
+        self.documents: List[Document] = []
+        self.bytes = 0
+        self.tokens = 0
+        self.remote_ids: List[str] = []
+        self.attached_at = None
+
+    def fits(self, size: Size) -> bool:
+        return (
+            len(self.documents) < settings.INGEST_BATCH_MAX_FILES
+            and self.bytes + size.bytes <= settings.INGEST_BATCH_MAX_BYTES
+            and self.tokens + size.tokens <= settings.INGEST_BATCH_MAX_TOKENS
+        )
+
+    def add(self, document: Document, size: Size) -> None:
+        self.documents.append(document)
+        self.bytes += size.bytes
+        self.tokens += size.tokens
+
+
+class IngestionPlanner:
+    """Upload documents and add them to a vector store in adaptive file batches
+
+    Driven from one thread: submit() document ids, then collect (document
+    id, status, error) outcomes with results() until nothing is pending.
+    Documents still processing upstream after INGEST_BATCH_TIMEOUT are
+    reported as 'processing' and left to the status endpoints.
+    """
+
+    def __init__(self, vector_store: VectorStore, service=None, max_uploads: Optional[int] = None):
+        self.vector_store = vector_store
+        self.service = service or get_service()
+        low, high = settings.INGEST_UPLOAD_CONCURRENCY
+        self.uploads = AdaptiveLimit(low, max_uploads or high)
+        self.processing = AdaptiveLimit(*settings.INGEST_BATCH_CONCURRENCY)
+        self.pool = ThreadPoolExecutor(max_workers=self.uploads.maximum, thread_name_prefix='ingest-upload')
+        self.waiting = deque()
+        self.uploading = {}
+        self.open = _Batch()
+        self.ready = deque()
+        self.attached: List[_Batch] = []
+        self.outcomes: List[Tuple[Any, Optional[str], Optional[str]]] = []
+        self.upload_meter = _Meter()
+        self.index_meter = _Meter()
+        self.last_poll = 0.0
+
+    @property
+    def pending(self) -> int:
+        batches = [self.open, *self.ready, *self.attached]
+        return len(self.waiting) + len(self.uploading) + sum(len(batch.documents) for batch in batches)
+
+    def submit(self, document_id) -> None:
+        self.waiting.append(document_id)
+        self._start_uploads()
+
+    def results(self, block: bool = False) -> List[Tuple[Any, Optional[str], Optional[str]]]:
+        """Outcomes since the last call; with block, waits until there is one or nothing is pending"""
+        while True:
+            self._step(timeout=settings.INGEST_POLL_INTERVAL if block else 0)
+            if self.outcomes or not block or not self.pending:
+                outcomes, self.outcomes = self.outcomes, []
+                return outcomes
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+
+    def _step(self, timeout: float) -> None:
+        self._start_uploads()
+        if self.uploading:
+            self._collect_uploads(timeout if not self.attached else min(timeout, 1))
+        elif self.attached and timeout:
+            time.sleep(max(0, min(timeout, self.last_poll + settings.INGEST_POLL_INTERVAL - time.monotonic())))
+        if self.open.documents and not self.waiting and not self.uploading:
+            # Nothing else is on its way: upstream shouldn't wait for a fuller batch
+            self.ready.append(self.open)
+            self.open = _Batch()
+        self._attach_ready()
+        self._poll_attached()
+
+    def _start_uploads(self) -> None:
+        if not self.uploading and not self.upload_meter.count:
+            self.upload_meter.reset()
+        # A full batch waiting for a processing slot holds further uploads back
+        while self.waiting and len(self.uploading) < self.uploads.limit and not self.ready:
+            document_id = self.waiting.popleft()
+            self.uploading[self.pool.submit(self._upload, document_id)] = document_id
+
+    def _upload(self, document_id) -> Tuple[Document, Optional[Size]]:
+        """Pool task: extract, size and upload one document"""
+        try:
+            document = Document.objects.get(pk=document_id)
+            if document.status == 'completed':
+                return document, None
+            try:
+                extract_documents([document])
+                size = estimate(document)
+                check_limits(size)
+                previous_file_id = document.openai_file_id
+                document.openai_file_id = self.service.upload_replacement(document)
+                document.status = 'processing'
+                document.save()
+                # Left behind by an earlier, interrupted attempt
+                queue_cleanup(file_ids=[previous_file_id])
+                return document, size
+            except Exception as e:
+                document.status = 'failed'
+                document.error_message = str(e)
+                document.save()
+                raise
+        finally:
+            connection.close()
+
+    def _collect_uploads(self, timeout: float) -> None:
+        done, _ = wait(self.uploading, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            document_id = self.uploading.pop(future)
+            meter = self.upload_meter
+            meter.count += 1
+            try:
+                document, size = future.result()
+            except Exception as e:
+                meter.failed = meter.failed or not isinstance(e, TooLarge)
+                self.outcomes.append((document_id, None, str(e)))
+                continue
+            if size is None:
+                self.outcomes.append((document_id, document.status, None))
+                continue
+            meter.amount += size.bytes
+            if not self.open.fits(size) and self.open.documents:
+                self.ready.append(self.open)
+                self.open = _Batch()
+            self.open.add(document, size)
+        if self.upload_meter.count >= self.uploads.limit:
+            self.uploads.observe(self.upload_meter.rate(), self.upload_meter.failed)
+            self.upload_meter.reset()
+
+    def _attach_ready(self) -> None:
+        store_id = self.vector_store.openai_vector_store_id
+        while self.ready and len(self.attached) < self.processing.limit:
+            batch = self.ready.popleft()
+            if not self.attached:
+                self.index_meter.reset()
+            groups = {}
+            for document in batch.documents:
+                attributes = upstream_attributes(document.attributes)
+                groups.setdefault(json.dumps(attributes, sort_keys=True), (attributes, []))[1].append(document)
+            try:
+                for attributes, documents in groups.values():
+                    batch.remote_ids.append(self.service.attach_files(
+                        store_id, [document.openai_file_id for document in documents], attributes
+                    ))
+            except Exception as e:
+                print(f"Failed to add a batch of {len(batch.documents)} files to vector store {store_id}: {e}")
+                self.processing.observe(0, failed=True)
+                self._settle(batch, 'failed', {}, default_error=str(e))
+                continue
+            for document in batch.documents:
+                # Files added in a batch are known to the store by their file id
+                document.openai_vector_store_file_id = document.openai_file_id
+                document.save()
+            batch.attached_at = time.monotonic()
+            self.attached.append(batch)
+
+    def _poll_attached(self) -> None:
+        now = time.monotonic()
+        if not self.attached or now - self.last_poll < settings.INGEST_POLL_INTERVAL:
+            return
+        self.last_poll = now
+        store_id = self.vector_store.openai_vector_store_id
+        for batch in list(self.attached):
+            try:
+                states = [self.service.file_batch_state(store_id, remote_id) for remote_id in batch.remote_ids]
+            except Exception as e:
+                print(f"Failed to check file batches {', '.join(batch.remote_ids)}: {e}")
+                continue
+            statuses = {status for status, _ in states}
+            if 'in_progress' in statuses:
+                if now - batch.attached_at > settings.INGEST_BATCH_TIMEOUT:
+                    self.attached.remove(batch)
+                    self._settle(batch, 'in_progress', {})
+                continue
+            self.attached.remove(batch)
+            errors = {file_id: error for _, failed in states for file_id, error in failed.items()}
+            status = 'completed' if statuses == {'completed'} else 'failed'
+            self._settle(batch, status, errors)
+            self.index_meter.amount += batch.tokens
+            self.processing.observe(self.index_meter.rate(), failed=status != 'completed')
+            self.index_meter.reset()
+
+    def _settle(self, batch: _Batch, status: str, errors: Dict[str, str], default_error: Optional[str] = None) -> None:
+        """Record how a batch ended on its documents
+
+        Files of a batch that failed or was cancelled upstream, other than
+        the ones reported failed, may still have been indexed; they stay
+        'processing' for the status endpoints to settle.
+        """
+        now = timezone.now()
+        for document in batch.documents:
+            error = errors.get(document.openai_file_id) or default_error
+            if error:
+                document.status = 'failed'
+                document.error_message = error
+                document.save()
+            elif status == 'completed':
+                document.status = 'completed'
+                document.processed_date = now
+                document.save()
+            self.outcomes.append((document.pk, document.status, error))
+        if default_error:
+            queue_cleanup(file_ids=[document.openai_file_id for document in batch.documents])
+
+
+def store_progress(vector_store_id, now=None) -> Dict[str, Any]:
+    """Documents and tokens of a store still on their way, and when they should be done
+
+    The rate is the tokens of the documents completed in the last
+    INGEST_ETA_WINDOW seconds over the time since the first of them was
+    uploaded; eta_seconds is None until something has completed.
+    """
+    now = now or timezone.now()
+    tokens = Case(
+        When(extraction_status='completed', token_count__isnull=False, then=F('token_count')),
+        default=F('file_size') / extractors.BYTES_PER_TOKEN,
+        output_field=IntegerField(),
+    )
+    documents = Document.objects.filter(vector_store_id=vector_store_id).order_by()
+    remaining = documents.filter(status__in=('uploading', 'processing')).aggregate(
+        documents=Count('pk'), tokens=Sum(tokens)
+    )
+    recent = documents.filter(
+        status='completed', processed_date__gte=now - timedelta(seconds=settings.INGEST_ETA_WINDOW)
+    ).aggregate(tokens=Sum(tokens), since=Min('upload_date'))
+
+    rate = None
+    if recent['tokens']:
+        since = max(recent['since'], now - timedelta(seconds=settings.INGEST_ETA_WINDOW))
+        rate = recent['tokens'] / max((now - since).total_seconds(), 1)
+    left = remaining['tokens'] or 0
+    return {
+        'documents_remaining': remaining['documents'],
+        'tokens_remaining': left,
+        'tokens_per_second': round(rate, 1) if rate else None,
+        'eta_seconds': round(left / rate) if rate else (0 if not remaining['documents'] else None),
+    }
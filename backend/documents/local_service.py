@@ -0,0 +1,196 @@
+"""
+Vector store backends that never leave the process
+
+LocalVectorStoreService keeps everything in the database and answers
+searches locally. FakeVectorStoreService does the same bookkeeping but
+always returns empty results, which makes it handy for tests and demos.
+"""
+import time
+import uuid
+from typing import Optional, Dict, Any
+from django.db.models import Q
+from django.utils import timezone
+from .backends import VectorStoreBackend
+from .filters import matching_documents
+from .models import VectorStore, Document, DocumentChunk, Query
+from .stores import StoreMetadata, get_store
+
+
+class LocalVectorStoreService(VectorStoreBackend):
+    """Vector store backend backed only by the local database"""
+
+    id_prefix = 'local'
+
+    def _new_id(self, kind: str) -> str:
+        return f"{self.id_prefix}_{kind}_{uuid.uuid4().hex}"
+
+    def _search_page(self, query: str, data: list) -> Dict[str, Any]:
+        """Build a response shaped like the OpenAI search results page"""
+        return {
+            'object': 'vector_store.search_results.page',
+            'search_query': query,
+            'data': data,
+            'has_more': False,
+            'next_page': None,
+        }
+
+    def create_vector_store(self, name: str, metadata: Optional[Dict] = None) -> VectorStore:
+        """Create a vector store that only exists in the database"""
+        return VectorStore.objects.create(
+            openai_vector_store_id=self._new_id('vs'),
+            name=name,
+            status='completed',
+            metadata=metadata or {}
+        )
+
+    def delete_vector_store(self, vector_store: VectorStore) -> bool:
+        """Delete a vector store from the database"""
+        vector_store.delete()
+        return True
+
+    def find_matches(self, vector_store: StoreMetadata, query: str, max_results: int,
+                     filters: Optional[Dict[str, Any]] = None) -> list:
+        """Return search hits for the query, best first
+
+        Matches extracted chunks term by term and keeps the best chunk of
+        each document; documents without chunks are matched on their title.
+        """
+        terms = [term.lower() for term in query.split() if term]
+        if not terms:
+            return []
+
+        searchable = Document.objects.filter(vector_store_id=vector_store.id, status='completed')
+        if filters:
+            searchable = matching_documents(vector_store.id, filters)
+
+        term_filter = Q()
+        for term in terms:
+            term_filter |= Q(text__icontains=term)
+        chunks = DocumentChunk.objects.filter(
+            term_filter,
+            document__in=searchable,
+        ).select_related('document')
+
+        best = {}
+        for chunk in chunks.iterator():
+            text = chunk.text.lower()
+            score = sum(1 for term in terms if term in text) / len(terms)
+            if chunk.document_id not in best or score > best[chunk.document_id][0]:
+                best[chunk.document_id] = (score, chunk.document, chunk.text)
+
+        title_filter = Q()
+        for term in terms:
+            title_filter |= Q(title__icontains=term)
+        documents = searchable.filter(title_filter).exclude(pk__in=list(best))
+        for document in documents.iterator():
+            title = document.title.lower()
+            score = sum(1 for term in terms if term in title) / len(terms)
+            best[document.pk] = (score, document, document.title)
+
+        hits = [
+            {
+                'file_id': document.openai_file_id,
+                'filename': document.file.name,
+                'score': score,
+                'attributes': document.attributes,
+                'content': [{'type': 'text', 'text': text}],
+            }
+            for score, document, text in best.values()
+        ]
+        hits.sort(key=lambda hit: hit['score'], reverse=True)
+        return hits[:max_results]
+
+    def search_vector_store(self, vector_store_id: str, query: str, max_results: int = 10,
+                            filters: Optional[Dict[str, Any]] = None, record: bool = True) -> Dict[str, Any]:
+        """Search the documents of a vector store locally"""
+        vector_store = get_store(openai_id=vector_store_id)
+        if vector_store is None:
+            raise Exception("Vector store not found in database")
+
+        started = time.perf_counter()
+        search_results = self._search_page(query, self.find_matches(vector_store, query, max_results, filters))
+        if not record:
+            return {'query_id': None, 'results': search_results}
+
+        query_obj = Query.objects.create(
+            vector_store_id=vector_store.id,
+            query_text=query,
+            response=search_results,
+            max_results=max_results,
+            latency_ms=(time.perf_counter() - started) * 1000
+        )
+
+        return {
+            'query_id': str(query_obj.id),
+            'results': search_results
+        }
+
+    def get_vector_store_status(self, vector_store: VectorStore) -> Dict[str, Any]:
+        """Report vector store status from local document counts"""
+        counts = {state: 0 for state, _ in Document.STATUS_CHOICES}
+        for row in vector_store.documents.values('status').order_by():
+            counts[row['status']] = counts.get(row['status'], 0) + 1
+
+        return {
+            'id': vector_store.openai_vector_store_id,
+            'object': 'vector_store',
+            'name': vector_store.name,
+            'status': vector_store.status,
+            'file_counts': {
+                'in_progress': counts['uploading'] + counts['processing'],
+                'completed': counts['completed'],
+                'failed': counts['failed'],
+                'cancelled': 0,
+                'total': sum(counts.values()),
+            },
+        }
+
+    def get_file_status(self, document: Document) -> Dict[str, Any]:
+        """Report a document's status as a vector store file"""
+        if not document.openai_vector_store_file_id:
+            raise ValueError("Document must have a vector store file ID")
+
+        status_mapping = {
+            'uploading': 'in_progress',
+            'processing': 'in_progress',
+            'completed': 'completed',
+            'failed': 'failed',
+        }
+        return {
+            'id': document.openai_vector_store_file_id,
+            'object': 'vector_store.file',
+            'vector_store_id': document.vector_store.openai_vector_store_id,
+            'status': status_mapping[document.status],
+            'last_error': document.error_message,
+        }
+
+    def ingest_document(self, document: Document, vector_store: VectorStore) -> Document:
+        """Mark a document as indexed without uploading it anywhere"""
+        file_id = self._new_id('file')
+        document.openai_file_id = file_id
+        document.openai_vector_store_file_id = file_id
+        document.status = 'completed'
+        document.processed_date = timezone.now()
+        document.save()
+        return document
+
+    def upload_replacement(self, document: Document) -> str:
+        """Local files are read in place; a replacement only needs a new id"""
+        return self._new_id('file')
+
+    def attach_file(self, vector_store_id: str, file_id: str,
+                    attributes: Optional[Dict[str, Any]] = None) -> str:
+        return file_id
+
+    def vector_store_file_state(self, vector_store_id: str, vector_store_file_id: str):
+        return 'completed', None
+
+
+class FakeVectorStoreService(LocalVectorStoreService):
+    """Local backend whose searches always come back empty"""
+
+    id_prefix = 'fake'
+
+    def find_matches(self, vector_store: StoreMetadata, query: str, max_results: int,
+                     filters: Optional[Dict[str, Any]] = None) -> list:
+        return []
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from documents.rollups import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dashboard rollups from stored queries and documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vector-store', action='append', help='Only this vector store (local id); repeatable')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read from the database at once')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding rollups...')
+        counts = backfill(options['vector_store'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {counts['rollups']} store rollups, {counts['query_texts']} query text rollups"
+        ))
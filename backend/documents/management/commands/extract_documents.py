@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from documents.extraction import extract_documents
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Extract the text of uploaded documents into local chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vector-store', help='Only documents of this vector store (local id)')
+        parser.add_argument('--force', action='store_true', help='Re-extract documents that are already done')
+        parser.add_argument('--batch-size', type=int, default=200, help='Documents handed to the worker pool at once')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.order_by('upload_date')
+        if options['vector_store']:
+            documents = documents.filter(vector_store_id=options['vector_store'])
+
+        if options['force']:
+            documents.update(
+                extraction_status='pending', extracted_pages=0, page_count=None, token_count=None,
+                updated_at=timezone.now(),
+            )
+        else:
+            documents = documents.exclude(extraction_status__in=['completed', 'unsupported'])
+
+        pending = list(documents.values_list('pk', flat=True))
+        self.stdout.write(f'Extracting {len(pending)} documents')
+
+        batch_size = options['batch_size']
+        for offset in range(0, len(pending), batch_size):
+            batch = list(Document.objects.filter(pk__in=pending[offset:offset + batch_size]))
+            extract_documents(batch)
+            self.stdout.write(f'  {min(offset + batch_size, len(pending))}/{len(pending)}')
+
+        counts = {}
+        for status in Document.objects.filter(pk__in=pending).values_list('extraction_status', flat=True):
+            counts[status] = counts.get(status, 0) + 1
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(counts.items()))
+        self.stdout.write(self.style.SUCCESS(f'Done: {summary or "nothing to do"}'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from documents.backends import get_service
+from documents.gc import enqueue, find_orphans, has_remote, run_cleanups
+from documents.models import RemoteCleanup
+
+
+class Command(BaseCommand):
+    help = 'Delete upstream files and vector stores that no document or store refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list orphans, queue and delete nothing')
+        parser.add_argument('--queue-only', action='store_true',
+                            help="Don't scan upstream, only run queued cleanups")
+        parser.add_argument('--retry-failed', action='store_true', help="Run cleanups that gave up again")
+        parser.add_argument('--min-age', type=int, help='Seconds an unknown upstream object must exist to be an orphan')
+        parser.add_argument('--workers', type=int, help='Deletes at the same time')
+        parser.add_argument('--rate', type=float, help='Deletes per second (0 for no limit)')
+
+    def handle(self, *args, **options):
+        if not has_remote():
+            raise CommandError('The active vector store backend keeps nothing upstream')
+
+        if not options['queue_only']:
+            service = get_service()
+            for kind in ('vector_store', 'file'):
+                orphans = 0
+                for page in find_orphans(kind, options['min_age'], service):
+                    orphans += len(page)
+                    if options['dry_run']:
+                        for remote_id in page:
+                            self.stdout.write(f'  orphan {kind} {remote_id}')
+                    else:
+                        enqueue(kind, page)
+                self.stdout.write(f'{orphans} orphaned upstream {kind.replace("_", " ")}s')
+        if options['dry_run']:
+            return
+
+        if options['retry_failed']:
+            retried = RemoteCleanup.objects.filter(status='failed').update(
+                status='pending', attempts=0, next_attempt_at=timezone.now()
+            )
+            self.stdout.write(f'{retried} failed cleanups queued again')
+
+        counts = run_cleanups(workers=options['workers'], rate=options['rate'])
+        left = RemoteCleanup.objects.exclude(status='failed').count()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {counts['deleted']} deleted, {counts['missing']} already gone, "
+            f"{counts['retrying']} to retry, {counts['failed']} given up ({left} still queued), "
+            f"{counts['expired_uploads']} abandoned uploads expired"
+        ))
@@ -0,0 +1,320 @@
+import json
+import mimetypes
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from documents.backends import get_service
+from documents.bulk_import import Checkpoint, copy_file, copy_stream, measure_file, open_source
+from documents.gc import has_remote
+from documents.ingestion import IngestionPlanner
+from documents.models import Document, VectorStore
+from documents.rollups import record_documents_created
+from documents.stores import documents_changed_at
+from documents.uploads import UploadError, check_magic, reserve_file
+
+PROGRESS_INTERVAL = 2.0
+
+
+class Progress:
+    def __init__(self, stdout, total_files: int, total_bytes: int):
+        self.stdout = stdout
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.last_report = 0.0
+        self.reported_files = None
+
+    def advance(self, size: int, failed: bool = False) -> None:
+        self.files += 1
+        self.bytes += size
+        self.failed += int(failed)
+        self.report()
+
+    def report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        if self.reported_files == self.files:
+            return
+        self.last_report = now
+        self.reported_files = self.files
+        elapsed = max(now - self.started, 1e-6)
+        self.stdout.write(
+            f'  {self.files}/{self.total_files} files, '
+            f'{self.bytes / 1024 ** 2:.1f}/{self.total_bytes / 1024 ** 2:.1f} MB, '
+            f'{self.files / elapsed:.1f} files/s, {self.bytes / 1024 ** 2 / elapsed:.1f} MB/s, '
+            f'{self.failed} failed'
+        )
+
+
+def ingest(document_id) -> str:
+    """Thread pool task: extract a document and send it to the vector store"""
+    try:
+        document = Document.objects.select_related('vector_store').get(pk=document_id)
+        return get_service().process_document(document, document.vector_store).status
+    finally:
+        connection.close()
+
+
+class DocumentIngestor:
+    """Ingest documents one by one in a thread pool, for backends without file batches
+
+    Same interface as documents.ingestion.IngestionPlanner.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.in_flight = {}
+        self.outcomes = []
+
+    @property
+    def pending(self) -> int:
+        return len(self.in_flight) + len(self.outcomes)
+
+    def submit(self, document_id) -> None:
+        # Keep a bounded backlog so huge imports don't queue every document at once
+        while len(self.in_flight) >= self.workers * 4:
+            self._collect(block=True)
+        self.in_flight[self.pool.submit(ingest, document_id)] = document_id
+
+    def results(self, block: bool = False):
+        if self.in_flight:
+            self._collect(block and not self.outcomes)
+        outcomes, self.outcomes = self.outcomes, []
+        return outcomes
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+
+    def _collect(self, block: bool) -> None:
+        done, _ = wait(list(self.in_flight), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            document_id = self.in_flight.pop(future)
+            try:
+                self.outcomes.append((document_id, future.result(), None))
+            except Exception as e:
+                self.outcomes.append((document_id, None, str(e)))
+
+
+class Command(BaseCommand):
+    help = 'Import a directory tree or a zip/tar archive of files as documents of a vector store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory, .zip or .tar[.gz|.bz2|.xz] archive')
+        parser.add_argument('--vector-store', required=True, help='Vector store to import into (local id)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Files copied at the same time, and ingested at the same time by local backends')
+        parser.add_argument('--max-uploads', type=int,
+                            help='Most files uploaded to OpenAI at the same time (default INGEST_MAX_UPLOADS)')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run copying and dry-run token counting in threads or processes')
+        parser.add_argument('--batch-size', type=int, default=100, help='Documents inserted per bulk_create')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: next to the source)')
+        parser.add_argument('--attributes', default='{}', help='JSON attributes given to every document')
+        parser.add_argument('--dry-run', action='store_true', help='Only report files, bytes and estimated tokens')
+
+    def handle(self, *args, **options):
+        source_path = os.path.abspath(options['source'])
+        try:
+            source = open_source(source_path)
+            vector_store = VectorStore.objects.get(id=options['vector_store'])
+            attributes = json.loads(options['attributes'])
+        except (OSError, ValueError, VectorStore.DoesNotExist) as e:
+            raise CommandError(str(e))
+        if not isinstance(attributes, dict):
+            raise CommandError('--attributes must be a JSON object')
+
+        checkpoint = Checkpoint(
+            options['checkpoint']
+            or f"{source_path.rstrip(os.sep)}.{str(vector_store.id)[:8]}.import.jsonl"
+        )
+        new, resume, skipped = self.select(source, checkpoint)
+        total_bytes = sum(entry.size for entry in new) + sum(entry.size for entry, _ in resume)
+        self.stdout.write(
+            f'{len(new) + len(resume)} files to import ({total_bytes / 1024 ** 2:.1f} MB), '
+            f"{skipped['done']} already imported, {skipped['rejected']} rejected by type or size"
+        )
+
+        pool_class = ProcessPoolExecutor if options['pool'] == 'process' else ThreadPoolExecutor
+        with pool_class(max_workers=options['workers']) as pool:
+            if options['dry_run']:
+                self.dry_run(source, new + [entry for entry, _ in resume], pool)
+                return
+            try:
+                self.run(source, vector_store, attributes, new, resume, pool, checkpoint, total_bytes, options)
+            finally:
+                checkpoint.close()
+
+    def select(self, source, checkpoint):
+        """Split source files into new ones, ones to ingest again, and skipped counts"""
+        new, resume = [], []
+        skipped = {'done': 0, 'rejected': 0}
+        existing = {}
+        document_ids = [
+            record['document'] for record in checkpoint.states.values()
+            if record['state'] in ('created', 'failed') and record.get('document')
+        ]
+        if document_ids:
+            existing = {str(pk): pk for pk in Document.objects.filter(pk__in=document_ids).values_list('pk', flat=True)}
+
+        for entry in source.files():
+            record = checkpoint.states.get(entry.key, {})
+            extension = os.path.splitext(entry.key)[1].lower()
+            if record.get('state') in ('done', 'skipped'):
+                skipped['done'] += 1
+            elif (extension not in settings.DOCUMENT_UPLOAD_ALLOWED_EXTENSIONS
+                  or entry.size > settings.DOCUMENT_UPLOAD_MAX_SIZE):
+                skipped['rejected'] += 1
+            elif record.get('document') in existing:
+                resume.append((entry, existing[record['document']]))
+            else:
+                new.append(entry)
+        return new, resume, skipped
+
+    def dry_run(self, source, entries, pool):
+        encoding = settings.DOCUMENT_TOKEN_ENCODING
+        keys = {entry.key for entry in entries}
+        if source.random_access:
+            futures = [pool.submit(measure_file, source.path, entry.key, encoding) for entry in entries]
+        else:
+            futures = []
+            for entry, stream in source.members():
+                if entry.key in keys:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(entry.key)[1]) as handle:
+                        copy_stream(stream, handle.name)
+                    futures.append(pool.submit(measure_file, source.path, entry.key, encoding, handle.name))
+
+        tokens = estimated = 0
+        for future in as_completed(futures):
+            _, count, exact = future.result()
+            tokens += count
+            estimated += int(not exact)
+
+        total_bytes = sum(entry.size for entry in entries)
+        self.stdout.write(self.style.SUCCESS(
+            f'Dry run: {len(entries)} files, {total_bytes / 1024 ** 2:.1f} MB, ~{tokens} tokens'
+            + (f' ({estimated} files estimated from their size)' if estimated else '')
+        ))
+
+    def copied_batches(self, source, entries, pool, batch_size):
+        """Copy files into storage, yielding lists of (entry, storage name, error)"""
+        if source.random_access:
+            for offset in range(0, len(entries), batch_size):
+                batch = entries[offset:offset + batch_size]
+                names = {entry.key: reserve_file(os.path.basename(entry.key)) for entry in batch}
+                futures = {
+                    pool.submit(copy_file, source.path, entry.key, default_storage.path(names[entry.key])): entry
+                    for entry in batch
+                }
+                copied = []
+                for future in as_completed(futures):
+                    entry = futures[future]
+                    try:
+                        future.result()
+                        copied.append((entry, names[entry.key], None))
+                    except Exception as e:
+                        copied.append((entry, names[entry.key], e))
+                yield copied
+            return
+
+        keys = {entry.key for entry in entries}
+        batch = []
+        for entry, stream in source.members():
+            if entry.key not in keys:
+                continue
+            name = reserve_file(os.path.basename(entry.key))
+            try:
+                copy_stream(stream, default_storage.path(name))
+                batch.append((entry, name, None))
+            except Exception as e:
+                batch.append((entry, name, e))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run(self, source, vector_store, attributes, new, resume, pool, checkpoint, total_bytes, options):
+        progress = Progress(self.stdout, len(new) + len(resume), total_bytes)
+        entries = {}
+        if has_remote():
+            # Upstream: adaptive uploads and file batches (documents.ingestion)
+            ingestor = IngestionPlanner(vector_store, max_uploads=options['max_uploads'])
+        else:
+            ingestor = DocumentIngestor(options['workers'])
+
+        def collect(block: bool) -> None:
+            for document_id, status, error in ingestor.results(block):
+                entry = entries.pop(document_id)
+                if error is None:
+                    checkpoint.record(entry.key, 'done', document=str(document_id), status=status)
+                    progress.advance(entry.size)
+                else:
+                    checkpoint.record(entry.key, 'failed', document=str(document_id), error=error)
+                    progress.advance(entry.size, failed=True)
+            checkpoint.sync()
+
+        def submit(entry, document_id):
+            entries[document_id] = entry
+            ingestor.submit(document_id)
+
+        try:
+            for entry, document_id in resume:
+                submit(entry, document_id)
+
+            for batch in self.copied_batches(source, new, pool, options['batch_size']):
+                documents = []
+                for entry, name, error in batch:
+                    if error is None:
+                        try:
+                            with default_storage.open(name) as handle:
+                                check_magic(entry.key, handle.read(8))
+                        except UploadError as e:
+                            error = e
+                    if error is not None:
+                        default_storage.delete(name)
+                        checkpoint.record(entry.key, 'skipped' if isinstance(error, UploadError) else 'failed',
+                                          error=str(error))
+                        progress.advance(entry.size, failed=True)
+                        continue
+                    filename = os.path.basename(entry.key)
+                    documents.append((entry, Document(
+                        vector_store=vector_store,
+                        title=os.path.splitext(filename)[0],
+                        file=name,
+                        file_size=entry.size,
+                        content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                        attributes=dict(attributes),
+                    )))
+
+                with transaction.atomic():
+                    Document.objects.bulk_create([document for _, document in documents])
+                record_documents_created([document for _, document in documents])
+                documents_changed_at(vector_store.pk)
+                for entry, document in documents:
+                    checkpoint.record(entry.key, 'created', document=str(document.pk))
+                checkpoint.sync()
+
+                for entry, document in documents:
+                    submit(entry, document.pk)
+                collect(block=False)
+
+            while ingestor.pending:
+                collect(block=True)
+        finally:
+            ingestor.close()
+
+        progress.report(force=True)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {progress.files - progress.failed} imported, {progress.failed} failed '
+            f'(checkpoint: {checkpoint.path})'
+        ))
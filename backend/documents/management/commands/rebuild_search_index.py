@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from documents.schema import rebuild_search_indexes
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search indexes (run after VACUUM on SQLite)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias')
+
+    def handle(self, *args, **options):
+        rebuild_search_indexes(options['database'])
+        self.stdout.write(self.style.SUCCESS('Search indexes rebuilt'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from documents.models import VectorStore
+from documents.warmup import available, warm_store
+
+
+class Command(BaseCommand):
+    help = "Run each vector store's most asked queries and keep their results for the search endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vector-store', action='append', help='Only this vector store (local id); repeatable')
+        parser.add_argument('--top', type=int, help='Queries per store (default SEARCH_WARMUP_TOP)')
+
+    def handle(self, *args, **options):
+        if not available():
+            raise CommandError('Warm searches are disabled or the cache is not shared between processes')
+        stores = options['vector_store'] or VectorStore.objects.values_list('pk', flat=True)
+        total = 0
+        for vector_store_id in stores:
+            warmed = warm_store(vector_store_id, options['top'])
+            self.stdout.write(f'  {vector_store_id}: {warmed} queries warmed')
+            total += warmed
+        self.stdout.write(self.style.SUCCESS(f'Done: {total} queries warmed'))
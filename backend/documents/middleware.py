@@ -0,0 +1,72 @@
+"""
+Middleware for the documents API
+"""
+from django.conf import settings
+from django.http import FileResponse
+from django.middleware.gzip import GZipMiddleware
+from .deadlines import DatabaseDeadline, deadline, request_budget
+from .routers import PIN_COOKIE, read_only_request, routing
+from .stores import identity_map
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Gzip large API payloads and NDJSON exports, but never file downloads
+
+    Files are sent as they are so byte ranges and sendfile() keep working,
+    and small payloads are not worth the CPU.
+    """
+
+    def process_response(self, request, response):
+        if (
+            isinstance(response, FileResponse)
+            or response.status_code == 206
+            or response.has_header('X-Accel-Redirect')
+            or response.has_header('X-Sendfile')
+        ):
+            return response
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        return super().process_response(request, response)
+
+
+class DeadlineMiddleware:
+    """Give each request its deadline (see documents.deadlines)
+
+    The deadline covers the view only; streamed bodies such as exports are
+    sent after it has been lifted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with deadline(request_budget(request)), DatabaseDeadline.installed():
+            return self.get_response(request)
+
+
+class IdentityMapMiddleware:
+    """Resolve each vector store at most once per request (see documents.stores)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map():
+            return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """Read from a replica on read-only requests and pin writers to the primary
+    (see documents.routers)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with routing(read_only_request(request)) as route:
+            response = self.get_response(request)
+        if route.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.DATABASE_READ_YOUR_WRITES, httponly=True, samesite='Lax'
+            )
+        return response
@@ -1,9 +1,120 @@
+from contextlib import contextmanager
 from django.db import models
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 
 
-class VectorStore(models.Model):
+def _copy_json(value):
+    """Copy of a decoded JSON value; much cheaper than copy.deepcopy"""
+    if isinstance(value, dict):
+        return {key: _copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(item) for item in value]
+    return value
+
+
+class TrackedModel(models.Model):
+    """Model whose saves write only the fields that changed since it was loaded
+
+    save() without update_fields issues an UPDATE of the changed columns, or
+    nothing at all when no field changed. auto_now fields are added to every
+    write that changes a field, also ones with explicit update_fields, and
+    save(update_fields=[]) writes nothing, as with Model.save(). Inside
+    `with instance.coalesced_saves():` saves are only recorded, and the block
+    ends with a single write of everything that changed.
+    """
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def _tracked_value(value):
+        if isinstance(value, FieldFile):
+            # A newly assigned file is a change even if it keeps the old name
+            return value.name if value._committed else value
+        if isinstance(value, (dict, list)):
+            # JSON fields can be changed in place
+            return _copy_json(value)
+        return value
+
+    def _snapshot(self, fields=None):
+        """Record current values as the saved ones (all loaded fields by default)"""
+        if not hasattr(self, '_saved_values'):
+            self._saved_values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (fields is None or field.name in fields or field.attname in fields):
+                self._saved_values[field.attname] = self._tracked_value(self.__dict__[field.attname])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Hot path for every listed row: values come straight from the database
+        instance._saved_values = {
+            attname: _copy_json(value) if isinstance(value, (dict, list)) else value
+            for attname, value in zip(field_names, values)
+        }
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot(fields)
+
+    def changed_fields(self):
+        """Names of loaded or assigned fields whose value differs from the saved one"""
+        saved = getattr(self, '_saved_values', {})
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            value = self.__dict__[field.attname]
+            if isinstance(value, FieldFile):
+                value = self._tracked_value(value)
+            if field.attname not in saved or saved[field.attname] != value:
+                changed.append(field.name)
+        return changed
+
+    @contextmanager
+    def coalesced_saves(self):
+        """Turn the saves of a block into one write when it ends, even if it raises"""
+        outer = getattr(self, '_save_pending', None) is not None
+        if not outer:
+            self._save_pending = False
+        try:
+            yield self
+        finally:
+            if not outer:
+                pending, self._save_pending = self._save_pending, None
+                if pending:
+                    self.save()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if getattr(self, '_save_pending', None) is not None and update_fields is None and not self._state.adding:
+            self._save_pending = True
+            return
+        changed = None
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = changed = self.changed_fields()
+            if not update_fields:
+                return
+        if update_fields is not None:
+            update_fields = list(update_fields)
+            if not update_fields:
+                return
+            if changed is None:
+                changed = self.changed_fields()
+            # Rewriting unchanged values is no reason to bump the timestamps
+            if {self._meta.get_field(name).name for name in update_fields}.intersection(changed):
+                update_fields += [
+                    field.name for field in self._meta.concrete_fields
+                    if getattr(field, 'auto_now', False) and field.name not in update_fields
+                ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._snapshot(update_fields)
+
+
+class VectorStore(TrackedModel):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     openai_vector_store_id = models.CharField(max_length=255, unique=True)
     name = models.CharField(max_length=255)
@@ -11,6 +122,8 @@ class VectorStore(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=50, default='pending')
     metadata = models.JSONField(default=dict, blank=True)
+    # Last time a document was added, removed or moved (see documents.stores)
+    documents_changed_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"{self.name} ({self.openai_vector_store_id})"
@@ -19,7 +132,7 @@ class VectorStore(models.Model):
         ordering = ['-created_at']
 
 
-class Document(models.Model):
+class Document(TrackedModel):
     STATUS_CHOICES = [
         ('uploading', 'Uploading'),
         ('processing', 'Processing'),
@@ -27,6 +140,14 @@ class Document(models.Model):
         ('failed', 'Failed'),
     ]
 
+    EXTRACTION_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('extracting', 'Extracting'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('unsupported', 'Unsupported'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255)
     file = models.FileField(upload_to='documents/')
@@ -35,23 +156,94 @@ class Document(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
     
     # OpenAI related fields
-    openai_file_id = models.CharField(max_length=255, blank=True, null=True)
+    openai_file_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
     vector_store = models.ForeignKey(VectorStore, on_delete=models.CASCADE, related_name='documents')
     openai_vector_store_file_id = models.CharField(max_length=255, blank=True, null=True)
+    # While a replaced file is re-ingested (documents.reingest): the new upload
+    # before it's swapped in, and the old one until it's detached
+    pending_openai_file_id = models.CharField(max_length=255, blank=True, null=True)
+    retired_openai_file_id = models.CharField(max_length=255, blank=True, null=True)
+    # sha256 of the file, filled in when the file is first replaced
+    content_hash = models.CharField(max_length=64, blank=True)
     
     # Metadata
     upload_date = models.DateTimeField(auto_now_add=True)
+    # Bumped by every write that changes what the API shows (see documents.conditional)
+    updated_at = models.DateTimeField(auto_now=True)
     processed_date = models.DateTimeField(null=True, blank=True)
     attributes = models.JSONField(default=dict, blank=True)
     
     # Error tracking
     error_message = models.TextField(blank=True, null=True)
 
+    # Local text extraction
+    extraction_status = models.CharField(max_length=20, choices=EXTRACTION_STATUS_CHOICES, default='pending')
+    page_count = models.IntegerField(null=True, blank=True)
+    extracted_pages = models.IntegerField(default=0)
+    token_count = models.IntegerField(null=True, blank=True)
+
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ['-upload_date']
+        indexes = [
+            # Searchable-document checks filter on both columns
+            models.Index(fields=['vector_store', 'status'], name='document_store_status_idx'),
+            # Listings and exports walk the default ordering
+            models.Index(fields=['-upload_date'], name='document_upload_date_idx'),
+            # Conditional GETs aggregate MAX(updated_at)
+            models.Index(fields=['updated_at'], name='document_updated_at_idx'),
+        ]
+
+
+class DocumentChunk(models.Model):
+    document = models.ForeignKey(Document, on_delete=models.CASCADE, related_name='chunks')
+    page_number = models.IntegerField()
+    index = models.IntegerField()
+    text = models.TextField()
+    token_count = models.IntegerField()
+
+    def __str__(self):
+        return f"{self.document_id} p{self.page_number}#{self.index}"
+
+    class Meta:
+        ordering = ['document', 'page_number', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'page_number', 'index'], name='unique_document_chunk'),
+        ]
+
+
+class UploadSession(models.Model):
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('writing', 'Writing'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    vector_store = models.ForeignKey(VectorStore, on_delete=models.CASCADE, related_name='upload_sessions')
+    title = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    attributes = models.JSONField(default=dict, blank=True)
+
+    # Storage name the chunks are written to; it becomes Document.file as is
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    document = models.OneToOneField(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_session')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.total_size})"
+
+    class Meta:
+        ordering = ['-created_at']
 
 
 class Query(models.Model):
@@ -61,9 +253,128 @@ class Query(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     response = models.JSONField(default=dict, blank=True)
     max_results = models.IntegerField(default=10)
+    # Time spent getting results from the backend, in milliseconds
+    latency_ms = models.FloatField(null=True, blank=True)
 
     def __str__(self):
         return f"Query: {self.query_text[:50]}..."
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Listings and exports walk the default ordering, per store or overall
+            models.Index(fields=['vector_store', '-created_at'], name='query_store_created_idx'),
+            models.Index(fields=['-created_at'], name='query_created_idx'),
+        ]
+
+
+class StoreRollup(models.Model):
+    """Pre-aggregated activity of a vector store, or of all of them, for one time bucket"""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+        ('total', 'All time'),
+    ]
+
+    # Null on the rows that count every store
+    vector_store = models.ForeignKey(
+        VectorStore, on_delete=models.CASCADE, related_name='rollups', null=True, blank=True
+    )
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+
+    query_count = models.BigIntegerField(default=0)
+    distinct_queries = models.BigIntegerField(default=0)
+    # Upper bound in ms -> number of queries (see documents.rollups)
+    latency_histogram = models.JSONField(default=dict, blank=True)
+
+    documents_uploaded = models.BigIntegerField(default=0)
+    bytes_uploaded = models.BigIntegerField(default=0)
+    documents_completed = models.BigIntegerField(default=0)
+    documents_failed = models.BigIntegerField(default=0)
+    # Only maintained on 'total' rows: documents currently uploading or processing
+    documents_in_progress = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.vector_store_id or 'all stores'} {self.granularity} {self.bucket:%Y-%m-%d %H:%M}"
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['vector_store', 'granularity', 'bucket'], name='unique_store_rollup'),
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket'], condition=models.Q(vector_store__isnull=True),
+                name='unique_all_stores_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket'], name='rollup_granularity_bucket_idx'),
+        ]
+
+
+class QueryTextRollup(models.Model):
+    """How often one query text was asked in a store, or in any store, during one time bucket"""
+    vector_store = models.ForeignKey(
+        VectorStore, on_delete=models.CASCADE, related_name='query_text_rollups', null=True, blank=True
+    )
+    granularity = models.CharField(max_length=10, choices=StoreRollup.GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    query_hash = models.CharField(max_length=40)
+    query_text = models.TextField()
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.query_text[:50]} x{self.count}"
+
+    class Meta:
+        ordering = ['-count']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['vector_store', 'granularity', 'bucket', 'query_hash'], name='unique_query_text_rollup'
+            ),
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'query_hash'], condition=models.Q(vector_store__isnull=True),
+                name='unique_all_stores_query_text_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket', '-count'], name='query_rollup_top_idx'),
+        ]
+
+
+class RemoteCleanup(models.Model):
+    """An upstream file or vector store waiting to be deleted (see documents.gc)"""
+    KIND_CHOICES = [
+        ('file', 'File'),
+        ('vector_store', 'Vector store'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    # Name of the backend that owns remote_id (settings.VECTOR_STORE_BACKENDS)
+    backend = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    remote_id = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.remote_id} ({self.status})"
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        constraints = [
+            models.UniqueConstraint(fields=['backend', 'kind', 'remote_id'], name='unique_remote_cleanup'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='remote_cleanup_due_idx'),
+        ]
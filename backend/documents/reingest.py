@@ -0,0 +1,204 @@
+"""
+Replacing a document's file without a gap in search
+
+replace_file() keeps the new file only if its sha256 differs from the old
+one, then re-ingests it in the background: the new upload is recorded as
+pending_openai_file_id, attached to the vector store and waited on until it
+is searchable. One locked update then makes it openai_file_id and moves the
+old id to retired_openai_file_id; only after that is the old file detached
+and queued for deletion. Hydration drops hits on pending and retired ids,
+so searches see either the old file or the new one, never both.
+
+A newer replacement supersedes an older one still in flight: the content
+hash it was started for no longer matches and its upload is discarded.
+"""
+import hashlib
+import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from .backends import get_service
+from .deadlines import deadline, remaining
+from .extraction import extract_documents
+from .filters import upstream_attributes
+from .gc import queue_cleanup
+from .models import Document
+
+HASH_BUFFER = 1024 * 1024
+# Polling of a newly attached file: first delay and cap, in seconds
+POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 5.0
+
+
+def hash_stream(stream) -> str:
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(HASH_BUFFER), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def stored_hash(document: Document) -> str:
+    """The document's content hash, computed from its stored file if not recorded yet"""
+    if document.content_hash or not document.file:
+        return document.content_hash
+    try:
+        with document.file.open('rb') as handle:
+            return hash_stream(handle)
+    except (OSError, ValueError):
+        return ''
+
+
+def replace_file(document: Document, upload) -> bool:
+    """Store a new file for the document and re-ingest it; False if the content is the same"""
+    upload.seek(0)
+    digest = hash_stream(upload)
+    upload.seek(0)
+    if digest == stored_hash(document):
+        if not document.content_hash:
+            document.content_hash = digest
+            Document.objects.filter(pk=document.pk).update(content_hash=digest, updated_at=timezone.now())
+        return False
+
+    old_name = document.file.name
+    with transaction.atomic():
+        document.file.save(upload.name, upload, save=False)
+        document.file_size = upload.size
+        document.content_type = (
+            getattr(upload, 'content_type', None)
+            or mimetypes.guess_type(upload.name)[0]
+            or 'application/octet-stream'
+        )
+        document.content_hash = digest
+        # Extract the new file from scratch
+        document.extraction_status = 'pending'
+        document.extracted_pages = 0
+        document.page_count = None
+        document.token_count = None
+        document.error_message = None
+        document.save()
+        document.chunks.all().delete()
+        transaction.on_commit(lambda: schedule(document.pk, digest))
+        if old_name and old_name != document.file.name:
+            transaction.on_commit(lambda: default_storage.delete(old_name))
+    return True
+
+
+def wait_until_searchable(service, vector_store_id: str, vector_store_file_id: str) -> None:
+    delay = POLL_INTERVAL
+    while True:
+        state, error = service.vector_store_file_state(vector_store_id, vector_store_file_id)
+        if state == 'completed':
+            return
+        if state in ('failed', 'cancelled'):
+            raise Exception(f"Vector store file {state}: {error}")
+        left = remaining()
+        time.sleep(delay if left is None else max(min(delay, left), 0))
+        delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+
+def discard(service, vector_store_id: str, file_id: str) -> bool:
+    """Detach a file that no document uses and queue it for deletion; False if detaching failed"""
+    try:
+        service.detach_file(vector_store_id, file_id)
+        detached = True
+    except Exception as e:
+        print(f"Failed to detach file {file_id}: {e}")
+        detached = False
+    queue_cleanup(file_ids=[file_id])
+    return detached
+
+
+def swap(document_id, digest: str, file_id: str, vector_store_file_id: str) -> Tuple[bool, Optional[str]]:
+    """Make the pending upload the document's file; returns (swapped, old file id)"""
+    with transaction.atomic():
+        document = Document.objects.select_for_update().get(pk=document_id)
+        if document.content_hash != digest or document.pending_openai_file_id != file_id:
+            return False, None
+        old_file_id = document.openai_file_id
+        document.openai_file_id = file_id
+        document.openai_vector_store_file_id = vector_store_file_id
+        document.pending_openai_file_id = None
+        document.retired_openai_file_id = old_file_id
+        document.status = 'completed'
+        document.processed_date = timezone.now()
+        document.error_message = None
+        document.save()
+    return True, old_file_id
+
+
+def reingest(document_id, digest: str) -> bool:
+    """Upload, attach and swap in the file a document got for `digest`; False if superseded"""
+    try:
+        document = Document.objects.select_related('vector_store').get(pk=document_id, content_hash=digest)
+    except Document.DoesNotExist:
+        return False
+    service = get_service()
+    vector_store_id = document.vector_store.openai_vector_store_id
+
+    extract_documents([document])
+    file_id = service.upload_replacement(document)
+    if not Document.objects.filter(pk=document_id, content_hash=digest).update(pending_openai_file_id=file_id):
+        queue_cleanup(file_ids=[file_id])
+        return False
+
+    try:
+        vector_store_file_id = service.attach_file(
+            vector_store_id, file_id, upstream_attributes(document.attributes)
+        )
+        wait_until_searchable(service, vector_store_id, vector_store_file_id)
+        swapped, old_file_id = swap(document_id, digest, file_id, vector_store_file_id)
+    except Exception as e:
+        Document.objects.filter(pk=document_id, pending_openai_file_id=file_id).update(
+            pending_openai_file_id=None, error_message=f"Re-ingestion failed: {e}", updated_at=timezone.now()
+        )
+        discard(service, vector_store_id, file_id)
+        raise
+
+    if not swapped:
+        discard(service, vector_store_id, file_id)
+        return False
+    if old_file_id and old_file_id != file_id:
+        # Until it's detached, hits on the old file keep being dropped
+        if discard(service, vector_store_id, old_file_id):
+            Document.objects.filter(pk=document_id, retired_openai_file_id=old_file_id).update(
+                retired_openai_file_id=None
+            )
+    return True
+
+
+def run(document_id, digest: str) -> None:
+    try:
+        with deadline(settings.DOCUMENT_REINGEST_TIMEOUT):
+            reingest(document_id, digest)
+    except Exception as e:
+        print(f"Re-ingestion of document {document_id} failed: {type(e).__name__}: {e}")
+
+
+def _run_in_thread(document_id, digest: str) -> None:
+    try:
+        run(document_id, digest)
+    finally:
+        connection.close()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def schedule(document_id, digest: str) -> None:
+    """Re-ingest in a background thread, or right away with DOCUMENT_REINGEST_WORKERS = 0"""
+    global _executor
+    if not settings.DOCUMENT_REINGEST_WORKERS:
+        run(document_id, digest)
+        return
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DOCUMENT_REINGEST_WORKERS, thread_name_prefix='reingest'
+            )
+    _executor.submit(_run_in_thread, document_id, digest)
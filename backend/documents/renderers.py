@@ -0,0 +1,81 @@
+import math
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; the stock encoder is the fallback
+    orjson = None
+
+_encoder = JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+LINE_SEPARATOR = '\u2028'.encode('utf-8')
+PARAGRAPH_SEPARATOR = '\u2029'.encode('utf-8')
+
+
+def _non_finite(value) -> bool:
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_non_finite(item) for item in value)
+    return False
+
+
+def dumps(data) -> bytes:
+    """Compact JSON bytes, encoded like DRF's JSONRenderer does
+
+    Like DRF, NaN and infinities raise ValueError, and U+2028/U+2029 are
+    escaped so the output is also valid JavaScript.
+    """
+    if orjson is not None:
+        # Datetimes go through DRF's encoder so they keep the same format (e.g. 'Z' for UTC)
+        rendered = orjson.dumps(
+            data,
+            default=_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # orjson writes non-finite floats as null, so only output with a null needs a look
+        if b'null' in rendered and _non_finite(data):
+            raise ValueError('Out of range float values are not JSON compliant')
+    else:
+        rendered = _encoder.encode(data).encode('utf-8')
+    if b'\xe2\x80' in rendered:
+        rendered = rendered.replace(LINE_SEPARATOR, b'\\u2028').replace(PARAGRAPH_SEPARATOR, b'\\u2029')
+    return rendered
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer that serializes with orjson when it is installed
+
+    Indented output (?indent= or Accept: application/json; indent=4) is left
+    to the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return dumps(data)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which orjson refuses
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Accept any media type for actions that return plain Django responses
+
+    Actions that stream files build their own HttpResponse, so there is
+    nothing to render; this only keeps content negotiation from rejecting
+    clients that send Accept: application/pdf and the like. Error payloads
+    raised before the file response is built are still rendered as JSON.
+    """
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, str)) or data is None:
+            return data
+        return FastJSONRenderer().render(data, renderer_context=renderer_context)
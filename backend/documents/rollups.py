@@ -0,0 +1,455 @@
+"""
+Pre-aggregated activity for the dashboard
+
+Every query and document write bumps counters in StoreRollup rows for its
+hour, its day and all time, and counts the query text in QueryTextRollup.
+Each of those rows exists once per store and once more without a store, for
+all stores together. Reading stats then touches one row per bucket, never
+the Query or Document tables, so it costs the same however long the history
+is and however many stores there are.
+
+Signal handlers (documents.signals) keep the rollups current, and
+import_documents reports its bulk inserts through record_documents_created.
+Other writes that bypass signals, such as queryset.update(), are picked up
+by the backfill_rollups command, which rebuilds everything from scratch.
+The all-store rows keep the activity of deleted stores until then.
+
+Counts are not written by the request that causes them. Once its
+transaction commits they are added up in a per-process buffer, which a
+background thread writes every ROLLUP_FLUSH_INTERVAL seconds with one
+increment per row touched; counts still buffered when a process is killed
+are lost until the next backfill.
+"""
+import atexit
+import hashlib
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+from .models import Document, Query, QueryTextRollup, StoreRollup, VectorStore
+
+# Upper bounds of the latency histogram buckets, in ms; 'inf' takes the rest
+LATENCY_BOUNDS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+IN_PROGRESS = ('uploading', 'processing')
+MAX_QUERY_TEXT = 1000
+
+COUNTERS = (
+    'query_count', 'distinct_queries', 'documents_uploaded', 'bytes_uploaded',
+    'documents_completed', 'documents_failed', 'documents_in_progress',
+)
+
+
+def buckets(moment: datetime):
+    """(granularity, bucket start) pairs a moment is counted in"""
+    moment = moment.astimezone(dt_timezone.utc)
+    hour = moment.replace(minute=0, second=0, microsecond=0)
+    return [('hour', hour), ('day', hour.replace(hour=0)), ('total', EPOCH)]
+
+
+def latency_bucket(latency_ms: float) -> str:
+    for bound in LATENCY_BOUNDS_MS:
+        if latency_ms <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def normalize_query(text: str) -> str:
+    return ' '.join(text.split()).casefold()
+
+
+def query_hash(text: str) -> str:
+    return hashlib.sha1(normalize_query(text).encode('utf-8')).hexdigest()
+
+
+def _increment(model, key: Dict[str, Any], increments: Dict[str, int], defaults: Optional[Dict] = None) -> bool:
+    """Add to counters of the row at key, creating it first if needed
+
+    Increments are done in SQL (x = x + n), so concurrent writers never lose
+    counts even where select_for_update is a no-op (SQLite). Returns whether
+    this call created the row.
+    """
+    updates = {field: F(field) + amount for field, amount in increments.items()}
+    if model.objects.filter(**key).update(**updates):
+        return False
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **(defaults or {}))
+        created = True
+    except IntegrityError:
+        created = False  # another writer created it first
+    model.objects.filter(**key).update(**updates)
+    return created
+
+
+class _Buffer:
+    """Counts waiting to be written, added up per rollup row"""
+
+    def __init__(self):
+        self.rollups = defaultdict(lambda: (defaultdict(int), defaultdict(int)))
+        self.texts = {}
+
+    def add(self, key, counters: Dict[str, int], latency_ms: Optional[float], query_text: Optional[str]) -> None:
+        totals, histogram = self.rollups[key]
+        for field, amount in counters.items():
+            totals[field] += amount
+        if latency_ms is not None:
+            histogram[latency_bucket(latency_ms)] += 1
+        if query_text is not None:
+            text_key = key + (query_hash(query_text),)
+            if text_key in self.texts:
+                self.texts[text_key][1] += 1
+            else:
+                self.texts[text_key] = [query_text[:MAX_QUERY_TEXT], 1]
+
+
+_buffer = _Buffer()
+_buffer_lock = threading.Lock()
+_timer = None
+
+
+def _take() -> _Buffer:
+    global _buffer
+    with _buffer_lock:
+        taken, _buffer = _buffer, _Buffer()
+        return taken
+
+
+def _buffered(vector_store_id, moment: datetime, counters: Dict[str, int],
+              latency_ms: Optional[float] = None, query_text: Optional[str] = None,
+              granularities: Iterable[str] = ('hour', 'day', 'total')) -> None:
+    global _timer
+    with _buffer_lock:
+        for granularity, bucket in buckets(moment):
+            if granularity in granularities:
+                for store_id in (vector_store_id, None):
+                    _buffer.add((store_id, granularity, bucket), counters, latency_ms, query_text)
+        if settings.ROLLUP_FLUSH_INTERVAL and _timer is None:
+            _timer = threading.Timer(settings.ROLLUP_FLUSH_INTERVAL, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+    if not settings.ROLLUP_FLUSH_INTERVAL:
+        flush()
+
+
+def _apply(vector_store_id, moment: datetime, counters: Dict[str, int], **kwargs) -> None:
+    """Buffer counts once the current transaction commits, so rolled back writes aren't counted"""
+    transaction.on_commit(lambda: _buffered(vector_store_id, moment, dict(counters), **kwargs))
+
+
+def _flush_in_background() -> None:
+    global _timer
+    with _buffer_lock:
+        # Counts buffered from here on get a timer of their own
+        _timer = None
+    try:
+        flush()
+    finally:
+        connection.close()
+
+
+def flush() -> None:
+    """Write the buffered counts, one transaction per store and one for the all-store rows"""
+    buffer = _take()
+    by_store = defaultdict(lambda: ([], []))
+    for key in buffer.rollups:
+        by_store[key[0]][0].append(key)
+    for text_key in buffer.texts:
+        by_store[text_key[0]][1].append(text_key)
+    if not by_store:
+        return
+
+    # Counts of deleted stores are dropped rather than recreating their rows
+    existing = set(VectorStore.objects.filter(pk__in=[pk for pk in by_store if pk is not None]).values_list('pk', flat=True))
+    existing.add(None)
+    for vector_store_id, (keys, text_keys) in by_store.items():
+        if vector_store_id not in existing:
+            continue
+        try:
+            with transaction.atomic():
+                for text_key in text_keys:
+                    store_id, granularity, bucket, digest = text_key
+                    text, count = buffer.texts[text_key]
+                    created = _increment(
+                        QueryTextRollup,
+                        {'vector_store_id': store_id, 'granularity': granularity, 'bucket': bucket,
+                         'query_hash': digest},
+                        {'count': count}, defaults={'query_text': text},
+                    )
+                    if created:
+                        buffer.rollups[text_key[:3]][0]['distinct_queries'] += 1
+                        if text_key[:3] not in keys:
+                            keys.append(text_key[:3])
+                for key in keys:
+                    counters, histogram = buffer.rollups[key]
+                    counters = {field: amount for field, amount in counters.items() if amount}
+                    if not counters and not histogram:
+                        continue
+                    row = {'vector_store_id': key[0], 'granularity': key[1], 'bucket': key[2]}
+                    _increment(StoreRollup, row, counters or {'query_count': 0})
+                    if histogram:
+                        # The update above holds the row's write lock until commit, so
+                        # this read-modify-write can't interleave with another one
+                        rollups = StoreRollup.objects.filter(**row)
+                        merged = rollups.values_list('latency_histogram', flat=True).get()
+                        for bound, count in histogram.items():
+                            merged[bound] = merged.get(bound, 0) + count
+                        rollups.update(latency_histogram=merged)
+        except Exception as e:
+            print(f"Failed to update rollups of vector store {vector_store_id or '(all)'}: {e}")
+
+
+atexit.register(flush)
+
+
+def record_query(query: Query) -> None:
+    """Count a newly saved query"""
+    _apply(query.vector_store_id, query.created_at, {'query_count': 1},
+           latency_ms=query.latency_ms, query_text=query.query_text)
+
+
+def record_document(document: Document, previous_status: Optional[str], created: bool) -> None:
+    """Count an upload and/or a status change of a document"""
+    counters = defaultdict(int)
+    if created:
+        counters['documents_uploaded'] += 1
+        counters['bytes_uploaded'] += document.file_size or 0
+    status = document.status
+    if status != previous_status:
+        if status == 'completed':
+            counters['documents_completed'] += 1
+        elif status == 'failed':
+            counters['documents_failed'] += 1
+    in_progress = int(status in IN_PROGRESS) - int(previous_status in IN_PROGRESS)
+    if not counters and not in_progress:
+        return
+
+    if counters:
+        _apply(document.vector_store_id, document.upload_date if created else timezone.now(), counters)
+    if in_progress:
+        # A gauge rather than a flow, so it only lives on the all-time row
+        _apply(document.vector_store_id, EPOCH, {'documents_in_progress': in_progress}, granularities=('total',))
+
+
+def record_documents_created(documents: Iterable[Document]) -> None:
+    """Count documents inserted with bulk_create, which sends no signals"""
+    uploads = defaultdict(lambda: defaultdict(int))
+    in_progress = defaultdict(int)
+    for document in documents:
+        counters = uploads[(document.vector_store_id, buckets(document.upload_date)[0][1])]
+        counters['documents_uploaded'] += 1
+        counters['bytes_uploaded'] += document.file_size or 0
+        if document.status in IN_PROGRESS:
+            in_progress[document.vector_store_id] += 1
+    for (vector_store_id, hour), counters in uploads.items():
+        _apply(vector_store_id, hour, counters)
+    for vector_store_id, count in in_progress.items():
+        _apply(vector_store_id, EPOCH, {'documents_in_progress': count}, granularities=('total',))
+
+
+def record_document_deleted(document: Document, status: Optional[str]) -> None:
+    if status in IN_PROGRESS:
+        _apply(document.vector_store_id, EPOCH, {'documents_in_progress': -1}, granularities=('total',))
+
+
+def backfill(vector_store_ids: Optional[List] = None, chunk_size: int = 5000) -> Dict[str, int]:
+    """Rebuild rollups from the Query and Document tables"""
+    # Buffered counts are already in those tables; write them out first so
+    # they don't land on top of the rebuilt rows
+    flush()
+    rollups = defaultdict(lambda: {'counters': defaultdict(int), 'histogram': defaultdict(int)})
+    texts = {}
+
+    queries = Query.objects.order_by()
+    documents = Document.objects.order_by()
+    if vector_store_ids is not None:
+        queries = queries.filter(vector_store_id__in=vector_store_ids)
+        documents = documents.filter(vector_store_id__in=vector_store_ids)
+
+    query_rows = queries.values_list('vector_store_id', 'created_at', 'query_text', 'latency_ms')
+    for store_id, created_at, text, latency_ms in query_rows.iterator(chunk_size=chunk_size):
+        digest = query_hash(text)
+        for granularity, bucket in buckets(created_at):
+            key = (store_id, granularity, bucket)
+            rollup = rollups[key]
+            rollup['counters']['query_count'] += 1
+            if latency_ms is not None:
+                rollup['histogram'][latency_bucket(latency_ms)] += 1
+            text_key = key + (digest,)
+            if text_key in texts:
+                texts[text_key][1] += 1
+            else:
+                texts[text_key] = [text[:MAX_QUERY_TEXT], 1]
+                rollup['counters']['distinct_queries'] += 1
+
+    document_rows = documents.values_list('vector_store_id', 'upload_date', 'processed_date', 'file_size', 'status')
+    for store_id, upload_date, processed_date, file_size, status in document_rows.iterator(chunk_size=chunk_size):
+        for granularity, bucket in buckets(upload_date):
+            counters = rollups[(store_id, granularity, bucket)]['counters']
+            counters['documents_uploaded'] += 1
+            counters['bytes_uploaded'] += file_size or 0
+            if status == 'failed':
+                # No failure time is stored, so count it at upload time
+                counters['documents_failed'] += 1
+        if status == 'completed':
+            for granularity, bucket in buckets(processed_date or upload_date):
+                rollups[(store_id, granularity, bucket)]['counters']['documents_completed'] += 1
+        if status in IN_PROGRESS:
+            rollups[(store_id, 'total', EPOCH)]['counters']['documents_in_progress'] += 1
+
+    with transaction.atomic():
+        stale_rollups = StoreRollup.objects.all()
+        stale_texts = QueryTextRollup.objects.all()
+        if vector_store_ids is not None:
+            stale_rollups = stale_rollups.filter(vector_store_id__in=vector_store_ids)
+            stale_texts = stale_texts.filter(vector_store_id__in=vector_store_ids)
+        stale_rollups.delete()
+        stale_texts.delete()
+
+        StoreRollup.objects.bulk_create(
+            (
+                StoreRollup(
+                    vector_store_id=store_id, granularity=granularity, bucket=bucket,
+                    latency_histogram=dict(values['histogram']), **values['counters'],
+                )
+                for (store_id, granularity, bucket), values in rollups.items()
+            ),
+            batch_size=1000,
+        )
+        QueryTextRollup.objects.bulk_create(
+            (
+                QueryTextRollup(
+                    vector_store_id=store_id, granularity=granularity, bucket=bucket,
+                    query_hash=digest, query_text=text, count=count,
+                )
+                for (store_id, granularity, bucket, digest), (text, count) in texts.items()
+            ),
+            batch_size=1000,
+        )
+        all_rollups, all_texts = _rebuild_all_stores()
+    return {'rollups': len(rollups) + all_rollups, 'query_texts': len(texts) + all_texts}
+
+
+def _rebuild_all_stores():
+    """Replace the all-store rows with sums of the per-store ones; returns how many of each were written"""
+    StoreRollup.objects.filter(vector_store=None).delete()
+    QueryTextRollup.objects.filter(vector_store=None).delete()
+
+    texts = list(
+        QueryTextRollup.objects.order_by().values('granularity', 'bucket', 'query_hash')
+        .annotate(total=Sum('count'), text=Min('query_text'))
+    )
+    rollups = defaultdict(lambda: {'counters': defaultdict(int), 'histogram': defaultdict(int)})
+    for row in StoreRollup.objects.order_by().values('granularity', 'bucket', 'latency_histogram', *COUNTERS):
+        rollup = rollups[(row['granularity'], row['bucket'])]
+        for field in COUNTERS:
+            rollup['counters'][field] += row[field]
+        for bound, count in row['latency_histogram'].items():
+            rollup['histogram'][bound] += count
+    for rollup in rollups.values():
+        # A text asked in several stores is one distinct query
+        rollup['counters']['distinct_queries'] = 0
+    for row in texts:
+        rollups[(row['granularity'], row['bucket'])]['counters']['distinct_queries'] += 1
+
+    StoreRollup.objects.bulk_create(
+        (
+            StoreRollup(granularity=granularity, bucket=bucket, latency_histogram=dict(values['histogram']),
+                        **values['counters'])
+            for (granularity, bucket), values in rollups.items()
+        ),
+        batch_size=1000,
+    )
+    QueryTextRollup.objects.bulk_create(
+        (
+            QueryTextRollup(granularity=row['granularity'], bucket=row['bucket'], query_hash=row['query_hash'],
+                            query_text=row['text'], count=row['total'])
+            for row in texts
+        ),
+        batch_size=1000,
+    )
+    return len(rollups), len(texts)
+
+
+def percentile(histogram: Dict[str, int], fraction: float) -> Optional[float]:
+    """Upper bound of the histogram bucket holding the given fraction of samples
+
+    Samples past the last bound are reported at that bound, so a slow tail
+    reads as "at least 30 s" rather than as no value.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    target = fraction * total
+    seen = 0
+    for bound in LATENCY_BOUNDS_MS:
+        seen += histogram.get(str(bound), 0)
+        if seen >= target:
+            return float(bound)
+    return float(LATENCY_BOUNDS_MS[-1])
+
+
+def window_start(granularity: str, periods: int, now: datetime) -> datetime:
+    current = dict(buckets(now))[granularity]
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    return current - step * (periods - 1)
+
+
+def stats(granularity: str = 'day', periods: int = 30, vector_store_id=None,
+          top: int = 10, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Dashboard numbers read only from the rollup tables"""
+    start = window_start(granularity, periods, now or timezone.now())
+
+    # No store means the all-store rows
+    rollups = StoreRollup.objects.filter(vector_store_id=vector_store_id)
+    texts = QueryTextRollup.objects.filter(vector_store_id=vector_store_id)
+
+    totals = rollups.filter(granularity='total').aggregate(
+        **{field: Sum(field) for field in COUNTERS}
+    )
+    totals = {field: value or 0 for field, value in totals.items()}
+
+    series = {}
+    histogram = defaultdict(int)
+    window = rollups.filter(granularity=granularity, bucket__gte=start).values(
+        'bucket', 'latency_histogram', *COUNTERS
+    )
+    for row in window:
+        point = series.setdefault(row['bucket'], {field: 0 for field in COUNTERS if field != 'documents_in_progress'})
+        for field in point:
+            point[field] += row[field]
+        for key, count in row['latency_histogram'].items():
+            histogram[key] += count
+
+    top_queries = (
+        texts.filter(granularity=granularity, bucket__gte=start)
+        .values('query_hash')
+        .annotate(count=Sum('count'))
+        .order_by('-count', 'query_hash')[:top]
+    )
+    top_queries = list(top_queries)
+    labels = dict(
+        texts.filter(granularity='total', query_hash__in=[row['query_hash'] for row in top_queries])
+        .values_list('query_hash', 'query_text')
+    )
+
+    return {
+        'granularity': granularity,
+        'start': start,
+        'totals': totals,
+        'series': [{'bucket': bucket, **values} for bucket, values in sorted(series.items())],
+        'top_queries': [
+            {'query_text': labels.get(row['query_hash'], ''), 'count': row['count']}
+            for row in top_queries
+        ],
+        'latency_ms': {
+            'samples': sum(histogram.values()),
+            'p50': percentile(histogram, 0.5),
+            'p95': percentile(histogram, 0.95),
+            'p99': percentile(histogram, 0.99),
+        },
+    }
@@ -0,0 +1,83 @@
+"""
+Database routing between the primary and its read replicas
+
+Writes always go to the primary ('default'). Reads go to a replica only
+inside a request ReplicaRoutingMiddleware found read-only: a GET or HEAD on
+one of the endpoints in DATABASE_REPLICA_VIEWS. Everything else, commands
+and background threads included, reads from the primary.
+
+Replicas lag behind, so a client that has just written must not read from
+one: the first write of a request sends the rest of its reads to the
+primary, and its response sets a cookie that keeps that client's requests
+there for DATABASE_READ_YOUR_WRITES seconds.
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+from typing import Optional
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import Resolver404, resolve
+
+PIN_COOKIE = 'db_primary_pin'
+
+_route = contextvars.ContextVar('database_route', default=None)
+
+
+class Route:
+    """Where the reads of one request go"""
+
+    def __init__(self, replica: Optional[str]):
+        self.replica = replica
+        self.wrote = False
+
+
+def read_only_request(request) -> bool:
+    """Whether a request may read from a replica"""
+    if (
+        not settings.DATABASE_REPLICAS
+        or request.method not in ('GET', 'HEAD')
+        or PIN_COOKIE in request.COOKIES
+    ):
+        return False
+    try:
+        url_name = resolve(request.path_info).url_name
+    except Resolver404:
+        return False
+    return url_name in settings.DATABASE_REPLICA_VIEWS
+
+
+@contextmanager
+def routing(read_only: bool):
+    """Route the reads of the block, to one replica if `read_only`"""
+    replicas = settings.DATABASE_REPLICAS
+    route = Route(random.choice(replicas) if read_only and replicas else None)
+    token = _route.set(route)
+    try:
+        yield route
+    finally:
+        _route.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if route is None or route.replica is None or route.wrote:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary belong to it
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return route.replica
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        if route is not None:
+            route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
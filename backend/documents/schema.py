@@ -0,0 +1,106 @@
+"""
+Database objects that models can't declare on their own
+
+Migrations are generated per deployment (see README), so anything that
+depends on settings or on the database vendor is created here from a
+post_migrate hook instead.
+"""
+import hashlib
+from django.conf import settings
+from django.db import connections, models, router
+from django.db.models.fields.json import KeyTransform
+from .models import Document
+from .search import SEARCH_FIELDS, fts_table, search_vector
+
+
+def attribute_index_name(key: str) -> str:
+    digest = hashlib.md5(key.encode()).hexdigest()[:8]
+    return f"doc_attr_{key[:12]}_{digest}".lower()
+
+
+def ensure_attribute_indexes(using: str = 'default') -> None:
+    """Create an expression index on Document.attributes for each configured key"""
+    connection = connections[using]
+    table = Document._meta.db_table
+    with connection.cursor() as cursor:
+        existing = set(connection.introspection.get_constraints(cursor, table))
+
+    for key in settings.DOCUMENT_INDEXED_ATTRIBUTES:
+        name = attribute_index_name(key)
+        if name in existing:
+            continue
+        index = models.Index(KeyTransform(key, 'attributes'), name=name)
+        with connection.schema_editor() as editor:
+            editor.add_index(Document, index)
+
+
+def _create_fts_index(connection, model, field: str) -> None:
+    table, fts = model._meta.db_table, fts_table(model)
+    column = model._meta.get_field(field).column
+    with connection.cursor() as cursor:
+        if fts in connection.introspection.table_names(cursor):
+            return
+        # External content: the index stores no text, only the table's rowids
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {fts} USING fts5({column}, content='{table}', content_rowid='rowid', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.rowid, old.{column}); END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.rowid, old.{column}); "
+            f"INSERT INTO {fts}(rowid, {column}) VALUES (new.rowid, new.{column}); END"
+        )
+        # Index the rows that existed before the table
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def ensure_search_indexes(using: str = 'default') -> None:
+    """Create the full-text indexes used by documents.search"""
+    connection = connections[using]
+    for model, field in SEARCH_FIELDS.items():
+        if connection.vendor == 'sqlite':
+            try:
+                _create_fts_index(connection, model, field)
+            except Exception as e:
+                # SQLite built without FTS5: searches fall back to icontains
+                print(f"Could not create full-text index for {model._meta.db_table}: {e}")
+        elif connection.vendor == 'postgresql':
+            from django.contrib.postgres.indexes import GinIndex
+            name = f'{model._meta.db_table}_fts_idx'
+            with connection.cursor() as cursor:
+                existing = set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+            if name not in existing:
+                with connection.schema_editor() as editor:
+                    editor.add_index(model, GinIndex(search_vector(model), name=name))
+
+
+def rebuild_search_indexes(using: str = 'default') -> None:
+    """Re-read every row into the SQLite full-text indexes
+
+    Needed after VACUUM, which may renumber the rowids they point at.
+    PostgreSQL expression indexes never go stale.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    ensure_search_indexes(using)
+    with connection.cursor() as cursor:
+        for model in SEARCH_FIELDS:
+            if fts_table(model) in connection.introspection.table_names(cursor):
+                cursor.execute(f"INSERT INTO {fts_table(model)}({fts_table(model)}) VALUES ('rebuild')")
+
+
+def create_database_objects(sender, using='default', **kwargs):
+    """post_migrate hook for the documents app"""
+    if not router.allow_migrate_model(using, Document):
+        return
+    ensure_attribute_indexes(using)
+    ensure_search_indexes(using)
@@ -0,0 +1,92 @@
+"""
+Full-text search over query history and document titles
+
+On SQLite each searchable table has an FTS5 index (<table>_fts) that points
+at the table's rowids and is kept in sync by triggers; on PostgreSQL a GIN
+index over to_tsvector() is used. Both are created by documents.schema.
+Every search term is matched as a prefix, and results come back best first.
+Other databases, or SQLite builds without FTS5, fall back to icontains.
+"""
+import re
+from typing import List
+from django.db import connections
+from django.db.models import Q
+from .models import Document, Query
+
+# Model -> text field covered by the full-text index
+SEARCH_FIELDS = {
+    Query: 'query_text',
+    Document: 'title',
+}
+# PostgreSQL text search configuration; 'simple' does no stemming, so it works for any language
+SEARCH_CONFIG = 'simple'
+MAX_TERMS = 8
+MAX_RESULTS = 200
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_fts_tables = set()
+
+
+def search_terms(text: str) -> List[str]:
+    return TERM_RE.findall(text.lower())[:MAX_TERMS]
+
+
+def fts_table(model) -> str:
+    return f'{model._meta.db_table}_fts'
+
+
+def search_vector(model):
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector(SEARCH_FIELDS[model], config=SEARCH_CONFIG)
+
+
+def _has_fts(connection, model) -> bool:
+    key = (connection.alias, connection.settings_dict['NAME'], fts_table(model))
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            if fts_table(model) not in connection.introspection.table_names(cursor):
+                return False
+        _fts_tables.add(key)
+    return True
+
+
+def full_text_search(queryset, text: str, ranked: bool = True):
+    """Restrict a queryset to rows matching every term of text as a prefix
+
+    With ranked=True the rows are annotated with search_rank and ordered best
+    first.
+    """
+    model = queryset.model
+    field = SEARCH_FIELDS[model]
+    terms = search_terms(text)
+    if not terms:
+        return queryset.none()
+
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite' and _has_fts(connection, model):
+        table, fts = model._meta.db_table, fts_table(model)
+        match = ' '.join('"%s"*' % term.replace('"', '""') for term in terms)
+        # A join rather than a subquery, so MATCH runs once and rank comes with it
+        queryset = queryset.extra(
+            tables=[fts],
+            where=[f'{fts}.rowid = {table}.rowid', f'{fts} MATCH %s'],
+            params=[match],
+        )
+        if ranked:
+            # bm25: lower is better
+            queryset = queryset.extra(select={'search_rank': f'{fts}.rank'}, order_by=['search_rank'])
+        return queryset
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        query = SearchQuery(' & '.join(f"'{term}':*" for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        queryset = queryset.annotate(search_document=search_vector(model)).filter(search_document=query)
+        if ranked:
+            queryset = queryset.annotate(search_rank=SearchRank(search_vector(model), query)).order_by('-search_rank')
+        return queryset
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(**{f'{field}__icontains': term})
+    return queryset.filter(condition)
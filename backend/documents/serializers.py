@@ -1,5 +1,9 @@
+import os
+from django.conf import settings
 from rest_framework import serializers
-from .models import VectorStore, Document, Query
+from .models import VectorStore, Document, DocumentChunk, Query, UploadSession
+from .filters import FilterError, validate_filter
+from .uploads import reserve_file
 
 
 class VectorStoreSerializer(serializers.ModelSerializer):
@@ -11,6 +15,9 @@ class VectorStoreSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_document_count(self, obj):
+        # Querysets from VectorStoreViewSet annotate the count up front
+        if hasattr(obj, 'document_total'):
+            return obj.document_total
         return obj.documents.count()
 
 
@@ -20,14 +27,22 @@ class DocumentSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'file', 'file_size', 'content_type', 'status',
             'upload_date', 'processed_date', 'attributes', 'error_message',
-            'vector_store'
+            'vector_store', 'extraction_status', 'page_count', 'token_count',
+            'content_hash'
         ]
         read_only_fields = [
             'id', 'file_size', 'content_type', 'status', 'upload_date', 
-            'processed_date', 'error_message'
+            'processed_date', 'error_message', 'extraction_status',
+            'page_count', 'token_count', 'content_hash'
         ]
 
 
+class DocumentChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DocumentChunk
+        fields = ['page_number', 'index', 'text', 'token_count']
+
+
 class DocumentUploadSerializer(serializers.ModelSerializer):
     vector_store_id = serializers.UUIDField(write_only=True)
     
@@ -52,16 +67,75 @@ class DocumentUploadSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'vector_store', 'title', 'filename', 'content_type', 'attributes',
+            'total_size', 'offset', 'status', 'document', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+
+class UploadSessionCreateSerializer(serializers.ModelSerializer):
+    vector_store_id = serializers.UUIDField(write_only=True)
+    title = serializers.CharField(max_length=255, required=False)
+    size = serializers.IntegerField(source='total_size', min_value=1)
+
+    class Meta:
+        model = UploadSession
+        fields = ['vector_store_id', 'title', 'filename', 'size', 'content_type', 'attributes']
+
+    def validate_filename(self, value):
+        extension = os.path.splitext(value)[1].lower()
+        if extension not in settings.DOCUMENT_UPLOAD_ALLOWED_EXTENSIONS:
+            raise serializers.ValidationError(f"Files of type '{extension or value}' are not accepted")
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        if value > settings.DOCUMENT_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f"Upload is larger than the {settings.DOCUMENT_UPLOAD_MAX_SIZE} byte limit"
+            )
+        return value
+
+    def validate_vector_store_id(self, value):
+        if not VectorStore.objects.filter(id=value).exists():
+            raise serializers.ValidationError(f"Vector store with id {value} does not exist")
+        return value
+
+    def create(self, validated_data):
+        validated_data.setdefault('title', os.path.splitext(validated_data['filename'])[0])
+        validated_data['file_name'] = reserve_file(validated_data['filename'])
+        return super().create(validated_data)
+
+
 class QuerySerializer(serializers.ModelSerializer):
     class Meta:
         model = Query
-        fields = ['id', 'vector_store', 'query_text', 'created_at', 'response', 'max_results']
-        read_only_fields = ['id', 'created_at', 'response']
+        fields = ['id', 'vector_store', 'query_text', 'created_at', 'response', 'max_results', 'latency_ms']
+        read_only_fields = ['id', 'created_at', 'response', 'latency_ms']
 
 
 class VectorStoreSearchSerializer(serializers.Serializer):
     query = serializers.CharField(max_length=1000)
     max_results = serializers.IntegerField(min_value=1, max_value=50, default=10)
+    filters = serializers.JSONField(required=False)
+
+    def validate_filters(self, value):
+        if value in (None, {}):
+            return None
+        try:
+            return validate_filter(value)
+        except FilterError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=['hour', 'day'], default='day')
+    periods = serializers.IntegerField(min_value=1, max_value=366, default=30)
+    vector_store = serializers.UUIDField(required=False)
+    top = serializers.IntegerField(min_value=1, max_value=50, default=10)
 
 
 class VectorStoreCreateSerializer(serializers.ModelSerializer):
@@ -1,40 +1,33 @@
-import os
+import time
 from typing import Optional, List, Dict, Any
 from django.conf import settings
 from django.core.files.uploadedfile import UploadedFile
 from django.utils import timezone
+from .backends import VectorStoreBackend
+from .deadlines import call_timeout, remaining
+from .filters import empty_search_page, matching_documents, to_openai, upstream_attributes
+from .gc import queue_cleanup
 from .models import VectorStore, Document, Query
-
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError as e:
-    print(f"OpenAI import error: {e}")
-    OPENAI_AVAILABLE = False
+from .stores import get_store
 
 
 def create_safe_openai_client():
     """Create OpenAI client with safe initialization"""
-    if not OPENAI_AVAILABLE:
-        raise ValueError("OpenAI package not available")
+    # Imported here so workers that use another backend never load the SDK
+    try:
+        import httpx
+        from openai import OpenAI
+    except ImportError as e:
+        raise ValueError(f"OpenAI package not available: {e}")
     
     if not settings.OPENAI_API_KEY:
         raise ValueError("OPENAI_API_KEY not configured")
     
     try:
-        print(f"Creating OpenAI client...")
-        print(f"API Key present: {bool(settings.OPENAI_API_KEY)}")
-        
-        # Clear proxy environment variables that might interfere
-        proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
-        for var in proxy_vars:
-            if var in os.environ:
-                print(f"Temporarily removing {var}")
-                del os.environ[var]
-        
-        # Initialize with only the required parameter
-        client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        print("OpenAI client created successfully")
+        # Ignore proxy environment variables that might interfere, without
+        # touching os.environ for the rest of the process
+        http_client = httpx.Client(trust_env=False)
+        client = OpenAI(api_key=settings.OPENAI_API_KEY, http_client=http_client)
         return client
         
     except Exception as e:
@@ -47,7 +40,10 @@ def test_openai_connection():
     return create_safe_openai_client()
 
 
-class OpenAIVectorStoreService:
+class OpenAIVectorStoreService(VectorStoreBackend):
+    has_remote = True
+    list_page_size = 100
+
     def __init__(self):
         try:
             self.client = create_safe_openai_client()
@@ -55,11 +51,18 @@ class OpenAIVectorStoreService:
             print(f"Error in OpenAIVectorStoreService init: {e}")
             raise e
 
+    def _client(self, timeout: Optional[float] = None):
+        """The client, held to the current request's deadline if there is one"""
+        if remaining() is None:
+            return self.client
+        # No retries: one would start with the budget already spent
+        return self.client.with_options(timeout=call_timeout(timeout), max_retries=0)
+
     def create_vector_store(self, name: str, metadata: Optional[Dict] = None) -> VectorStore:
         """Create a new vector store in OpenAI and save it to database"""
         try:
             # Create vector store in OpenAI
-            openai_vector_store = self.client.vector_stores.create(
+            openai_vector_store = self._client(30).vector_stores.create(
                 name=name,
                 metadata=metadata or {}
             )
@@ -82,7 +85,7 @@ class OpenAIVectorStoreService:
             # Create a temporary file-like object for OpenAI
             file.seek(0)  # Reset file pointer
             
-            openai_file = self.client.files.create(
+            openai_file = self._client(60).files.create(
                 file=(file.name, file.read(), file.content_type),
                 purpose="assistants"
             )
@@ -97,10 +100,15 @@ class OpenAIVectorStoreService:
             if not document.openai_file_id:
                 raise ValueError("Document must have an OpenAI file ID")
             
-            # Add file to vector store
-            vector_store_file = self.client.vector_stores.files.create(
+            # Add file to vector store, with attributes that search can filter on
+            options = {}
+            attributes = upstream_attributes(document.attributes)
+            if attributes:
+                options['attributes'] = attributes
+            vector_store_file = self._client(30).vector_stores.files.create(
                 vector_store_id=vector_store.openai_vector_store_id,
-                file_id=document.openai_file_id
+                file_id=document.openai_file_id,
+                **options
             )
             
             # Update document with vector store file ID
@@ -112,26 +120,43 @@ class OpenAIVectorStoreService:
         except Exception as e:
             raise Exception(f"Failed to add file to vector store: {str(e)}")
 
-    def search_vector_store(self, vector_store: VectorStore, query: str, max_results: int = 10) -> Dict[str, Any]:
+    def search_vector_store(self, vector_store_id: str, query: str, max_results: int = 10,
+                            filters: Optional[Dict[str, Any]] = None, record: bool = True) -> Dict[str, Any]:
         """Search in a vector store"""
         try:
-            search_results = self.client.vector_stores.search(
-                vector_store_id=vector_store.openai_vector_store_id,
-                query=query,
-                max_num_results=max_results
-            )
+            vector_store = get_store(openai_id=vector_store_id)
+            if vector_store is None:
+                raise VectorStore.DoesNotExist("Vector store not found in database")
+            latency_ms = None
+            if filters and not matching_documents(vector_store.id, filters).exists():
+                # No local document satisfies the filter, so upstream can't either
+                search_results = empty_search_page(query)
+            else:
+                options = {'filters': to_openai(filters)} if filters else {}
+                started = time.perf_counter()
+                search_results = self._client(30).vector_stores.search(
+                    vector_store_id=vector_store_id,
+                    query=query,
+                    max_num_results=max_results,
+                    **options
+                ).model_dump()
+                latency_ms = (time.perf_counter() - started) * 1000
+            
+            if not record:
+                return {'query_id': None, 'results': search_results}
             
             # Save query to database
             query_obj = Query.objects.create(
-                vector_store=vector_store,
+                vector_store_id=vector_store.id,
                 query_text=query,
-                response=search_results.model_dump(),
-                max_results=max_results
+                response=search_results,
+                max_results=max_results,
+                latency_ms=latency_ms
             )
             
             return {
                 'query_id': str(query_obj.id),
-                'results': search_results.model_dump()
+                'results': search_results
             }
         except Exception as e:
             raise Exception(f"Failed to search vector store: {str(e)}")
@@ -139,7 +164,7 @@ class OpenAIVectorStoreService:
     def get_vector_store_status(self, vector_store: VectorStore) -> Dict[str, Any]:
         """Get the current status of a vector store from OpenAI"""
         try:
-            openai_vector_store = self.client.vector_stores.retrieve(
+            openai_vector_store = self._client(30).vector_stores.retrieve(
                 vector_store_id=vector_store.openai_vector_store_id
             )
             
@@ -157,7 +182,7 @@ class OpenAIVectorStoreService:
             if not document.openai_vector_store_file_id:
                 raise ValueError("Document must have a vector store file ID")
             
-            file_status = self.client.vector_stores.files.retrieve(
+            file_status = self._client(30).vector_stores.files.retrieve(
                 vector_store_id=document.vector_store.openai_vector_store_id,
                 file_id=document.openai_vector_store_file_id
             )
@@ -171,11 +196,12 @@ class OpenAIVectorStoreService:
             }
             
             if file_status.status in status_mapping:
-                document.status = status_mapping[file_status.status]
-                if file_status.status == 'completed':
+                new_status = status_mapping[file_status.status]
+                if new_status == 'completed' and document.status != 'completed':
                     document.processed_date = timezone.now()
-                elif file_status.status in ['failed', 'cancelled'] and file_status.last_error:
+                elif new_status == 'failed' and file_status.last_error:
                     document.error_message = str(file_status.last_error)
+                document.status = new_status
                 document.save()
             
             return file_status.model_dump()
@@ -195,8 +221,100 @@ class OpenAIVectorStoreService:
         except Exception as e:
             raise Exception(f"Failed to delete vector store: {str(e)}")
 
-    def process_document(self, document: Document, vector_store: VectorStore) -> Document:
+    def upload_replacement(self, document: Document) -> str:
+        """Upload a document's current file to OpenAI"""
+        with document.file.open('rb') as handle:
+            openai_file = self._client(60).files.create(
+                file=(document.file.name, handle.read(), document.content_type or 'application/octet-stream'),
+                purpose="assistants"
+            )
+        return openai_file.id
+
+    def attach_file(self, vector_store_id: str, file_id: str,
+                    attributes: Optional[Dict[str, Any]] = None) -> str:
+        options = {'attributes': attributes} if attributes else {}
+        vector_store_file = self._client(30).vector_stores.files.create(
+            vector_store_id=vector_store_id,
+            file_id=file_id,
+            **options
+        )
+        return vector_store_file.id
+
+    def vector_store_file_state(self, vector_store_id: str, vector_store_file_id: str):
+        vector_store_file = self._client(30).vector_stores.files.retrieve(
+            vector_store_id=vector_store_id,
+            file_id=vector_store_file_id
+        )
+        return vector_store_file.status, vector_store_file.last_error
+
+    def attach_files(self, vector_store_id: str, file_ids: List[str],
+                     attributes: Optional[Dict[str, Any]] = None) -> str:
+        options = {'attributes': attributes} if attributes else {}
+        batch = self._client(60).vector_stores.file_batches.create(
+            vector_store_id=vector_store_id,
+            file_ids=file_ids,
+            **options
+        )
+        return batch.id
+
+    def file_batch_state(self, vector_store_id: str, batch_id: str):
+        batch = self._client(30).vector_stores.file_batches.retrieve(
+            vector_store_id=vector_store_id,
+            batch_id=batch_id
+        )
+        failed = {}
+        if batch.status != 'in_progress' and batch.file_counts.failed:
+            files = self.client.vector_stores.file_batches.list_files(
+                vector_store_id=vector_store_id,
+                batch_id=batch_id,
+                filter='failed',
+                limit=self.list_page_size
+            )
+            failed = {item.id: str(item.last_error) for item in files}
+        return batch.status, failed
+
+    def detach_file(self, vector_store_id: str, file_id: str) -> bool:
+        """Remove a file from a vector store, keeping the file itself"""
+        from openai import NotFoundError
+        try:
+            self._client(30).vector_stores.files.delete(vector_store_id=vector_store_id, file_id=file_id)
+            return True
+        except NotFoundError:
+            return False
+
+    def delete_remote_vector_store(self, vector_store_id: str) -> bool:
+        """Delete a vector store from OpenAI only"""
+        from openai import NotFoundError
+        try:
+            self.client.vector_stores.delete(vector_store_id=vector_store_id)
+            return True
+        except NotFoundError:
+            return False
+
+    def delete_remote_file(self, file_id: str) -> bool:
+        """Delete a file from OpenAI, which also detaches it from its vector stores"""
+        from openai import NotFoundError
+        try:
+            self.client.files.delete(file_id)
+            return True
+        except NotFoundError:
+            return False
+
+    def list_remote_vector_stores(self):
+        """Yield pages of the account's vector stores"""
+        page = self.client.vector_stores.list(limit=self.list_page_size)
+        for current in page.iter_pages():
+            yield [{'id': item.id, 'created_at': item.created_at} for item in current.data]
+
+    def list_remote_files(self):
+        """Yield pages of the account's assistants files"""
+        page = self.client.files.list(purpose='assistants', limit=self.list_page_size)
+        for current in page.iter_pages():
+            yield [{'id': item.id, 'created_at': item.created_at} for item in current.data]
+
+    def ingest_document(self, document: Document, vector_store: VectorStore) -> Document:
         """Complete process: upload file to OpenAI and add to vector store"""
+        previous_file_id = document.openai_file_id
         try:
             # Upload file to OpenAI
             openai_file_id = self.upload_file_to_openai(document.file)
@@ -211,5 +329,9 @@ class OpenAIVectorStoreService:
         except Exception as e:
             document.status = 'failed'
             document.error_message = str(e)
+            if document.openai_file_id != previous_file_id:
+                # The upload went through but the document won't use it
+                queue_cleanup(file_ids=[document.openai_file_id])
+                document.openai_file_id = previous_file_id
             document.save()
             raise e
\ No newline at end of file
@@ -0,0 +1,88 @@
+"""
+Model signal handlers that keep per-process caches and rollups in step with the database
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from .hydration import forget_document
+from .models import Document, Query, VectorStore
+from .rollups import record_document, record_document_deleted, record_query
+from .stores import documents_changed_at, forget_store
+from .warmup import documents_changed
+
+
+def store_changed(pk, openai_id=None):
+    # Other processes are told only once they can read the change
+    forget_store(pk, openai_id, publish=False)
+    transaction.on_commit(lambda: forget_store(pk, openai_id))
+
+
+def swap_file_ids(instance):
+    # Deferred fields are left alone rather than loaded just for this
+    return instance.__dict__.get('pending_openai_file_id'), instance.__dict__.get('retired_openai_file_id')
+
+
+def document_changed(*file_ids):
+    forget_document(*file_ids, publish=False)
+    transaction.on_commit(lambda: forget_document(*file_ids))
+
+
+def corpus_changed(pk):
+    transaction.on_commit(lambda: documents_changed(pk))
+
+
+@receiver(post_init, sender=Document)
+def remember_file_id(sender, instance, **kwargs):
+    instance._cached_file_id = instance.__dict__.get('openai_file_id')
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Document)
+def document_saved(sender, instance, created, **kwargs):
+    document_changed(instance._cached_file_id, instance.openai_file_id, *swap_file_ids(instance))
+    previous_store = getattr(instance, '_saved_values', {}).get('vector_store_id', instance.vector_store_id)
+    was_searchable = not created and instance._loaded_status == 'completed'
+    searchable = instance.status == 'completed'
+    if created:
+        documents_changed_at(instance.vector_store_id)
+    if previous_store != instance.vector_store_id:
+        documents_changed_at(previous_store, instance.vector_store_id)
+        store_changed(previous_store)
+        store_changed(instance.vector_store_id)
+        if was_searchable:
+            corpus_changed(previous_store)
+        if searchable:
+            corpus_changed(instance.vector_store_id)
+    elif was_searchable != searchable:
+        store_changed(instance.vector_store_id)
+        corpus_changed(instance.vector_store_id)
+    elif searchable and instance._cached_file_id != instance.openai_file_id:
+        # Same document, new file (documents.reingest)
+        corpus_changed(instance.vector_store_id)
+    instance._cached_file_id = instance.openai_file_id
+    record_document(instance, None if created else instance._loaded_status, created)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Document)
+def document_deleted(sender, instance, origin=None, **kwargs):
+    document_changed(instance._cached_file_id, instance.openai_file_id, *swap_file_ids(instance))
+    record_document_deleted(instance, instance._loaded_status)
+    # A deleted store is forgotten once, not once per document
+    if not isinstance(origin, VectorStore):
+        documents_changed_at(instance.vector_store_id)
+    if instance._loaded_status == 'completed' and not isinstance(origin, VectorStore):
+        store_changed(instance.vector_store_id)
+        corpus_changed(instance.vector_store_id)
+
+
+@receiver(post_save, sender=VectorStore)
+@receiver(post_delete, sender=VectorStore)
+def vector_store_changed(sender, instance, **kwargs):
+    store_changed(instance.pk, instance.openai_vector_store_id)
+
+
+@receiver(post_save, sender=Query)
+def query_saved(sender, instance, created, **kwargs):
+    if created:
+        record_query(instance)
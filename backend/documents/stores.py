@@ -0,0 +1,135 @@
+"""
+Vector store metadata for the search path
+
+A search needs little about its store before calling upstream: the primary
+key, the OpenAI id, the status and how many documents are searchable. That
+comes from a per-process LRU of StoreMetadata, keyed by both ids, with a
+request-scoped identity map in front so one request resolves a store once
+and sees a single version of it.
+
+The process that changes a store, or a document's searchability, drops the
+entry through model signals (see documents.signals) and bumps the store's
+version stamp in the shared Django cache; other processes compare that
+stamp on every lookup. Entries are also reloaded after STORE_METADATA_TTL
+seconds, which bounds staleness when the cache isn't shared (LocMemCache).
+"""
+import contextvars
+import time
+import uuid
+from contextlib import contextmanager
+from typing import NamedTuple, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+from .cache import LRUCache, MISSING
+from .models import VectorStore
+
+VERSION_KEY = 'documents:store-version:{}'
+
+# ('pk', id) or ('openai', openai_vector_store_id) -> (StoreMetadata, version, loaded at)
+store_cache = LRUCache(settings.STORE_METADATA_CACHE_SIZE)
+_identity_map = contextvars.ContextVar('store_identity_map', default=None)
+
+
+class StoreMetadata(NamedTuple):
+    id: uuid.UUID
+    openai_vector_store_id: str
+    name: str
+    status: str
+    completed_documents: int
+
+
+def _keys(metadata: StoreMetadata):
+    return ('pk', str(metadata.id)), ('openai', metadata.openai_vector_store_id)
+
+
+def _load(**lookup) -> Optional[StoreMetadata]:
+    row = (
+        VectorStore.objects.filter(**lookup)
+        .annotate(completed_documents=Count('documents', filter=Q(documents__status='completed')))
+        .values_list(*StoreMetadata._fields)
+        .first()
+    )
+    return StoreMetadata(*row) if row else None
+
+
+def _version(pk):
+    return cache.get(VERSION_KEY.format(pk))
+
+
+def _cached(key) -> Optional[StoreMetadata]:
+    entry = store_cache.get(key)
+    if entry is MISSING:
+        return None
+    metadata, version, loaded_at = entry
+    if time.monotonic() - loaded_at > settings.STORE_METADATA_TTL or _version(metadata.id) != version:
+        return None
+    return metadata
+
+
+def _reload(key) -> Optional[StoreMetadata]:
+    loaded_at = time.monotonic()
+    kind, value = key
+    if kind == 'pk':
+        try:
+            pk = uuid.UUID(str(value))
+        except ValueError:
+            return None
+        # Stamp first: a change made meanwhile leaves the entry already stale
+        version = _version(pk)
+        metadata = _load(pk=pk)
+    else:
+        metadata = _load(openai_vector_store_id=value)
+        version = metadata and _version(metadata.id)
+    if metadata is not None:
+        for cache_key in _keys(metadata):
+            store_cache.set(cache_key, (metadata, version, loaded_at))
+    return metadata
+
+
+def get_store(pk=None, openai_id: Optional[str] = None) -> Optional[StoreMetadata]:
+    """Metadata of a vector store by primary key or OpenAI id, None if it doesn't exist"""
+    key = ('pk', str(pk)) if pk is not None else ('openai', openai_id)
+    identity_map = _identity_map.get()
+    if identity_map is not None and key in identity_map:
+        return identity_map[key]
+
+    metadata = _cached(key) or _reload(key)
+    if metadata is not None and identity_map is not None:
+        identity_map.update(dict.fromkeys(_keys(metadata), metadata))
+    return metadata
+
+
+def forget_store(pk, openai_id: Optional[str] = None, publish: bool = True) -> None:
+    """Drop a store's entries here and, with `publish`, make other processes reload it"""
+    keys = [('pk', str(pk))]
+    entry = store_cache.get(keys[0])
+    if entry is not MISSING:
+        keys.append(('openai', entry[0].openai_vector_store_id))
+    if openai_id:
+        keys.append(('openai', openai_id))
+    store_cache.delete(*keys)
+    if publish:
+        cache.set(VERSION_KEY.format(pk), uuid.uuid4().hex, None)
+
+
+def documents_changed_at(*pks) -> None:
+    """Stamp stores whose set of documents changed
+
+    The store list's validator reads this stamp instead of aggregating the
+    document table, which a document count would otherwise need.
+    """
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        VectorStore.objects.filter(pk__in=pks).update(documents_changed_at=timezone.now())
+
+
+@contextmanager
+def identity_map():
+    """Resolve each store at most once inside the block"""
+    token = _identity_map.set({})
+    try:
+        yield
+    finally:
+        _identity_map.reset(token)
@@ -0,0 +1,54 @@
+"""
+Fixtures shared by the documents tests.
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Keep uploaded files out of the project's media directory."""
+    settings.MEDIA_ROOT = tmp_path / 'media'
+    return settings.MEDIA_ROOT
+
+
+@pytest.fixture(autouse=True)
+def no_background_gc(settings):
+    """Queued upstream deletes are run by the tests that want them."""
+    settings.REMOTE_GC_BACKGROUND = False
+
+
+@pytest.fixture(autouse=True)
+def inline_flushes(settings):
+    """Write rollups at once, so no flush timer outlives its test."""
+    from documents import rollups
+
+    settings.ROLLUP_FLUSH_INTERVAL = 0
+    # Counts other tests left buffered
+    rollups._take()
+    yield
+    rollups._take()
+
+
+@pytest.fixture
+def api_client():
+    from rest_framework.test import APIClient
+    return APIClient()
+
+
+@pytest.fixture
+def store(db):
+    from documents.models import VectorStore
+    return VectorStore.objects.create(name='Store', openai_vector_store_id='vs_store', status='completed')
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Rolled back rows leave no signals behind, so cached metadata would outlive them."""
+    from django.core.cache import cache
+    from documents.hydration import document_cache
+    from documents.stores import store_cache
+
+    yield
+    cache.clear()
+    store_cache.clear()
+    document_cache.clear()
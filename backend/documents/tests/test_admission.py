@@ -0,0 +1,116 @@
+"""
+Admission control: per-store slots, fair order and load shedding.
+"""
+import threading
+import time
+
+import pytest
+
+from documents.admission import AdmissionClass, Overloaded, admit, get_class
+from documents.deadlines import DeadlineExceeded, deadline
+from documents.models import VectorStore
+
+
+def _queue(admission, store, granted):
+    """Start a call for store that records its turn, once it is queued"""
+    queued = sum(len(queue) for queue in admission.queues.values()) + 1
+
+    def call():
+        admission.acquire(store, shed=False)
+        granted.append(store)
+        admission.release(store, 0.01)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    while sum(len(queue) for queue in admission.queues.values()) < queued:
+        time.sleep(0.001)
+    return thread
+
+
+def test_one_store_cannot_take_every_slot():
+    admission = AdmissionClass('test', concurrency=2, per_store=1, budget=0.1)
+
+    admission.acquire('a')
+    admission.acquire('b')
+    assert admission.active == 2 and not admission.queues
+    admission.release('b', 0.01)
+    # A slot is free, but not for a
+    with pytest.raises(Overloaded):
+        admission.acquire('a')
+    admission.acquire('c')
+
+
+def test_freed_slots_go_to_stores_by_weight():
+    admission = AdmissionClass('test', concurrency=1, per_store=1, budget=5, weights={'a': 2})
+    admission.acquire('holder')
+    granted = []
+    threads = [_queue(admission, store, granted) for store in ('a', 'b', 'a', 'b', 'a', 'b')]
+
+    admission.release('holder', 0.01)
+    for thread in threads:
+        thread.join(5)
+    # a gets two turns for each of b's while both wait
+    assert granted == ['a', 'b', 'a', 'a', 'b', 'b']
+    assert admission.active == 0 and not admission.queues
+
+
+def test_calls_over_the_budget_are_refused_at_once():
+    admission = AdmissionClass('test', concurrency=1, per_store=1, budget=1)
+    admission.acquire('a')
+    admission.service_time = 10
+
+    started = time.monotonic()
+    with pytest.raises(Overloaded) as error:
+        admission.acquire('b')
+    assert error.value.wait == 10
+    assert time.monotonic() - started < 0.5
+    assert not admission.queues
+
+
+def test_queueing_stops_at_the_budget():
+    admission = AdmissionClass('test', concurrency=1, per_store=1, budget=0.1)
+    admission.acquire('a')
+
+    with pytest.raises(Overloaded) as error:
+        admission.acquire('b')
+    assert error.value.wait >= 1
+    assert not admission.queues
+
+
+def test_queueing_stops_at_the_deadline():
+    admission = AdmissionClass('test', concurrency=1, per_store=1, budget=5)
+    admission.acquire('a')
+
+    started = time.monotonic()
+    with deadline(0.1), pytest.raises(DeadlineExceeded):
+        admission.acquire('a')
+    assert time.monotonic() - started < 0.5
+    assert not admission.queues
+
+
+def test_admit_releases_on_errors(settings):
+    settings.ADMISSION_CLASSES = {'interactive': {'concurrency': 1, 'per_store': 1, 'budget': 0}}
+
+    with pytest.raises(ValueError):
+        with admit('interactive', 'a'):
+            raise ValueError
+    assert get_class('interactive').active == 0
+
+
+@pytest.mark.django_db
+def test_busy_store_answers_429_with_retry_after(api_client, settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    settings.ADMISSION_CLASSES = {'interactive': {'concurrency': 1, 'per_store': 1, 'budget': 1}}
+    store = VectorStore.objects.create(name='Busy', openai_vector_store_id='vs_busy')
+    admission = get_class('interactive')
+    admission.acquire(store.pk)
+    admission.service_time = 3
+
+    response = api_client.post(f'/api/vector-stores/{store.pk}/search/', {'query': 'hello'}, format='json')
+    assert response.status_code == 429
+    assert response['Retry-After'] == '3'
+    assert api_client.get(f'/api/vector-stores/{store.pk}/status/').status_code == 429
+
+    admission.release(store.pk, 0.01)
+    response = api_client.post(f'/api/vector-stores/{store.pk}/search/', {'query': 'hello'}, format='json')
+    assert response.status_code == 200
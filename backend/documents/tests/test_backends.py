@@ -0,0 +1,78 @@
+"""
+The vector store backend registry and the local backends.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+from django.conf import settings as django_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+
+from documents.backends import get_service
+from documents.local_service import FakeVectorStoreService, LocalVectorStoreService
+from documents.models import Document, Query, VectorStore
+
+
+def test_get_service_builds_one_instance_per_backend(settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+
+    service = get_service()
+    assert isinstance(service, LocalVectorStoreService)
+    assert get_service() is service
+    assert get_service('local') is service
+    assert isinstance(get_service('fake'), FakeVectorStoreService)
+
+
+def test_setting_change_rebuilds_services(settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    service = get_service()
+
+    settings.VECTOR_STORE_BACKENDS = {**django_settings.VECTOR_STORE_BACKENDS}
+    assert get_service() is not service
+
+
+def test_unknown_backend(settings):
+    settings.VECTOR_STORE_BACKEND = 'missing'
+
+    with pytest.raises(ImproperlyConfigured, match="Unknown vector store backend 'missing'"):
+        get_service()
+
+
+def test_loading_urls_imports_no_backend():
+    code = (
+        'import sys, django; django.setup(); import hermesai_backend.urls; '
+        'print(sorted(m for m in ("openai", "documents.services", "documents.alternative_service") '
+        'if m in sys.modules))'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        cwd=django_settings.BASE_DIR, env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'hermesai_backend.settings'},
+    )
+    assert result.stdout.strip() == '[]'
+
+
+@pytest.mark.django_db
+def test_local_backend_ingests_and_searches(settings, api_client):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    settings.DOCUMENT_EXTRACTION_ENABLED = False
+
+    response = api_client.post('/api/vector-stores/', {'name': 'Local'}, format='json')
+    assert response.status_code == 201
+    store = VectorStore.objects.get(pk=response.data['id'])
+    assert store.openai_vector_store_id.startswith('local_vs_')
+
+    document = Document.objects.create(
+        title='Quarterly report', vector_store=store, file=ContentFile(b'numbers', name='report.txt'), file_size=7,
+    )
+    get_service().process_document(document, store)
+    document.refresh_from_db()
+    assert document.status == 'completed'
+    assert document.openai_file_id.startswith('local_file_')
+
+    response = api_client.post(f'/api/vector-stores/{store.pk}/search/', {'query': 'quarterly'}, format='json')
+    assert response.status_code == 200
+    hits = response.data['results']['data']
+    assert [hit['file_id'] for hit in hits] == [document.openai_file_id]
+    assert Query.objects.filter(vector_store=store).count() == 1
@@ -0,0 +1,161 @@
+"""
+The import_documents command: sources, checkpoints and resuming.
+"""
+import io
+import json
+import tarfile
+import zipfile
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from documents.bulk_import import Checkpoint, open_source
+from documents.models import Document
+
+FILES = {
+    'a.txt': b'alpha ' * 20,
+    'nested/b.md': b'# beta\n\nsome text',
+    'nested/deeper/c.csv': b'x,y\n1,2\n',
+}
+IGNORED = {
+    '.hidden.txt': b'secret',
+    '__MACOSX/a.txt': b'clutter',
+    'tool.exe': b'MZ',
+}
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'source'
+    for name, body in {**FILES, **IGNORED}.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+    return root
+
+
+@pytest.fixture(autouse=True)
+def local_backend(settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    settings.DOCUMENT_EXTRACTION_ENABLED = False
+
+
+def _import(source, store, checkpoint, *args):
+    out = io.StringIO()
+    # One ingest thread: the in-memory test database locks whole tables against concurrent writers
+    call_command(
+        'import_documents', str(source), '--vector-store', str(store.pk), '--checkpoint', str(checkpoint),
+        '--workers', '1', *args, stdout=out,
+    )
+    return out.getvalue()
+
+
+def _records(checkpoint):
+    return [json.loads(line) for line in checkpoint.read_text().splitlines()]
+
+
+def test_source_files_skip_hidden_entries(tree):
+    files = sorted(open_source(str(tree)).files())
+    assert [(entry.key, entry.size) for entry in files] == sorted(
+        [(key, len(body)) for key, body in FILES.items()] + [('tool.exe', 2)]
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_import_a_directory_and_run_it_again(tree, store, tmp_path):
+    checkpoint = tmp_path / 'import.jsonl'
+
+    out = _import(tree, store, checkpoint, '--attributes', '{"source": "share"}')
+    assert '3 files to import' in out and '1 rejected by type or size' in out
+    assert 'Done: 3 imported, 0 failed' in out
+    documents = Document.objects.filter(vector_store=store)
+    assert sorted(documents.values_list('title', flat=True)) == ['a', 'b', 'c']
+    assert all(document.status == 'completed' for document in documents)
+    assert all(document.attributes == {'source': 'share'} for document in documents)
+    with documents.get(title='b').file.open('rb') as handle:
+        assert handle.read() == FILES['nested/b.md']
+    states = {record['key']: record['state'] for record in _records(checkpoint)}
+    assert states == {key: 'done' for key in FILES}
+
+    out = _import(tree, store, checkpoint)
+    assert '0 files to import' in out and '3 already imported' in out
+    assert documents.count() == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_resume_reuses_created_documents(tree, store, tmp_path):
+    checkpoint = tmp_path / 'import.jsonl'
+    _import(tree, store, checkpoint)
+    document = Document.objects.get(title='a')
+    Document.objects.filter(pk=document.pk).update(status='uploading')
+    # Interrupted after the row was created, with a line torn by the crash
+    lines = [line for line in checkpoint.read_text().splitlines() if '"a.txt"' not in line]
+    lines.append(json.dumps({'key': 'a.txt', 'state': 'created', 'document': str(document.pk)}))
+    checkpoint.write_text('\n'.join(lines) + '\n{"key": "nested/b.md", "sta')
+
+    out = _import(tree, store, checkpoint)
+    assert '1 files to import' in out and '2 already imported' in out
+    assert Document.objects.filter(vector_store=store).count() == 3
+    document.refresh_from_db()
+    assert document.status == 'completed'
+    assert Checkpoint(str(checkpoint)).states['a.txt']['state'] == 'done'
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize('kind', ['zip', 'tar.gz'])
+def test_import_an_archive(tree, store, tmp_path, kind):
+    archive = tmp_path / f'source.{kind}'
+    if kind == 'zip':
+        with zipfile.ZipFile(archive, 'w') as handle:
+            for name in {**FILES, **IGNORED}:
+                handle.write(tree / name, name)
+    else:
+        with tarfile.open(archive, 'w:gz') as handle:
+            handle.add(tree, arcname='.')
+
+    out = _import(archive, store, tmp_path / 'import.jsonl')
+    assert 'Done: 3 imported, 0 failed' in out
+    assert sorted(Document.objects.filter(vector_store=store).values_list('title', flat=True)) == ['a', 'b', 'c']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_content_that_does_not_match_its_extension_is_skipped(tmp_path, store):
+    source = tmp_path / 'source'
+    source.mkdir()
+    (source / 'fake.pdf').write_bytes(b'<html>not a pdf</html>')
+    (source / 'real.txt').write_bytes(b'text')
+    checkpoint = tmp_path / 'import.jsonl'
+
+    out = _import(source, store, checkpoint)
+    assert 'Done: 1 imported, 1 failed' in out
+    assert Checkpoint(str(checkpoint)).states['fake.pdf']['state'] == 'skipped'
+    assert list(Document.objects.filter(vector_store=store).values_list('title', flat=True)) == ['real']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_dry_run_creates_nothing(tree, store, tmp_path):
+    checkpoint = tmp_path / 'import.jsonl'
+
+    out = _import(tree, store, checkpoint, '--dry-run')
+    assert 'Dry run: 3 files' in out
+    assert not Document.objects.exists()
+    assert not checkpoint.exists()
+
+
+@pytest.mark.django_db
+def test_unknown_store(tree):
+    with pytest.raises(CommandError):
+        call_command('import_documents', str(tree), '--vector-store', '00000000-0000-0000-0000-000000000000')
+
+
+def test_checkpoint_skips_torn_lines(tmp_path):
+    path = tmp_path / 'import.jsonl'
+    path.write_text('{"key": "a", "state": "done"}\n{"key": "b", "state": "created"}\n{"key": "b", "sta')
+
+    checkpoint = Checkpoint(str(path))
+    assert {key: record['state'] for key, record in checkpoint.states.items()} == {'a': 'done', 'b': 'created'}
+    checkpoint.record('b', 'done')
+    checkpoint.close()
+    assert [json.loads(line)['state'] for line in path.read_text().splitlines()[-1:]] == ['done']
+    assert Checkpoint(str(path)).states['b']['state'] == 'done'
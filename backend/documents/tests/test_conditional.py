@@ -0,0 +1,112 @@
+"""
+ETag and Last-Modified validators on list and detail endpoints.
+"""
+import pytest
+
+from documents.models import Document, Query, VectorStore
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def document(store):
+    return Document.objects.create(
+        title='Doc', vector_store=store, file='documents/doc.txt', status='completed', openai_file_id='file-1',
+    )
+
+
+def _status(api_client, url, **headers):
+    return api_client.get(url, **headers).status_code
+
+
+def test_unchanged_lists_answer_304(api_client, store, document):
+    response = api_client.get('/api/documents/')
+    etag = response['ETag']
+    assert response['Cache-Control'] == 'private, no-cache'
+    assert response.has_header('Last-Modified')
+
+    assert _status(api_client, '/api/documents/', HTTP_IF_NONE_MATCH=etag) == 304
+    assert _status(api_client, '/api/documents/', HTTP_IF_NONE_MATCH=f'W/{etag}') == 304
+    # Another filter is another list
+    assert _status(api_client, f'/api/documents/?vector_store={store.pk}', HTTP_IF_NONE_MATCH=etag) == 200
+    # Lists can lose rows without a newer timestamp
+    assert _status(api_client, '/api/documents/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']) == 200
+
+
+def test_list_etags_follow_updates_and_deletes(api_client, store, document):
+    etag = api_client.get('/api/documents/')['ETag']
+    document.title = 'Renamed'
+    document.save()
+    assert _status(api_client, '/api/documents/', HTTP_IF_NONE_MATCH=etag) == 200
+
+    other = Document.objects.create(title='Other', vector_store=store, file='documents/other.txt')
+    etag = api_client.get('/api/documents/')['ETag']
+    other.delete()
+    assert _status(api_client, '/api/documents/', HTTP_IF_NONE_MATCH=etag) == 200
+
+
+def test_store_list_follows_its_documents(api_client, store):
+    other = VectorStore.objects.create(name='Other', openai_vector_store_id='vs_other')
+    etag = api_client.get('/api/vector-stores/')['ETag']
+    assert _status(api_client, '/api/vector-stores/', HTTP_IF_NONE_MATCH=etag) == 304
+
+    document = Document.objects.create(title='Doc', vector_store=store, file='documents/doc.txt')
+    response = api_client.get('/api/vector-stores/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    etag = response['ETag']
+    # A document's own fields are not part of the store list
+    document.title = 'Renamed'
+    document.save()
+    assert _status(api_client, '/api/vector-stores/', HTTP_IF_NONE_MATCH=etag) == 304
+
+    document.vector_store = other
+    document.save()
+    response = api_client.get('/api/vector-stores/', HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    etag = response['ETag']
+    document.delete()
+    assert _status(api_client, '/api/vector-stores/', HTTP_IF_NONE_MATCH=etag) == 200
+
+
+def test_details_answer_304_by_etag_or_date(api_client, store, document):
+    url = f'/api/documents/{document.pk}/'
+    response = api_client.get(url)
+
+    assert _status(api_client, url, HTTP_IF_NONE_MATCH=response['ETag']) == 304
+    assert _status(api_client, url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']) == 304
+    assert _status(api_client, '/api/documents/00000000-0000-0000-0000-000000000000/') == 404
+
+    url = f'/api/vector-stores/{store.pk}/'
+    etag = api_client.get(url)['ETag']
+    assert _status(api_client, url, HTTP_IF_NONE_MATCH=etag) == 304
+    Document.objects.create(title='Other', vector_store=store, file='documents/other.txt')
+    assert _status(api_client, url, HTTP_IF_NONE_MATCH=etag) == 200
+
+
+def test_queries_follow_the_documents_they_show(api_client, store, document):
+    query = Query.objects.create(vector_store=store, query_text='hello', response={'data': [{'file_id': 'file-1'}]})
+    url = f'/api/queries/{query.pk}/'
+    response = api_client.get(url)
+    assert response.data['response']['data'][0]['document']['title'] == 'Doc'
+    assert _status(api_client, url, HTTP_IF_NONE_MATCH=response['ETag']) == 304
+
+    document.title = 'Renamed'
+    document.save()
+    assert _status(api_client, url, HTTP_IF_NONE_MATCH=response['ETag']) == 200
+
+    etag = api_client.get('/api/queries/')['ETag']
+    assert _status(api_client, '/api/queries/', HTTP_IF_NONE_MATCH=etag) == 304
+
+
+def test_searches_and_compressed_lists_keep_their_etags(api_client, store, document, settings):
+    settings.RESPONSE_COMPRESSION_MIN_SIZE = 1024
+    etag = api_client.get('/api/documents/?search=doc')['ETag']
+    assert _status(api_client, '/api/documents/?search=doc', HTTP_IF_NONE_MATCH=etag) == 304
+
+    for i in range(60):
+        Document.objects.create(title=f'document number {i}', vector_store=store, file=f'documents/doc{i}.txt')
+    response = api_client.get('/api/documents/', HTTP_ACCEPT_ENCODING='gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    assert _status(
+        api_client, '/api/documents/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'],
+    ) == 304
@@ -0,0 +1,199 @@
+"""
+Per-request deadlines for queries, outbound calls and whole requests.
+"""
+import http.server
+import threading
+import time
+
+import pytest
+from django.db import connections
+from django.test import RequestFactory
+
+from documents.deadlines import (
+    DatabaseDeadline, DeadlineExceeded, DeadlineSession, call_timeout, deadline, remaining, request_budget,
+)
+from documents.local_service import LocalVectorStoreService
+from documents.models import VectorStore
+
+# The wrapper keys its state by connection, which the proxy can't be
+connection = connections['default']
+# Counts to a hundred million, long enough to be cut off
+SLOW_QUERY = 'WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 100000000) SELECT count(*) FROM c'
+
+
+def _slow_query():
+    with connection.cursor() as cursor:
+        cursor.execute(SLOW_QUERY)
+
+
+def test_request_budget_by_endpoint_and_header():
+    factory = RequestFactory()
+    search = '/api/vector-stores/1/search/'
+
+    assert request_budget(factory.post(search)) == 15
+    assert request_budget(factory.post(search, HTTP_X_REQUEST_TIMEOUT='2.5')) == 2.5
+    # Clients can ask for less, never for more
+    assert request_budget(factory.post(search, HTTP_X_REQUEST_TIMEOUT='99')) == 15
+    assert request_budget(factory.post(search, HTTP_X_REQUEST_TIMEOUT='soon')) == 15
+    assert request_budget(factory.get('/api/queries/')) == 30
+    assert request_budget(factory.get('/nowhere')) == 30
+    # Only uploads get the long budget, not the list
+    assert request_budget(factory.post('/api/documents/')) == 300
+    assert request_budget(factory.get('/api/documents/')) == 30
+
+
+def test_inner_deadlines_cannot_extend_outer_ones():
+    with deadline(10):
+        with deadline(100):
+            assert remaining() <= 10
+        with deadline(1):
+            assert remaining() <= 1
+    assert remaining() is None
+
+
+def test_call_timeout():
+    assert call_timeout(5) == 5
+    with deadline(1):
+        assert call_timeout(5) <= 1
+        assert call_timeout() <= 1
+    with deadline(0), pytest.raises(DeadlineExceeded):
+        call_timeout(5)
+
+
+@pytest.mark.django_db
+def test_sqlite_queries_are_cut_off():
+    with DatabaseDeadline.installed(), deadline(0.2):
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            _slow_query()
+        assert time.monotonic() - started < 1
+        # Refused outright once time is up
+        with pytest.raises(DeadlineExceeded):
+            VectorStore.objects.count()
+    # The progress handler is gone with the deadline
+    assert VectorStore.objects.count() == 0
+
+
+@pytest.mark.django_db
+def test_reopened_connections_are_watched_too():
+    with DatabaseDeadline.installed() as watcher, deadline(0.5):
+        VectorStore.objects.count()
+        assert watcher.sqlite[connection] is connection.connection
+        # As if the handler had been set on a connection closed since
+        watcher.sqlite[connection] = object()
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            _slow_query()
+        assert time.monotonic() - started < 1
+        assert watcher.sqlite[connection] is connection.connection
+
+
+class FakeCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+
+class FakePostgres:
+    """A PostgreSQL connection recording what it is sent"""
+
+    vendor = 'postgresql'
+    alias = 'default'
+
+    def __init__(self, pooled=False, in_atomic_block=False):
+        self.settings_dict = {'DISABLE_SERVER_SIDE_CURSORS': pooled}
+        self.in_atomic_block = in_atomic_block
+        self.statements = []
+        self.run_on_commit = []
+        self.connection = self
+
+    def cursor(self):
+        return FakeCursor(self.statements)
+
+
+def test_postgres_timeout_is_set_once_per_request():
+    postgres = FakePostgres()
+    watcher = DatabaseDeadline()
+    execute = lambda *args: None
+
+    with deadline(10):
+        for _ in range(3):
+            watcher(execute, 'SELECT 1', None, False, {'connection': postgres})
+        assert len(postgres.statements) == 1
+        assert "set_config('statement_timeout', %s, false)" in postgres.statements[0]
+        # Inside a transaction the session timeout already applies
+        postgres.in_atomic_block = True
+        watcher(execute, 'SELECT 1', None, False, {'connection': postgres})
+        assert len(postgres.statements) == 1
+    watcher.close()
+    assert postgres.statements[-1] == 'RESET statement_timeout'
+
+
+def test_postgres_timeout_is_set_once_per_transaction_when_pooled():
+    postgres = FakePostgres(pooled=True, in_atomic_block=True)
+    watcher = DatabaseDeadline()
+    execute = lambda *args: None
+
+    with deadline(10):
+        watcher(execute, 'SELECT 1', None, False, {'connection': postgres})
+        watcher(execute, 'SELECT 1', None, False, {'connection': postgres})
+        assert len(postgres.statements) == 1
+        assert "set_config('statement_timeout', %s, true)" in postgres.statements[0]
+        # A commit starts a new transaction, which needs its own
+        postgres.run_on_commit = []
+        watcher(execute, 'SELECT 1', None, False, {'connection': postgres})
+        assert len(postgres.statements) == 2
+
+
+class SlowHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(1)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.shutdown()
+
+
+def test_outbound_calls_stop_at_the_deadline(slow_server):
+    session = DeadlineSession()
+
+    with deadline(0.2):
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            session.get(slow_server, timeout=30)
+        assert time.monotonic() - started < 0.8
+    assert session.get(slow_server, timeout=5).status_code == 200
+
+
+@pytest.mark.django_db
+def test_slow_search_answers_504(api_client, settings, monkeypatch):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    store = VectorStore.objects.create(name='Slow', openai_vector_store_id='vs_slow')
+    url = f'/api/vector-stores/{store.pk}/search/'
+    with monkeypatch.context() as patch:
+        patch.setattr(LocalVectorStoreService, 'find_matches', lambda *args, **kwargs: _slow_query())
+
+        started = time.monotonic()
+        response = api_client.post(url, {'query': 'hello'}, format='json', HTTP_X_REQUEST_TIMEOUT='0.3')
+        assert response.status_code == 504
+        assert time.monotonic() - started < 2
+
+    assert api_client.post(url, {'query': 'hello'}, format='json').status_code == 200
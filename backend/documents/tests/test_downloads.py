@@ -0,0 +1,132 @@
+"""
+Document downloads: byte ranges, validators and sendfile hand-offs.
+"""
+import pytest
+from django.core.files.base import ContentFile
+
+from documents.downloads import RangeNotSatisfiable, parse_range
+from documents.models import Document, VectorStore
+
+BODY = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def document(db):
+    store = VectorStore.objects.create(name='Files', openai_vector_store_id='vs_files')
+    return Document.objects.create(
+        title='Data', vector_store=store, file=ContentFile(BODY, name='data.bin'), file_size=len(BODY),
+    )
+
+
+def _url(document, action='download'):
+    return f'/api/documents/{document.pk}/{action}/'
+
+
+def _body(response):
+    return b''.join(response.streaming_content)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=1000-', (1000, 1023)),
+    ('bytes=-24', (1000, 1023)),
+    ('bytes=-5000', (0, 1023)),
+    ('bytes=10-5000', (10, 1023)),
+    ('bytes=0-1,5-6', None),
+    ('items=0-1', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=1024-', 'bytes=20-10', 'bytes=-0'])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1024)
+
+
+def test_download_whole_file(api_client, document):
+    response = api_client.get(_url(document))
+
+    assert response.status_code == 200
+    assert _body(response) == BODY
+    assert response['Accept-Ranges'] == 'bytes'
+    assert response['Content-Disposition'].startswith('attachment')
+    assert response['ETag'] and response['Last-Modified']
+
+
+def test_preview_is_inline(api_client, document):
+    response = api_client.get(_url(document, 'preview'))
+
+    assert response.status_code == 200
+    assert response['Content-Disposition'].startswith('inline')
+
+
+def test_download_byte_range(api_client, document):
+    response = api_client.get(_url(document), HTTP_RANGE='bytes=100-199')
+
+    assert response.status_code == 206
+    assert _body(response) == BODY[100:200]
+    assert response['Content-Length'] == '100'
+    assert response['Content-Range'] == f'bytes 100-199/{len(BODY)}'
+
+
+def test_download_suffix_range(api_client, document):
+    response = api_client.get(_url(document), HTTP_RANGE='bytes=-10')
+
+    assert response.status_code == 206
+    assert _body(response) == BODY[-10:]
+
+
+def test_range_past_the_end_is_416(api_client, document):
+    response = api_client.get(_url(document), HTTP_RANGE=f'bytes={len(BODY)}-')
+
+    assert response.status_code == 416
+    assert response['Content-Range'] == f'bytes */{len(BODY)}'
+
+
+def test_stale_if_range_sends_the_whole_file(api_client, document):
+    response = api_client.get(_url(document), HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+
+    assert response.status_code == 200
+    assert _body(response) == BODY
+
+
+def test_matching_if_range_sends_the_range(api_client, document):
+    etag = api_client.get(_url(document))['ETag']
+
+    response = api_client.get(_url(document), HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+    assert response.status_code == 206
+    assert _body(response) == BODY[:10]
+
+
+def test_if_none_match_is_304(api_client, document):
+    first = api_client.get(_url(document))
+
+    response = api_client.get(_url(document), HTTP_IF_NONE_MATCH=first['ETag'])
+    assert response.status_code == 304
+    assert response['ETag'] == first['ETag']
+    assert api_client.get(_url(document), HTTP_IF_NONE_MATCH='"other"').status_code == 200
+
+
+def test_if_modified_since_is_304(api_client, document):
+    first = api_client.get(_url(document))
+
+    response = api_client.get(_url(document), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+    assert response.status_code == 304
+
+
+def test_nginx_sendfile(api_client, document, settings):
+    settings.DOCUMENT_SENDFILE_BACKEND = 'nginx'
+    settings.DOCUMENT_SENDFILE_URL = '/protected/'
+
+    response = api_client.get(_url(document))
+    assert response.status_code == 200
+    assert response['X-Accel-Redirect'] == f'/protected/{document.file.name}'
+    assert response.content == b''
+
+
+def test_missing_file_is_404(api_client, document):
+    document.file.storage.delete(document.file.name)
+
+    assert api_client.get(_url(document)).status_code == 404
@@ -0,0 +1,152 @@
+"""
+Text extractors and the local extraction stage.
+"""
+import zipfile
+
+import bs4
+import pytest
+from django.core.files.base import ContentFile
+
+from documents import extractors
+from documents.extraction import extract_documents
+from documents.models import Document, DocumentChunk
+
+
+def _lines(count):
+    return ''.join(f'line {i:05d} ' + 'x' * 40 + '\n' for i in range(count))
+
+
+def _docx(path, paragraphs):
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>',
+        )
+    return str(path)
+
+
+def test_detect_kind():
+    assert extractors.detect_kind('report.PDF') == 'pdf'
+    assert extractors.detect_kind('page', 'text/html; charset=utf-8') == 'html'
+    assert extractors.detect_kind('notes', 'text/x-rst') == 'text'
+    assert extractors.detect_kind('blob.bin', 'application/octet-stream') is None
+
+
+def test_text_pages_hold_every_line_once(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text(_lines(1000))
+    pages = extractors.page_count(str(path), 'text')
+    assert pages > 2
+
+    texts = [text for _, text in extractors._text_pages(str(path), 0, pages)]
+    assert ''.join(texts) == path.read_text()
+    assert all(text.endswith('\n') for text in texts)
+
+
+def test_windows_match_a_whole_file_extraction(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text(_lines(1000).replace('\n', '\n\n'))
+    pages = extractors.page_count(str(path), 'text')
+
+    whole = extractors.extract_window(str(path), 'text', 0, pages, 200, 'cl100k_base')
+    windowed = [
+        page
+        for start in range(0, pages, 2)
+        for page in extractors.extract_window(str(path), 'text', start, min(start + 2, pages), 200, 'cl100k_base')
+    ]
+    assert windowed == whole
+    assert all(0 < tokens <= 200 for _, chunks in whole for _, tokens in chunks)
+
+
+def test_split_chunks_keeps_paragraphs_together():
+    text = 'alpha beta\n\ngamma delta\n\n' + 'word ' * 500
+
+    chunks = extractors.split_chunks(text, 50)
+    assert chunks[0][0] == 'alpha beta\n\ngamma delta'
+    assert len(chunks) > 2
+    assert all(tokens <= 50 for _, tokens in chunks)
+
+
+def test_whole_file_parses_are_reused_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / 'page.html'
+    path.write_text('<html><body><p>first</p><script>skip()</script><p>second</p></body></html>')
+    calls = []
+
+    class CountingSoup(bs4.BeautifulSoup):
+        def __init__(self, *args, **kwargs):
+            calls.append(1)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(bs4, 'BeautifulSoup', CountingSoup)
+
+    assert extractors.page_count(str(path), 'html') == 1
+    assert extractors.extract_window(str(path), 'html', 0, 1, 100, 'cl100k_base')[0][1][0][0] == 'first\n\nsecond'
+    assert len(calls) == 1
+
+    path.write_text('<html><body><p>changed text</p></body></html>')
+    assert extractors.extract_window(str(path), 'html', 0, 1, 100, 'cl100k_base')[0][1][0][0] == 'changed text'
+    assert len(calls) == 2
+
+
+def test_docx_pages_group_paragraphs(tmp_path, monkeypatch):
+    monkeypatch.setattr(extractors, 'DOCX_PARAGRAPHS_PER_PAGE', 2)
+    path = _docx(tmp_path / 'memo.docx', ['one', 'two', 'three'])
+
+    assert extractors.page_count(path, 'docx') == 2
+    pages = extractors.extract_window(path, 'docx', 1, 2, 100, 'cl100k_base')
+    assert pages == [(1, [('three', extractors.count_tokens('three'))])]
+
+
+def test_broken_docx_is_unsupported(tmp_path):
+    path = tmp_path / 'broken.docx'
+    path.write_bytes(b'not a zip')
+
+    with pytest.raises(extractors.UnsupportedDocument):
+        extractors.page_count(str(path), 'docx')
+
+
+def test_extract_documents_stores_chunks_and_tokens(store):
+    document = Document.objects.create(
+        title='Notes', vector_store=store, file=ContentFile(b'hello there\n\ngeneral text', name='notes.txt'),
+    )
+
+    extract_documents([document])
+
+    document.refresh_from_db()
+    assert document.extraction_status == 'completed'
+    assert document.page_count == 1
+    assert document.extracted_pages == 1
+    chunks = list(document.chunks.values_list('page_number', 'text'))
+    assert chunks == [(1, 'hello there\n\ngeneral text')]
+    assert document.token_count == sum(document.chunks.values_list('token_count', flat=True))
+
+
+def test_extract_documents_resumes_after_stored_pages(store, settings):
+    settings.DOCUMENT_EXTRACTION_WINDOW_PAGES = 1
+    document = Document.objects.create(
+        title='Long', vector_store=store, file=ContentFile(_lines(1000).encode(), name='long.txt'),
+        extraction_status='extracting', extracted_pages=1,
+    )
+    DocumentChunk.objects.create(document=document, page_number=1, index=0, text='kept', token_count=1)
+
+    extract_documents([document])
+
+    document.refresh_from_db()
+    assert document.extraction_status == 'completed'
+    assert document.extracted_pages == document.page_count > 2
+    assert document.chunks.get(page_number=1).text == 'kept'
+    assert set(document.chunks.values_list('page_number', flat=True)) == set(range(1, document.page_count + 1))
+
+
+def test_unknown_files_are_unsupported(store):
+    document = Document.objects.create(
+        title='Blob', vector_store=store, file=ContentFile(b'\x00\x01', name='blob.bin'),
+    )
+
+    extract_documents([document])
+
+    document.refresh_from_db()
+    assert document.extraction_status == 'unsupported'
+    assert not document.chunks.exists()
@@ -0,0 +1,205 @@
+"""
+Attribute filters: validation, and agreement between the local and upstream forms.
+"""
+import operator
+
+import pytest
+from django.core.files.base import ContentFile
+
+from documents.alternative_service import AlternativeOpenAIService
+from documents.filters import (
+    MAX_DEPTH, MAX_UPSTREAM_ATTRIBUTES, FilterError, to_openai, to_q, upstream_attributes, validate_filter,
+)
+from documents.models import Document, VectorStore
+
+OPERATORS = {
+    'eq': operator.eq, 'ne': operator.ne, 'gt': operator.gt, 'gte': operator.ge, 'lt': operator.lt, 'lte': operator.le,
+}
+
+ATTRIBUTES = [
+    {'kind': 'contract', 'year': 2021, 'region': 'eu', 'signed': True},
+    {'kind': 'contract', 'year': 2023, 'region': 'us', 'signed': False},
+    {'kind': 'invoice', 'year': 2023, 'region': 'eu', 'signed': True},
+    {'kind': 'invoice', 'year': 2024, 'region': 'apac', 'signed': False},
+    {'kind': 'memo', 'year': 2019, 'region': 'us', 'signed': False},
+    {'year': 2022, 'signed': True},
+]
+
+FILTERS = [
+    {'type': 'eq', 'key': 'kind', 'value': 'contract'},
+    {'type': 'ne', 'key': 'region', 'value': 'eu'},
+    {'type': 'gte', 'key': 'year', 'value': 2023},
+    {'type': 'lt', 'key': 'year', 'value': 2021},
+    {'type': 'eq', 'key': 'signed', 'value': True},
+    {'type': 'in', 'key': 'region', 'values': ['eu', 'apac']},
+    {'type': 'in', 'key': 'year', 'values': [2019]},
+    {'type': 'nin', 'key': 'kind', 'values': ['memo', 'invoice']},
+    {'type': 'range', 'key': 'year', 'gte': 2020, 'lt': 2024},
+    {'type': 'range', 'key': 'year', 'gt': 2023},
+    {'type': 'and', 'filters': [
+        {'type': 'eq', 'key': 'kind', 'value': 'invoice'},
+        {'type': 'or', 'filters': [
+            {'type': 'eq', 'key': 'region', 'value': 'eu'},
+            {'type': 'gt', 'key': 'year', 'value': 2023},
+        ]},
+    ]},
+    {'type': 'or', 'filters': [
+        {'type': 'nin', 'key': 'region', 'values': ['us', 'eu']},
+        {'type': 'range', 'key': 'year', 'lte': 2019},
+    ]},
+]
+
+
+def _upstream_match(data, attributes):
+    """How OpenAI evaluates a filter in its own shape"""
+    if data['type'] == 'and':
+        return all(_upstream_match(part, attributes) for part in data['filters'])
+    if data['type'] == 'or':
+        return any(_upstream_match(part, attributes) for part in data['filters'])
+    if data['key'] not in attributes:
+        # A missing attribute is unequal to anything and compares as nothing else
+        return data['type'] == 'ne'
+    return OPERATORS[data['type']](attributes[data['key']], data['value'])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('data', FILTERS)
+def test_local_and_upstream_filters_agree(data):
+    store = VectorStore.objects.create(name='Filters', openai_vector_store_id='vs_filters')
+    documents = [
+        Document.objects.create(title=f'doc{i}', vector_store=store, file=f'documents/doc{i}.txt', attributes=attributes)
+        for i, attributes in enumerate(ATTRIBUTES)
+    ]
+    normalized = validate_filter(data)
+
+    local = set(Document.objects.filter(vector_store=store).filter(to_q(normalized)).values_list('title', flat=True))
+    upstream = {document.title for document in documents if _upstream_match(to_openai(normalized), document.attributes)}
+    assert local == upstream
+
+
+def test_set_and_range_filters_use_upstream_operators():
+    assert to_openai(validate_filter({'type': 'in', 'key': 'year', 'values': [2023]})) == {
+        'type': 'eq', 'key': 'year', 'value': 2023,
+    }
+    assert to_openai(validate_filter({'type': 'nin', 'key': 'year', 'values': [1, 2]})) == {
+        'type': 'and', 'filters': [
+            {'type': 'ne', 'key': 'year', 'value': 1},
+            {'type': 'ne', 'key': 'year', 'value': 2},
+        ],
+    }
+    assert to_openai(validate_filter({'type': 'range', 'key': 'year', 'lt': 5})) == {
+        'type': 'lt', 'key': 'year', 'value': 5,
+    }
+
+
+def _nested(depth):
+    data = {'type': 'eq', 'key': 'kind', 'value': 'memo'}
+    for _ in range(depth):
+        data = {'type': 'and', 'filters': [data]}
+    return data
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'type': 'eq', 'key': 'a__b', 'value': 1}, 'Invalid attribute key'),
+    ({'type': 'eq', 'key': '', 'value': 1}, 'Invalid attribute key'),
+    ({'type': 'eq', 'key': 'kind', 'value': ['x']}, 'must be strings, numbers or booleans'),
+    ({'type': 'in', 'key': 'kind', 'values': []}, 'needs a list'),
+    ({'type': 'in', 'key': 'kind', 'values': list(range(101))}, 'needs a list'),
+    ({'type': 'range', 'key': 'year'}, 'at least one of'),
+    ({'type': 'or', 'filters': []}, 'non-empty list'),
+    ({'type': 'like', 'key': 'kind', 'value': 'x'}, 'Unknown filter type'),
+    ('kind=memo', 'must be an object'),
+    (_nested(MAX_DEPTH + 1), 'nested at most'),
+])
+def test_invalid_filters(data, message):
+    with pytest.raises(FilterError, match=message):
+        validate_filter(data)
+
+
+def test_validation_drops_unknown_fields():
+    assert validate_filter({'type': 'eq', 'key': 'kind', 'value': 'memo', 'extra': 1}) == {
+        'type': 'eq', 'key': 'kind', 'value': 'memo',
+    }
+    assert validate_filter(_nested(MAX_DEPTH))
+
+
+def test_upstream_attributes_keep_what_openai_accepts():
+    attributes = {'note': 'x' * 600, 'tags': ['a'], 'nested': {'a': 1}, 'count': 3, 'flag': False}
+    attributes.update({f'k{i}': i for i in range(20)})
+
+    result = upstream_attributes(attributes)
+    assert len(result) == MAX_UPSTREAM_ATTRIBUTES
+    assert len(result['note']) == 512
+    assert 'tags' not in result and 'nested' not in result
+    assert result['flag'] is False
+
+
+class RecordingHttpService(AlternativeOpenAIService):
+    """HTTP backend that records search bodies instead of sending them"""
+
+    searches = []
+
+    def __init__(self):
+        self.base_url = 'https://upstream.invalid/v1'
+        self.headers = {}
+        self.vector_store_headers = {}
+
+    def _post_search(self, vector_store_id, data):
+        self.searches.append(data)
+        return {'object': 'vector_store.search_results.page', 'search_query': data['query'], 'data': [],
+                'has_more': False, 'next_page': None}
+
+
+@pytest.fixture
+def http_store(db, settings):
+    settings.VECTOR_STORE_BACKENDS = {'recording': 'documents.tests.test_filters.RecordingHttpService'}
+    settings.VECTOR_STORE_BACKEND = 'recording'
+    settings.SEARCH_WARMUP_ENABLED = False
+    RecordingHttpService.searches = []
+    store = VectorStore.objects.create(name='Remote', openai_vector_store_id='vs_remote', status='completed')
+    Document.objects.create(
+        title='Contract', vector_store=store, file=ContentFile(b'terms', name='contract.txt'), status='completed',
+        attributes={'kind': 'contract'},
+    )
+    return store
+
+
+def test_search_sends_the_filter_upstream(api_client, http_store):
+    data = {'type': 'in', 'key': 'kind', 'values': ['contract', 'memo']}
+
+    response = api_client.post(
+        f'/api/vector-stores/{http_store.pk}/search/', {'query': 'terms', 'filters': data}, format='json',
+    )
+    assert response.status_code == 200
+    assert RecordingHttpService.searches == [
+        {'query': 'terms', 'max_num_results': 10, 'filters': to_openai(validate_filter(data))},
+    ]
+
+
+def test_search_that_matches_no_document_skips_upstream(api_client, http_store):
+    response = api_client.post(
+        f'/api/vector-stores/{http_store.pk}/search/',
+        {'query': 'terms', 'filters': {'type': 'eq', 'key': 'kind', 'value': 'memo'}}, format='json',
+    )
+    assert response.status_code == 200
+    assert response.data['results']['data'] == []
+    assert RecordingHttpService.searches == []
+
+
+def test_documents_without_the_key_still_go_upstream(api_client, http_store):
+    data = {'type': 'nin', 'key': 'region', 'values': ['eu']}
+
+    response = api_client.post(
+        f'/api/vector-stores/{http_store.pk}/search/', {'query': 'terms', 'filters': data}, format='json',
+    )
+    assert response.status_code == 200
+    assert len(RecordingHttpService.searches) == 1
+
+
+def test_search_rejects_an_invalid_filter(api_client, http_store):
+    response = api_client.post(
+        f'/api/vector-stores/{http_store.pk}/search/',
+        {'query': 'terms', 'filters': {'type': 'eq', 'key': 'a__b', 'value': 1}}, format='json',
+    )
+    assert response.status_code == 400
+    assert RecordingHttpService.searches == []
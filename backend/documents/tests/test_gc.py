@@ -0,0 +1,197 @@
+"""
+Queued upstream deletes and the orphan scan.
+"""
+import io
+import time
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from documents import gc
+from documents.local_service import LocalVectorStoreService
+from documents.models import Document, RemoteCleanup, VectorStore
+
+HOUR = 3600
+
+
+class RemoteService(LocalVectorStoreService):
+    """Local backend that pretends to keep files and stores upstream"""
+
+    has_remote = True
+    deleted = []
+    failing = set()
+    files = []
+    vector_stores = []
+
+    def _delete(self, remote_id):
+        if remote_id in self.failing:
+            raise Exception('upstream is down')
+        self.deleted.append(remote_id)
+        return not remote_id.startswith('gone')
+
+    def delete_remote_file(self, file_id):
+        return self._delete(file_id)
+
+    def delete_remote_vector_store(self, vector_store_id):
+        return self._delete(vector_store_id)
+
+    def list_remote_files(self):
+        # Two items per page
+        for i in range(0, len(self.files), 2):
+            yield self.files[i:i + 2]
+
+    def list_remote_vector_stores(self):
+        yield from [self.vector_stores] if self.vector_stores else []
+
+
+@pytest.fixture
+def remote(settings):
+    settings.VECTOR_STORE_BACKENDS = {
+        **settings.VECTOR_STORE_BACKENDS, 'remote': 'documents.tests.test_gc.RemoteService',
+    }
+    settings.VECTOR_STORE_BACKEND = 'remote'
+    settings.REMOTE_GC_WORKERS = 1
+    settings.REMOTE_GC_RATE = 0
+    settings.REMOTE_GC_MIN_AGE = HOUR
+    RemoteService.deleted = []
+    RemoteService.failing = set()
+    RemoteService.files = []
+    RemoteService.vector_stores = []
+    return RemoteService
+
+
+def _old():
+    return time.time() - 2 * HOUR
+
+
+def test_has_remote(remote, settings):
+    assert gc.has_remote()
+    assert not gc.has_remote('local')
+
+
+@pytest.mark.django_db
+def test_orphans_skip_referenced_and_recent_objects(remote):
+    store = VectorStore.objects.create(name='Store', openai_vector_store_id='vs_known')
+    Document.objects.create(
+        title='Doc', vector_store=store, file='documents/doc.txt', openai_file_id='file-current',
+        pending_openai_file_id='file-pending', retired_openai_file_id='file-retired',
+    )
+    remote.files = [
+        {'id': 'file-current', 'created_at': _old()},
+        {'id': 'file-orphan', 'created_at': _old()},
+        {'id': 'file-pending', 'created_at': _old()},
+        {'id': 'file-retired', 'created_at': _old()},
+        # Uploaded moments ago; its row may not be saved yet
+        {'id': 'file-young', 'created_at': time.time()},
+        {'id': 'file-orphan-2', 'created_at': _old()},
+    ]
+    remote.vector_stores = [
+        {'id': 'vs_known', 'created_at': _old()},
+        {'id': 'vs_orphan', 'created_at': _old()},
+    ]
+
+    assert list(gc.find_orphans('file')) == [['file-orphan'], ['file-orphan-2']]
+    assert list(gc.find_orphans('vector_store')) == [['vs_orphan']]
+    assert list(gc.find_orphans('file', min_age=0)) == [['file-orphan'], ['file-young', 'file-orphan-2']]
+
+
+@pytest.mark.django_db
+def test_nothing_is_queued_for_local_backends(settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+
+    assert gc.enqueue('file', ['file-1']) == 0
+    assert not RemoteCleanup.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_deleting_a_store_queues_and_runs_its_cleanups(remote, api_client):
+    store = VectorStore.objects.create(name='Store', openai_vector_store_id='vs_gone')
+    Document.objects.create(
+        title='Doc', vector_store=store, file='documents/doc.txt', openai_file_id='file-1',
+        retired_openai_file_id='gone-file',
+    )
+
+    assert api_client.delete(f'/api/vector-stores/{store.pk}/').status_code == 204
+    assert sorted(RemoteCleanup.objects.values_list('kind', 'remote_id')) == [
+        ('file', 'file-1'), ('file', 'gone-file'), ('vector_store', 'vs_gone'),
+    ]
+    # Queuing the same ids again keeps one task each
+    gc.enqueue('file', ['file-1', 'file-1'])
+    assert RemoteCleanup.objects.count() == 3
+
+    counts = gc.run_cleanups()
+    assert counts['deleted'] == 2 and counts['missing'] == 1
+    assert sorted(remote.deleted) == ['file-1', 'gone-file', 'vs_gone']
+    assert not RemoteCleanup.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_failed_deletes_back_off_then_give_up(remote, settings):
+    settings.REMOTE_GC_MAX_ATTEMPTS = 2
+    remote.failing = {'file-1'}
+    gc.enqueue('file', ['file-1'])
+
+    assert gc.run_cleanups()['retrying'] == 1
+    task = RemoteCleanup.objects.get()
+    assert (task.status, task.attempts, task.last_error) == ('pending', 1, 'upstream is down')
+    assert task.next_attempt_at > timezone.now() + timedelta(seconds=50)
+    # Not due yet
+    assert gc.run_cleanups()['retrying'] == 0
+
+    RemoteCleanup.objects.update(next_attempt_at=timezone.now())
+    assert gc.run_cleanups()['failed'] == 1
+    assert RemoteCleanup.objects.get().status == 'failed'
+
+
+def test_retry_delay_doubles_up_to_a_day(settings):
+    settings.REMOTE_GC_RETRY_DELAY = 60
+
+    assert [gc.retry_delay(attempts) for attempts in (1, 2, 3)] == [60, 120, 240]
+    assert gc.retry_delay(40) == gc.MAX_RETRY_DELAY
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claims_of_dead_workers_are_taken_over(remote, settings):
+    gc.enqueue('file', ['file-1'])
+    RemoteCleanup.objects.update(status='running')
+    assert gc.run_cleanups()['deleted'] == 0
+
+    stale = timezone.now() - timedelta(seconds=settings.REMOTE_GC_CLAIM_TIMEOUT + 1)
+    RemoteCleanup.objects.update(updated_at=stale)
+    assert gc.run_cleanups()['deleted'] == 1
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = gc.RateLimiter(50, burst=1)
+
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.05
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gc_remote_command(remote):
+    remote.files = [{'id': 'file-orphan', 'created_at': _old()}]
+    remote.vector_stores = [{'id': 'vs_orphan', 'created_at': _old()}]
+
+    out = io.StringIO()
+    call_command('gc_remote', '--dry-run', stdout=out)
+    assert 'orphan file file-orphan' in out.getvalue()
+    assert not RemoteCleanup.objects.exists()
+
+    out = io.StringIO()
+    call_command('gc_remote', stdout=out)
+    assert '1 orphaned upstream files' in out.getvalue()
+    assert 'Done: 2 deleted' in out.getvalue()
+    assert sorted(remote.deleted) == ['file-orphan', 'vs_orphan']
+
+
+def test_gc_remote_needs_a_remote_backend(settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+
+    with pytest.raises(CommandError):
+        call_command('gc_remote')
@@ -0,0 +1,95 @@
+"""
+Search hits hydrated with their local documents.
+"""
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from documents.hydration import STALE, VERSION_KEY, document_summaries, hydrate_search_results
+from documents.models import Document
+
+pytestmark = pytest.mark.django_db
+
+
+def _document(store, title, file_id, **fields):
+    return Document.objects.create(
+        title=title, vector_store=store, file=f'documents/{title}.txt', openai_file_id=file_id, status='completed',
+        **fields,
+    )
+
+
+def _page(*file_ids):
+    return {'object': 'vector_store.search_results.page', 'data': [{'file_id': file_id, 'score': 1} for file_id in file_ids]}
+
+
+def test_hits_get_their_documents_in_one_query(store, django_assert_num_queries):
+    first = _document(store, 'first', 'file-1', attributes={'kind': 'memo'})
+    _document(store, 'second', 'file-2')
+    request = RequestFactory().get('/api/')
+
+    with django_assert_num_queries(1):
+        page = hydrate_search_results(_page('file-1', 'file-2'), request)
+    hits = page['data']
+    assert [hit['document']['title'] for hit in hits] == ['first', 'second']
+    assert hits[0]['document']['attributes'] == {'kind': 'memo'}
+    assert hits[0]['document']['download_url'] == f'http://testserver/api/documents/{first.pk}/download/'
+    assert hits[0]['score'] == 1
+
+    # A file id with no document also checks for a swap in progress
+    with django_assert_num_queries(2):
+        page = hydrate_search_results(_page('file-1', 'file-gone'))
+    assert page['data'][1]['document'] is None
+
+    # Known and unknown file ids are both remembered
+    with django_assert_num_queries(0):
+        hydrate_search_results(_page('file-1', 'file-2', 'file-gone'))
+
+
+def test_pages_without_hits_are_returned_as_is():
+    assert hydrate_search_results({'error': 'x'}) == {'error': 'x'}
+    assert hydrate_search_results(None) is None
+
+
+def test_saves_reload_the_summary(store, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        document = _document(store, 'draft', 'file-1')
+    assert document_summaries(['file-1'])['file-1']['title'] == 'draft'
+
+    with django_capture_on_commit_callbacks(execute=True):
+        document.title = 'final'
+        document.save()
+    assert document_summaries(['file-1'])['file-1']['title'] == 'final'
+
+    with django_capture_on_commit_callbacks(execute=True):
+        document.delete()
+    assert document_summaries(['file-1'])['file-1'] is None
+
+
+def test_a_stamp_published_elsewhere_reloads_the_summary(store):
+    document = _document(store, 'draft', 'file-1')
+    assert document_summaries(['file-1'])['file-1']['title'] == 'draft'
+
+    # Another process updates the row and publishes a new stamp
+    Document.objects.filter(pk=document.pk).update(title='final')
+    assert document_summaries(['file-1'])['file-1']['title'] == 'draft'
+    cache.set(VERSION_KEY.format('file-1'), 'elsewhere', None)
+    assert document_summaries(['file-1'])['file-1']['title'] == 'final'
+
+
+def test_summaries_expire_after_their_ttl(store, settings):
+    document = _document(store, 'draft', 'file-1')
+    document_summaries(['file-1'])
+    Document.objects.filter(pk=document.pk).update(title='final')
+
+    settings.DOCUMENT_SUMMARY_TTL = 0
+    assert document_summaries(['file-1'])['file-1']['title'] == 'final'
+
+
+def test_hits_on_a_file_being_swapped_are_dropped(store):
+    _document(store, 'report', 'file-new', retired_openai_file_id='file-old', pending_openai_file_id='file-next')
+
+    summaries = document_summaries(['file-old', 'file-new', 'file-next'])
+    assert summaries['file-old'] is STALE
+    assert summaries['file-next'] is STALE
+    page = hydrate_search_results(_page('file-old', 'file-new', 'file-next'))
+    assert [hit['file_id'] for hit in page['data']] == ['file-new']
@@ -0,0 +1,195 @@
+"""
+Sizing, limits, batch planning and progress of bulk ingestion.
+"""
+import threading
+from concurrent.futures import Future
+from datetime import timedelta
+
+import pytest
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from documents.ingestion import (
+    AdaptiveLimit, IngestionPlanner, Size, TooLarge, check_limits, estimate, store_progress,
+)
+from documents.models import Document, VectorStore
+
+
+class FakeUpstream:
+    """Just enough of a backend for the planner; batches finish on their second poll"""
+
+    def __init__(self, failing=()):
+        self.lock = threading.Lock()
+        self.uploaded = 0
+        self.batches = {}
+        self.failing = set(failing)
+
+    def upload_replacement(self, document):
+        with self.lock:
+            self.uploaded += 1
+            return f'file-{document.title}'
+
+    def attach_files(self, vector_store_id, file_ids, attributes=None):
+        batch_id = f'batch-{len(self.batches)}'
+        self.batches[batch_id] = {'file_ids': list(file_ids), 'attributes': attributes, 'polls': 0}
+        return batch_id
+
+    def file_batch_state(self, vector_store_id, batch_id):
+        batch = self.batches[batch_id]
+        batch['polls'] += 1
+        if batch['polls'] < 2:
+            return 'in_progress', {}
+        return 'completed', {file_id: 'unsupported' for file_id in batch['file_ids'] if file_id in self.failing}
+
+
+def _document(store, title, size, name=None, **fields):
+    return Document.objects.create(
+        title=title,
+        vector_store=store,
+        file=ContentFile(b'x' * 16, name=name or f'{title}.txt'),
+        file_size=size,
+        **fields,
+    )
+
+
+class InlinePool:
+    """Runs uploads as they are submitted
+
+    The in-memory test database locks whole tables, so upload threads
+    writing next to the planner would fail at random.
+    """
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+def _planner(store, upstream, **kwargs):
+    planner = IngestionPlanner(store, service=upstream, **kwargs)
+    planner.pool.shutdown()
+    planner.pool = InlinePool()
+    return planner
+
+
+def _ingest(planner, documents):
+    for document in documents:
+        planner.submit(document.pk)
+    outcomes = []
+    while planner.pending:
+        outcomes += planner.results(block=True)
+    planner.close()
+    return {document_id: (status, error) for document_id, status, error in outcomes}
+
+
+@pytest.fixture
+def fast_polls(settings):
+    settings.INGEST_POLL_INTERVAL = 0.01
+    settings.DOCUMENT_EXTRACTION_ENABLED = False
+
+
+def test_estimate_counts_estimates_or_skips(store):
+    counted = _document(store, 'counted', 4000, extraction_status='completed', token_count=120)
+    text = _document(store, 'text', 4000)
+    pdf = _document(store, 'pdf', 4000, name='pdf.pdf', content_type='application/pdf')
+
+    assert estimate(counted) == Size(4000, 120, True)
+    assert estimate(text) == Size(4000, 1000, False)
+    assert estimate(pdf) == Size(4000, 0, False)
+
+
+def test_token_limit_applies_to_counted_tokens_only(settings):
+    settings.INGEST_MAX_FILE_TOKENS = 100
+
+    check_limits(Size(1000, 500, False))
+    with pytest.raises(TooLarge, match='token limit'):
+        check_limits(Size(1000, 500, True))
+    with pytest.raises(TooLarge, match='byte upload limit'):
+        check_limits(Size(settings.INGEST_MAX_FILE_BYTES + 1, 0, False))
+
+
+def test_adaptive_limit_follows_throughput():
+    limit = AdaptiveLimit(2, 4)
+
+    limit.observe(10)
+    assert limit.limit == 3
+    limit.observe(20)
+    assert limit.limit == 4
+    limit.observe(40)
+    assert limit.limit == 4
+    limit.observe(40.5)
+    assert limit.limit == 4
+    limit.observe(20)
+    assert limit.limit == 3
+    limit.observe(20, failed=True)
+    assert limit.limit == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_large_pdf_without_extraction_is_ingested(fast_polls):
+    store = VectorStore.objects.create(name='Ingest', openai_vector_store_id='vs_ingest')
+    # 40 MB would be 10M tokens at bytes / 4, twice the per-file token limit
+    pdf = _document(store, 'scan', 40_000_000, name='scan.pdf', content_type='application/pdf')
+    upstream = FakeUpstream()
+
+    outcomes = _ingest(_planner(store, upstream), [pdf])
+
+    assert outcomes == {pdf.pk: ('completed', None)}
+    pdf.refresh_from_db()
+    assert pdf.status == 'completed'
+    assert pdf.openai_vector_store_file_id == 'file-scan'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_planner_respects_batch_limits(fast_polls, settings):
+    settings.INGEST_BATCH_MAX_FILES = 2
+    settings.INGEST_BATCH_MAX_BYTES = 250
+    settings.INGEST_MAX_FILE_BYTES = 200
+    store = VectorStore.objects.create(name='Ingest', openai_vector_store_id='vs_ingest')
+    documents = [
+        _document(store, f'doc{i}', 100, attributes={'team': 'a' if i % 2 else 'b'})
+        for i in range(5)
+    ]
+    oversized = _document(store, 'oversized', 300)
+    upstream = FakeUpstream(failing={'file-doc3'})
+
+    outcomes = _ingest(_planner(store, upstream, max_uploads=2), [*documents, oversized])
+
+    assert len(outcomes) == 6
+    status, error = outcomes[oversized.pk]
+    assert status is None and 'byte upload limit' in error
+    assert outcomes[documents[3].pk] == ('failed', 'unsupported')
+    assert upstream.uploaded == 5
+    attached = [file_id for batch in upstream.batches.values() for file_id in batch['file_ids']]
+    assert sorted(attached) == sorted(f'file-doc{i}' for i in range(5))
+    for batch in upstream.batches.values():
+        # Two files of 100 bytes fill a batch; each call carries one set of attributes
+        assert len(batch['file_ids']) <= 2
+        teams = {Document.objects.get(openai_file_id=file_id).attributes['team'] for file_id in batch['file_ids']}
+        assert teams == {batch['attributes']['team']}
+    statuses = dict(Document.objects.filter(vector_store=store).values_list('title', 'status'))
+    assert statuses == {
+        'doc0': 'completed', 'doc1': 'completed', 'doc2': 'completed', 'doc3': 'failed', 'doc4': 'completed',
+        'oversized': 'failed',
+    }
+
+
+def test_store_progress(store):
+    now = timezone.now()
+    done = _document(store, 'done', 4000, status='completed', processed_date=now)
+    Document.objects.filter(pk=done.pk).update(upload_date=now - timedelta(seconds=100))
+
+    assert store_progress(store.pk, now=now) == {
+        'documents_remaining': 0, 'tokens_remaining': 0, 'tokens_per_second': 10.0, 'eta_seconds': 0,
+    }
+
+    _document(store, 'pending', 2000, status='processing')
+    assert store_progress(store.pk, now=now) == {
+        'documents_remaining': 1, 'tokens_remaining': 500, 'tokens_per_second': 10.0, 'eta_seconds': 50,
+    }
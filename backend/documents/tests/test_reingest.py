@@ -0,0 +1,154 @@
+"""
+Replacing a document's file: the atomic swap and its rollback.
+"""
+import io
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from documents import reingest
+from documents.hydration import hydrate_search_results
+from documents.local_service import LocalVectorStoreService
+from documents.models import Document, RemoteCleanup, VectorStore
+
+
+class SwappingService(LocalVectorStoreService):
+    """Local backend with upstream files, recording what is done to them"""
+
+    has_remote = True
+    calls = []
+    # Ids that hits come back for while a new file is attached
+    indexed = []
+    fail_attach = False
+    fail_detach = False
+
+    def upload_replacement(self, document):
+        file_id = super().upload_replacement(document)
+        self.calls.append(('upload', file_id))
+        return file_id
+
+    def attach_file(self, vector_store_id, file_id, attributes=None):
+        if self.fail_attach:
+            raise Exception('attach failed')
+        page = hydrate_search_results({'data': [{'file_id': hit} for hit in [*self.indexed, file_id]]})
+        self.calls.append(('search', [hit['file_id'] for hit in page['data']]))
+        return f'vsf-{file_id}'
+
+    def detach_file(self, vector_store_id, file_id):
+        if self.fail_detach:
+            raise Exception('detach failed')
+        self.calls.append(('detach', file_id))
+        return True
+
+    @classmethod
+    def uploaded(cls):
+        return next(file_id for call, file_id in cls.calls if call == 'upload')
+
+
+@pytest.fixture
+def service(settings):
+    settings.VECTOR_STORE_BACKENDS = {
+        **settings.VECTOR_STORE_BACKENDS, 'swapping': 'documents.tests.test_reingest.SwappingService',
+    }
+    settings.VECTOR_STORE_BACKEND = 'swapping'
+    settings.DOCUMENT_REINGEST_WORKERS = 0
+    settings.DOCUMENT_EXTRACTION_ENABLED = False
+    SwappingService.calls = []
+    SwappingService.indexed = ['file-old']
+    SwappingService.fail_attach = False
+    SwappingService.fail_detach = False
+    return SwappingService
+
+
+@pytest.fixture
+def document(service):
+    store = VectorStore.objects.create(name='Swap', openai_vector_store_id='vs_swap', status='completed')
+    return Document.objects.create(
+        title='Doc', vector_store=store, file=SimpleUploadedFile('doc.txt', b'hello'), file_size=5,
+        content_type='text/plain', openai_file_id='file-old', openai_vector_store_file_id='vsf-file-old',
+        status='completed',
+    )
+
+
+def _replace(api_client, document, body, name='doc.txt'):
+    response = api_client.patch(
+        f'/api/documents/{document.pk}/', {'file': SimpleUploadedFile(name, body)}, format='multipart',
+    )
+    assert response.status_code == 200
+    document.refresh_from_db()
+    return response.data
+
+
+def test_hash_stream():
+    assert reingest.hash_stream(io.BytesIO(b'hello')) == (
+        '2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824'
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_same_content_is_not_reingested(api_client, document, service):
+    assert _replace(api_client, document, b'hello')['file_changed'] is False
+    assert document.content_hash == reingest.hash_stream(io.BytesIO(b'hello'))
+    assert service.calls == []
+
+    response = api_client.patch(f'/api/documents/{document.pk}/', {'title': 'Renamed'}, format='multipart')
+    assert response.data['title'] == 'Renamed' and 'file_changed' not in response.data
+
+
+@pytest.mark.django_db(transaction=True)
+def test_new_content_is_swapped_in(api_client, document, service):
+    assert _replace(api_client, document, b'world!', name='new.txt')['file_changed'] is True
+
+    new_file_id = service.uploaded()
+    # Mid-swap the old file still answers and the pending one is dropped
+    assert ('search', ['file-old']) in service.calls
+    assert ('detach', 'file-old') in service.calls
+    assert document.openai_file_id == new_file_id
+    assert document.openai_vector_store_file_id == f'vsf-{new_file_id}'
+    assert document.pending_openai_file_id is None and document.retired_openai_file_id is None
+    assert document.file_size == 6 and document.file.name.endswith('.txt')
+    assert list(RemoteCleanup.objects.values_list('remote_id', flat=True)) == ['file-old']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_failed_attach_rolls_back(api_client, document, service):
+    service.fail_attach = True
+
+    _replace(api_client, document, b'world!')
+
+    assert document.openai_file_id == 'file-old'
+    assert document.pending_openai_file_id is None
+    assert document.error_message == 'Re-ingestion failed: attach failed'
+    assert list(RemoteCleanup.objects.values_list('remote_id', flat=True)) == [service.uploaded()]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_old_file_stays_retired_until_detached(api_client, document, service):
+    service.fail_detach = True
+
+    _replace(api_client, document, b'world!')
+
+    assert document.openai_file_id == service.uploaded()
+    assert document.retired_openai_file_id == 'file-old'
+    page = hydrate_search_results({'data': [{'file_id': 'file-old'}, {'file_id': document.openai_file_id}]})
+    assert [hit['file_id'] for hit in page['data']] == [document.openai_file_id]
+
+
+@pytest.mark.django_db
+def test_superseded_uploads_are_not_swapped(document, service):
+    Document.objects.filter(pk=document.pk).update(content_hash='newer', pending_openai_file_id='file-new')
+
+    assert reingest.reingest(document.pk, 'older') is False
+    assert reingest.swap(document.pk, 'older', 'file-new', 'vsf-file-new') == (False, None)
+    assert reingest.swap(document.pk, 'newer', 'file-other', 'vsf-file-other') == (False, None)
+    assert reingest.swap(document.pk, 'newer', 'file-new', 'vsf-file-new') == (True, 'file-old')
+    assert service.calls == []
+
+
+def test_failed_files_stop_the_wait():
+    class Failing:
+        def vector_store_file_state(self, vector_store_id, vector_store_file_id):
+            return 'failed', 'unsupported'
+
+    with pytest.raises(Exception, match='Vector store file failed: unsupported'):
+        reingest.wait_until_searchable(Failing(), 'vs', 'vsf')
@@ -0,0 +1,130 @@
+"""
+JSON rendering, response compression and NDJSON exports.
+"""
+import gzip
+import json
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+from django.core.files.base import ContentFile
+from rest_framework.renderers import JSONRenderer
+
+from documents import renderers
+from documents.models import Document, Query
+from documents.renderers import FastJSONRenderer
+
+DATA = {
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'created': datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=timezone.utc),
+    'price': Decimal('12.50'),
+    'title': 'Café résumé',
+    'nested': [{'score': 0.5, 'ok': True, 'none': None}],
+    'count': 3,
+}
+
+
+@pytest.mark.skipif(renderers.orjson is None, reason='orjson is not installed')
+def test_fast_renderer_matches_the_stock_renderer():
+    assert FastJSONRenderer().render(DATA) == JSONRenderer().render(DATA)
+
+
+def test_fast_renderer_falls_back_for_big_integers():
+    data = {'big': 2 ** 70}
+
+    assert json.loads(FastJSONRenderer().render(data)) == data
+
+
+def test_indented_output_uses_the_stock_renderer():
+    rendered = FastJSONRenderer().render({'a': 1}, 'application/json; indent=2', {})
+
+    assert rendered == b'{\n  "a": 1\n}'
+
+
+def test_fast_renderer_without_orjson(monkeypatch):
+    monkeypatch.setattr(renderers, 'orjson', None)
+
+    assert FastJSONRenderer().render(DATA) == JSONRenderer().render(DATA)
+
+
+@pytest.fixture(params=['orjson', 'stock'])
+def encoder(request, monkeypatch):
+    if request.param == 'stock':
+        monkeypatch.setattr(renderers, 'orjson', None)
+    elif renderers.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+def test_line_separators_are_escaped(encoder):
+    data = {'text': 'one\u2028two\u2029three é'}
+
+    rendered = FastJSONRenderer().render(data)
+    assert rendered == JSONRenderer().render(data)
+    assert rendered == '{"text":"one\\u2028two\\u2029three é"}'.encode('utf-8')
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), -float('inf')])
+def test_non_finite_floats_are_rejected(encoder, value):
+    data = {'score': [value], 'none': None}
+
+    with pytest.raises(ValueError):
+        JSONRenderer().render(data)
+    with pytest.raises(ValueError):
+        FastJSONRenderer().render(data)
+
+
+def _lines(response):
+    body = b''.join(response.streaming_content)
+    assert body.endswith(b'\n')
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_document_export_streams_every_row(api_client, store, settings):
+    settings.EXPORT_CHUNK_SIZE = 2
+    for i in range(5):
+        Document.objects.create(title=f'doc{i}', vector_store=store, file=f'documents/doc{i}.txt')
+
+    response = api_client.get('/api/documents/export/', {'vector_store': str(store.pk)})
+    assert response.status_code == 200
+    assert response.streaming
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert 'documents.ndjson' in response['Content-Disposition']
+    rows = _lines(response)
+    assert rows == json.loads(api_client.get('/api/documents/', {'vector_store': str(store.pk)}).content)
+
+
+def test_query_export(api_client, store):
+    Query.objects.create(vector_store=store, query_text='hello', response={'data': []})
+
+    response = api_client.get('/api/queries/export/')
+    rows = _lines(response)
+    assert [row['query_text'] for row in rows] == ['hello']
+
+
+def test_large_payloads_are_gzipped(api_client, store, settings):
+    settings.RESPONSE_COMPRESSION_MIN_SIZE = 1024
+    for i in range(40):
+        Document.objects.create(title=f'document number {i}', vector_store=store, file=f'documents/doc{i}.txt')
+
+    response = api_client.get('/api/documents/', HTTP_ACCEPT_ENCODING='gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(response.content))) == 40
+
+    export = api_client.get('/api/documents/export/', HTTP_ACCEPT_ENCODING='gzip')
+    assert export['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(b''.join(export.streaming_content)).splitlines()) == 40
+
+
+def test_small_payloads_and_files_are_sent_as_is(api_client, store, settings):
+    settings.RESPONSE_COMPRESSION_MIN_SIZE = 1024
+    document = Document.objects.create(
+        title='Data', vector_store=store, file=ContentFile(b'x' * 4096, name='data.txt'), file_size=4096,
+    )
+
+    detail = api_client.get(f'/api/documents/{document.pk}/', HTTP_ACCEPT_ENCODING='gzip')
+    assert not detail.has_header('Content-Encoding')
+    download = api_client.get(f'/api/documents/{document.pk}/download/', HTTP_ACCEPT_ENCODING='gzip')
+    assert not download.has_header('Content-Encoding')
+    assert b''.join(download.streaming_content) == b'x' * 4096
@@ -0,0 +1,183 @@
+"""
+Analytics rollups: buffering, counters, distinct queries and latency percentiles.
+"""
+import pytest
+
+from documents import rollups
+from documents.models import Document, Query, QueryTextRollup, StoreRollup, VectorStore
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def stores():
+    return [
+        VectorStore.objects.create(name=name, openai_vector_store_id=f'vs_{name}')
+        for name in ('alpha', 'beta')
+    ]
+
+
+def _total(store):
+    return StoreRollup.objects.get(vector_store=store, granularity='total')
+
+
+def _query(store, text, latency_ms=10):
+    return Query.objects.create(vector_store=store, query_text=text, response={}, latency_ms=latency_ms)
+
+
+def test_counts_wait_for_the_commit(stores, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        _query(stores[0], 'rolled back')
+    assert callbacks
+    assert not StoreRollup.objects.exists()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        _query(stores[0], 'committed')
+    assert _total(stores[0]).query_count == 1
+
+
+def test_counts_are_buffered_until_flushed(stores, settings, django_capture_on_commit_callbacks):
+    settings.ROLLUP_FLUSH_INTERVAL = 3600
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            for _ in range(3):
+                _query(stores[0], 'hello')
+        assert not StoreRollup.objects.exists()
+        assert rollups._timer is not None
+
+        rollups.flush()
+    finally:
+        rollups._timer.cancel()
+        rollups._timer = None
+
+    assert StoreRollup.objects.filter(vector_store=stores[0]).count() == 3
+    assert StoreRollup.objects.filter(vector_store=None).count() == 3
+    total = _total(stores[0])
+    assert total.query_count == 3
+    assert total.distinct_queries == 1
+    assert QueryTextRollup.objects.get(vector_store=stores[0], granularity='total').count == 3
+
+
+def test_distinct_queries_across_stores(stores, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        _query(stores[0], 'Hello  world')
+        _query(stores[0], 'hello world')
+        _query(stores[1], 'HELLO world')
+        _query(stores[1], 'other')
+
+    assert _total(stores[0]).distinct_queries == 1
+    assert _total(stores[1]).distinct_queries == 2
+    assert _total(None).distinct_queries == 2
+    overall = rollups.stats()
+    assert overall['totals']['query_count'] == 4
+    assert overall['totals']['distinct_queries'] == 2
+    assert overall['series'][-1]['distinct_queries'] == 2
+    top = overall['top_queries'][0]
+    assert rollups.normalize_query(top['query_text']) == 'hello world'
+    assert top['count'] == 3
+    assert rollups.stats(vector_store_id=stores[1].pk)['totals']['distinct_queries'] == 2
+
+
+def test_document_counters(stores, django_capture_on_commit_callbacks):
+    store = stores[0]
+    with django_capture_on_commit_callbacks(execute=True):
+        document = Document.objects.create(
+            title='Report', vector_store=store, file='documents/report.txt', file_size=300, status='processing',
+        )
+        other = Document.objects.create(
+            title='Draft', vector_store=store, file='documents/draft.txt', file_size=100, status='uploading',
+        )
+    total = _total(store)
+    assert (total.documents_uploaded, total.bytes_uploaded, total.documents_in_progress) == (2, 400, 2)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        document.status = 'completed'
+        document.save()
+        other.delete()
+    total.refresh_from_db()
+    assert (total.documents_completed, total.documents_in_progress) == (1, 0)
+
+
+def test_counts_of_deleted_stores_are_dropped(stores, settings, django_capture_on_commit_callbacks):
+    settings.ROLLUP_FLUSH_INTERVAL = 3600
+    try:
+        with django_capture_on_commit_callbacks(execute=True):
+            _query(stores[0], 'kept')
+            _query(stores[1], 'dropped')
+    finally:
+        rollups._timer.cancel()
+        rollups._timer = None
+    StoreRollup.objects.all().delete()
+    VectorStore.objects.filter(pk=stores[1].pk).delete()
+
+    rollups.flush()
+    assert set(StoreRollup.objects.values_list('vector_store_id', flat=True)) == {stores[0].pk, None}
+    # Until the next backfill, the all-store rows still count them
+    assert _total(None).query_count == 2
+
+
+def test_backfill_matches_incremental_counts(stores, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        _query(stores[0], 'first', latency_ms=30)
+        _query(stores[0], 'first', latency_ms=300)
+        _query(stores[1], 'second')
+        Document.objects.create(title='Report', vector_store=stores[0], file='documents/report.txt', file_size=10)
+    fields = ('vector_store_id', 'granularity', 'bucket', 'latency_histogram', *rollups.COUNTERS)
+    incremental = sorted(StoreRollup.objects.values_list(*fields), key=repr)
+
+    text_fields = ('vector_store_id', 'granularity', 'bucket', 'query_hash', 'count')
+    incremental_texts = sorted(QueryTextRollup.objects.values_list(*text_fields), key=repr)
+
+    assert rollups.backfill() == {'rollups': 9, 'query_texts': 12}
+    assert sorted(StoreRollup.objects.values_list(*fields), key=repr) == incremental
+    assert sorted(QueryTextRollup.objects.values_list(*text_fields), key=repr) == incremental_texts
+
+    # Backfilling one store also brings the all-store rows back in line
+    StoreRollup.objects.filter(vector_store=None).update(query_count=0)
+    rollups.backfill([stores[0].pk])
+    assert sorted(StoreRollup.objects.values_list(*fields), key=repr) == incremental
+
+
+def test_all_store_stats_read_one_row_per_bucket(stores, django_capture_on_commit_callbacks,
+                                                 django_assert_num_queries):
+    with django_capture_on_commit_callbacks(execute=True):
+        _query(stores[0], 'hello')
+        _query(stores[1], 'hello')
+    # Per-store rows are not read for the all-store numbers
+    QueryTextRollup.objects.exclude(vector_store=None).delete()
+    StoreRollup.objects.exclude(vector_store=None).delete()
+
+    with django_assert_num_queries(4):
+        overall = rollups.stats(granularity='hour')
+    assert overall['totals']['query_count'] == 2
+    assert overall['top_queries'] == [{'query_text': 'hello', 'count': 2}]
+
+
+def test_latency_percentiles(stores, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        for latency_ms in (10, 20, 60, 40_000):
+            _query(stores[0], 'timed', latency_ms=latency_ms)
+
+    latency = rollups.stats()['latency_ms']
+    assert latency == {'samples': 4, 'p50': 25.0, 'p95': 30000.0, 'p99': 30000.0}
+
+
+@pytest.mark.parametrize('histogram, fraction, expected', [
+    ({}, 0.5, None),
+    ({'25': 1, '100': 1}, 0.5, 25.0),
+    ({'25': 1, '100': 1}, 0.99, 100.0),
+    ({'inf': 3}, 0.5, 30000.0),
+])
+def test_percentile(histogram, fraction, expected):
+    assert rollups.percentile(histogram, fraction) == expected
+
+
+def test_stats_endpoint(api_client, stores, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        _query(stores[0], 'hello')
+
+    response = api_client.get('/api/stats/', {'granularity': 'hour', 'periods': 2})
+    assert response.status_code == 200
+    assert response.data['totals']['query_count'] == 1
+    assert len(response.data['series']) == 1
+    assert api_client.get('/api/stats/', {'granularity': 'week'}).status_code == 400
@@ -0,0 +1,102 @@
+"""
+Routing reads between the primary and its replicas.
+"""
+import pytest
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from documents.middleware import ReplicaRoutingMiddleware
+from documents.models import Document, VectorStore
+from documents.routers import PIN_COOKIE, ReplicaRouter, read_only_request, routing
+
+router = ReplicaRouter()
+
+
+@pytest.fixture
+def replicas(settings):
+    # Only routing decisions are checked, so the alias needn't exist
+    settings.DATABASE_REPLICAS = ['replica1']
+    settings.DATABASE_READ_YOUR_WRITES = 10
+    return settings.DATABASE_REPLICAS
+
+
+def test_only_listed_reads_may_use_a_replica(replicas):
+    factory = RequestFactory()
+
+    assert read_only_request(factory.get('/api/documents/'))
+    assert read_only_request(factory.head('/api/vector-stores/'))
+    assert not read_only_request(factory.post('/api/documents/'))
+    # Not in DATABASE_REPLICA_VIEWS
+    assert not read_only_request(factory.get('/api/documents/1/download/'))
+    assert not read_only_request(factory.get('/nowhere'))
+    pinned = factory.get('/api/documents/')
+    pinned.COOKIES[PIN_COOKIE] = '1'
+    assert not read_only_request(pinned)
+
+
+def test_no_replicas_means_no_replica_reads():
+    assert not read_only_request(RequestFactory().get('/api/documents/'))
+
+
+def test_reads_follow_the_route(replicas):
+    assert router.db_for_read(Document) == 'default'
+    with routing(False):
+        assert router.db_for_read(Document) == 'default'
+    with routing(True) as route:
+        assert route.replica == 'replica1'
+        assert router.db_for_read(Document) == 'replica1'
+        # The first write sends the rest of the request's reads to the primary
+        assert router.db_for_write(Document) == 'default'
+        assert route.wrote
+        assert router.db_for_read(Document) == 'default'
+
+
+@pytest.mark.django_db
+def test_reads_in_a_transaction_stay_on_the_primary(replicas):
+    with routing(True), transaction.atomic():
+        assert router.db_for_read(VectorStore) == 'default'
+
+
+def test_migrations_skip_replicas(replicas):
+    assert router.allow_migrate('default', 'documents')
+    assert not router.allow_migrate('replica1', 'documents')
+
+
+def _through_middleware(request, write=False):
+    reads = []
+
+    def view(request):
+        if write:
+            router.db_for_write(Document)
+        reads.append(router.db_for_read(Document))
+        return HttpResponse()
+
+    response = ReplicaRoutingMiddleware(view)(request)
+    return reads[0], response
+
+
+def test_writers_are_pinned_to_the_primary(replicas):
+    factory = RequestFactory()
+
+    database, response = _through_middleware(factory.get('/api/documents/'))
+    assert database == 'replica1' and PIN_COOKIE not in response.cookies
+
+    database, response = _through_middleware(factory.patch('/api/documents/'), write=True)
+    assert database == 'default'
+    cookie = response.cookies[PIN_COOKIE]
+    assert cookie['max-age'] == 10 and cookie['httponly']
+
+    pinned = factory.get('/api/documents/')
+    pinned.COOKIES[PIN_COOKIE] = cookie.value
+    database, response = _through_middleware(pinned)
+    assert database == 'default'
+
+
+@pytest.mark.django_db
+def test_writes_without_replicas_set_no_cookie(api_client, settings):
+    settings.VECTOR_STORE_BACKEND = 'fake'
+
+    response = api_client.post('/api/vector-stores/', {'name': 'Store'}, format='json')
+    assert response.status_code == 201
+    assert PIN_COOKIE not in response.cookies
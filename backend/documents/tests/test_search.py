@@ -0,0 +1,105 @@
+"""
+Full-text search over document titles and query history.
+"""
+import io
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from documents import search
+from documents.models import Document, Query
+from documents.search import fts_table, full_text_search, search_terms
+
+pytestmark = pytest.mark.django_db
+
+
+def _documents(store, *titles):
+    return [
+        Document.objects.create(title=title, vector_store=store, file=f'documents/doc{i}.txt')
+        for i, title in enumerate(titles)
+    ]
+
+
+def _titles(queryset):
+    return [document.title for document in queryset]
+
+
+def test_the_sqlite_index_is_created():
+    assert connection.vendor == 'sqlite'
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+    assert fts_table(Document) in tables
+    assert fts_table(Query) in tables
+
+
+def test_search_terms():
+    assert search_terms('Annual  REPORT, "2024"') == ['annual', 'report', '2024']
+    assert len(search_terms(' '.join(['word'] * 20))) == search.MAX_TERMS
+
+
+def test_every_term_matches_as_a_prefix(store):
+    _documents(store, 'Annual report 2024', 'Annual budget', 'Quarterly reporting guide')
+
+    assert sorted(_titles(full_text_search(Document.objects.all(), 'rep'))) == [
+        'Annual report 2024', 'Quarterly reporting guide',
+    ]
+    assert _titles(full_text_search(Document.objects.all(), 'annual rep')) == ['Annual report 2024']
+    assert not full_text_search(Document.objects.all(), '%%').exists()
+
+
+def test_results_come_best_first(store):
+    _documents(
+        store,
+        'Report on the history of the company and many of its other departments',
+        'Report report',
+        'Report',
+    )
+
+    results = list(full_text_search(Document.objects.all(), 'report'))
+    assert [document.title for document in results] == [
+        'Report report', 'Report', 'Report on the history of the company and many of its other departments',
+    ]
+    assert results[0].search_rank <= results[1].search_rank <= results[2].search_rank
+
+
+def test_the_index_follows_updates_and_deletes(store):
+    document, other = _documents(store, 'Draft notes', 'Meeting notes')
+
+    document.title = 'Final minutes'
+    document.save()
+    other.delete()
+
+    assert not full_text_search(Document.objects.all(), 'notes').exists()
+    assert _titles(full_text_search(Document.objects.all(), 'minutes')) == ['Final minutes']
+
+
+def test_rebuild_restores_an_emptied_index(store):
+    _documents(store, 'Annual report')
+    table = fts_table(Document)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('delete-all')")
+    assert not full_text_search(Document.objects.all(), 'annual').exists()
+
+    out = io.StringIO()
+    call_command('rebuild_search_index', stdout=out)
+    assert 'Search indexes rebuilt' in out.getvalue()
+    assert _titles(full_text_search(Document.objects.all(), 'annual')) == ['Annual report']
+
+
+def test_without_an_index_search_falls_back_to_icontains(store, monkeypatch):
+    _documents(store, 'Annual report', 'Annual budget')
+    monkeypatch.setattr(search, '_has_fts', lambda connection, model: False)
+
+    assert _titles(full_text_search(Document.objects.all(), 'annual rep')) == ['Annual report']
+
+
+def test_list_endpoints_search(api_client, store):
+    _documents(store, 'Annual report', 'Annual budget')
+    Query.objects.create(vector_store=store, query_text='where is the budget', response={})
+    Query.objects.create(vector_store=store, query_text='holiday policy', response={})
+
+    response = api_client.get('/api/documents/', {'search': 'budg'})
+    assert [row['title'] for row in response.data] == ['Annual budget']
+    response = api_client.get('/api/queries/', {'search': 'budget'})
+    assert [row['query_text'] for row in response.data] == ['where is the budget']
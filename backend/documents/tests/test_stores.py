@@ -0,0 +1,95 @@
+"""
+Cached vector store metadata on the search path.
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from documents import stores
+from documents.models import Document, VectorStore
+from documents.stores import forget_store, get_store, identity_map, store_cache
+
+pytestmark = pytest.mark.django_db
+
+
+def test_stores_are_loaded_once(store, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        metadata = get_store(store.pk)
+    assert metadata == (store.pk, 'vs_store', 'Store', 'completed', 0)
+
+    with django_assert_num_queries(0):
+        assert get_store(store.pk) == metadata
+        assert get_store(openai_id='vs_store') == metadata
+
+
+def test_unknown_stores(django_assert_num_queries):
+    with django_assert_num_queries(0):
+        assert get_store('not-a-uuid') is None
+    assert get_store('00000000-0000-0000-0000-000000000000') is None
+    assert get_store(openai_id='vs_missing') is None
+
+
+def test_changes_made_here_are_seen_at_once(store):
+    get_store(store.pk)
+
+    Document.objects.create(title='Doc', vector_store=store, file='documents/doc.txt', status='completed')
+    assert get_store(store.pk).completed_documents == 1
+    store.name = 'Renamed'
+    store.save()
+    assert get_store(openai_id='vs_store').name == 'Renamed'
+    store.delete()
+    assert get_store(store.pk) is None
+
+
+def test_changes_made_elsewhere_are_seen_through_the_stamp(store):
+    get_store(store.pk)
+    stale = store_cache.get(('pk', str(store.pk)))
+    # Another process changes the store and publishes a new stamp; this one
+    # still holds its old entry
+    VectorStore.objects.filter(pk=store.pk).update(status='failed')
+    forget_store(store.pk)
+    store_cache.set(('pk', str(store.pk)), stale)
+
+    assert get_store(store.pk).status == 'failed'
+
+
+def test_entries_expire(store, settings):
+    get_store(store.pk)
+    VectorStore.objects.filter(pk=store.pk).update(status='failed')
+    assert get_store(store.pk).status == 'completed'
+
+    settings.STORE_METADATA_TTL = 0
+    assert get_store(store.pk).status == 'failed'
+
+
+def test_a_request_sees_one_version_of_a_store(store, django_assert_num_queries):
+    with identity_map():
+        metadata = get_store(store.pk)
+        forget_store(store.pk)
+        with django_assert_num_queries(0):
+            assert get_store(store.pk) is metadata
+            assert get_store(openai_id='vs_store') is metadata
+    assert get_store(store.pk) is not metadata
+
+
+def test_repeated_searches_do_not_load_the_store(api_client, store, settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    url = f'/api/vector-stores/{store.pk}/search/'
+    assert api_client.post(url, {'query': 'hello'}, format='json').status_code == 200
+
+    with CaptureQueriesContext(connection) as captured:
+        assert api_client.post(url, {'query': 'hello'}, format='json').status_code == 200
+    assert not [query for query in captured.captured_queries if 'FROM "documents_vectorstore"' in query['sql']]
+
+    assert api_client.post(
+        '/api/vector-stores/00000000-0000-0000-0000-000000000000/search/', {'query': 'hello'}, format='json',
+    ).status_code == 404
+    assert api_client.post('/api/vector-stores/nope/search/', {'query': 'hello'}, format='json').status_code == 404
+
+
+def test_documents_changed_at(store):
+    before = store.documents_changed_at
+
+    stores.documents_changed_at(store.pk, None)
+    store.refresh_from_db()
+    assert store.documents_changed_at > before
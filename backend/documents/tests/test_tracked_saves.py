@@ -0,0 +1,164 @@
+"""
+Saves that write only the fields that changed.
+"""
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from documents.alternative_service import AlternativeOpenAIService
+from documents.local_service import LocalVectorStoreService
+from documents.models import Document, VectorStore
+
+pytestmark = pytest.mark.django_db
+
+
+class CapturedWrites(CaptureQueriesContext):
+    """Captures queries; `writes` are those that change a document or store row"""
+
+    @property
+    def writes(self):
+        tables = ('"documents_document"', '"documents_vectorstore"')
+        return [
+            query['sql'] for query in self.captured_queries
+            if query['sql'].startswith(tuple(f'{verb} {table}' for verb in ('UPDATE', 'INSERT INTO') for table in tables))
+        ]
+
+
+def _set_columns(sql):
+    return sql.split(' SET ')[1].split(' WHERE ')[0]
+
+
+@pytest.fixture
+def document(store):
+    created = Document.objects.create(
+        title='Doc', vector_store=store, file=SimpleUploadedFile('doc.txt', b'hello'), content_type='text/plain',
+    )
+    return Document.objects.select_related('vector_store').get(pk=created.pk)
+
+
+def test_unchanged_rows_are_not_written(document, store):
+    store = VectorStore.objects.get(pk=store.pk)
+    store.status = 'completed'
+
+    with CapturedWrites(connection) as captured:
+        document.save()
+        store.save()
+    assert captured.writes == []
+
+
+def test_only_changed_columns_are_written(document):
+    document.title = 'Renamed'
+    document.attributes['team'] = 'legal'
+
+    with CapturedWrites(connection) as captured:
+        document.save()
+    [sql] = captured.writes
+    columns = _set_columns(sql)
+    assert '"title"' in columns and '"attributes"' in columns and '"updated_at"' in columns
+    assert '"file"' not in columns and '"status"' not in columns
+    assert Document.objects.get(pk=document.pk).attributes == {'team': 'legal'}
+
+
+def test_explicit_update_fields_bump_timestamps_only_on_changes(document):
+    updated_at = document.updated_at
+
+    with CapturedWrites(connection) as captured:
+        document.save(update_fields=[])
+    assert captured.writes == []
+
+    with CapturedWrites(connection) as captured:
+        document.save(update_fields=['title'])
+    [sql] = captured.writes
+    assert '"updated_at"' not in _set_columns(sql)
+
+    document.title = 'Renamed'
+    with CapturedWrites(connection) as captured:
+        document.save(update_fields=['title'])
+    [sql] = captured.writes
+    assert '"updated_at"' in _set_columns(sql)
+    assert Document.objects.get(pk=document.pk).updated_at > updated_at
+
+
+def test_a_new_file_with_the_same_name_is_a_change(document):
+    document.file = SimpleUploadedFile('doc.txt', b'bye')
+
+    with CapturedWrites(connection) as captured:
+        document.save()
+    assert len(captured.writes) == 1
+
+
+def test_refreshed_rows_start_clean(document):
+    Document.objects.filter(pk=document.pk).update(title='Elsewhere')
+    document.refresh_from_db()
+
+    with CapturedWrites(connection) as captured:
+        document.save()
+    assert captured.writes == []
+    assert document.changed_fields() == []
+
+
+def test_coalesced_saves_write_once(document):
+    with CapturedWrites(connection) as captured:
+        with document.coalesced_saves():
+            document.status = 'processing'
+            document.save()
+            document.openai_file_id = 'file-1'
+            document.save()
+            document.status = 'completed'
+            document.save()
+    assert len(captured.writes) == 1
+    saved = Document.objects.get(pk=document.pk)
+    assert (saved.status, saved.openai_file_id) == ('completed', 'file-1')
+
+
+def test_coalesced_saves_are_written_when_the_block_raises(document):
+    with pytest.raises(RuntimeError):
+        with document.coalesced_saves():
+            document.status = 'failed'
+            document.save()
+            raise RuntimeError
+    assert Document.objects.get(pk=document.pk).status == 'failed'
+
+
+def test_local_ingestion_writes_the_row_once(document, store, settings):
+    settings.DOCUMENT_EXTRACTION_ENABLED = False
+
+    with CapturedWrites(connection) as captured:
+        LocalVectorStoreService().process_document(document, store)
+    assert len(captured.writes) == 1
+    assert Document.objects.get(pk=document.pk).status == 'completed'
+
+
+class StatusResponse:
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {'status': 'completed', 'last_error': None}
+
+
+class StatusSession:
+    def get(self, *args, **kwargs):
+        return StatusResponse()
+
+
+def test_polling_an_unchanged_file_writes_nothing(document):
+    service = AlternativeOpenAIService.__new__(AlternativeOpenAIService)
+    service.session = StatusSession()
+    service.base_url = 'https://api.example.com'
+    service.headers = {}
+    Document.objects.filter(pk=document.pk).update(openai_vector_store_file_id='vsf-1', status='processing')
+    document.refresh_from_db()
+
+    with CapturedWrites(connection) as captured:
+        service.get_file_status(document)
+    assert len(captured.writes) == 1
+    processed = document.processed_date
+    assert processed is not None
+
+    polled = Document.objects.select_related('vector_store').get(pk=document.pk)
+    with CapturedWrites(connection) as captured:
+        service.get_file_status(polled)
+    assert captured.writes == []
+    assert polled.processed_date == processed
@@ -0,0 +1,165 @@
+"""
+Resumable uploads: offsets, conflicts, finalizing and expiry.
+"""
+import os
+from datetime import timedelta
+
+import pytest
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from documents.gc import run_cleanups
+from documents.models import Document, UploadSession
+from documents.uploads import claim, expire_sessions
+
+ORIGIN = 'http://localhost:5173'
+
+
+@pytest.fixture(autouse=True)
+def local_backend(settings):
+    settings.VECTOR_STORE_BACKEND = 'local'
+    settings.DOCUMENT_EXTRACTION_ENABLED = False
+
+
+def _start(api_client, store, filename='notes.txt', size=10, **fields):
+    response = api_client.post(
+        '/api/uploads/', {'vector_store_id': str(store.pk), 'filename': filename, 'size': size, **fields},
+        format='json', HTTP_ORIGIN=ORIGIN,
+    )
+    assert response.status_code == 201, response.content
+    return UploadSession.objects.get(pk=response.data['id']), response
+
+
+def _patch(api_client, session, offset, body):
+    return api_client.patch(
+        f'/api/uploads/{session.pk}/', body, content_type='application/offset+octet-stream',
+        HTTP_UPLOAD_OFFSET=str(offset),
+    )
+
+
+def _path(session):
+    return default_storage.path(session.file_name)
+
+
+def test_chunks_append_at_the_offset_and_finalize(api_client, store):
+    session, response = _start(api_client, store, title='Notes')
+    assert response['Upload-Offset'] == '0'
+    assert response['Upload-Length'] == '10'
+    assert os.path.exists(_path(session))
+
+    response = _patch(api_client, session, 0, b'hello')
+    assert response.status_code == 204
+    assert response['Upload-Offset'] == '5'
+    response = _patch(api_client, session, 5, b'world')
+    assert response['Upload-Offset'] == '10'
+
+    response = api_client.post(f'/api/uploads/{session.pk}/finalize/')
+    assert response.status_code == 201
+    document = Document.objects.get(pk=response.data['id'])
+    assert document.title == 'Notes'
+    assert document.file.name == session.file_name
+    assert document.status == 'completed'
+    with document.file.open('rb') as handle:
+        assert handle.read() == b'helloworld'
+
+    # Finalizing again returns the same document
+    again = api_client.post(f'/api/uploads/{session.pk}/finalize/')
+    assert again.status_code == 200
+    assert again.data['id'] == response.data['id']
+    assert _patch(api_client, session, 10, b'x').status_code == 409
+
+
+def test_wrong_offset_is_a_conflict(api_client, store):
+    session, _ = _start(api_client, store)
+    _patch(api_client, session, 0, b'hello')
+
+    response = _patch(api_client, session, 2, b'lo wo')
+    assert response.status_code == 409
+    assert response.data['offset'] == 5
+    assert response['Upload-Offset'] == '5'
+
+    assert _patch(api_client, session, 5, b'rld').status_code == 204
+    progress = api_client.head(f'/api/uploads/{session.pk}/')
+    assert progress['Upload-Offset'] == '8'
+
+
+def test_missing_offset_is_rejected(api_client, store):
+    session, _ = _start(api_client, store)
+
+    response = api_client.patch(f'/api/uploads/{session.pk}/', b'hello', content_type='application/offset+octet-stream')
+    assert response.status_code == 400
+
+
+def test_a_claimed_session_refuses_a_second_writer(store):
+    session = UploadSession.objects.create(
+        vector_store=store, title='t', filename='t.txt', file_name='documents/t.txt', total_size=10,
+    )
+
+    assert claim(session, 0)
+    assert not claim(session, 0)
+    # A writer that died long ago loses its claim
+    UploadSession.objects.filter(pk=session.pk).update(updated_at=timezone.now() - timedelta(minutes=5))
+    assert claim(session, 0)
+
+
+def test_incomplete_upload_cannot_be_finalized(api_client, store):
+    session, _ = _start(api_client, store)
+    _patch(api_client, session, 0, b'hello')
+
+    response = api_client.post(f'/api/uploads/{session.pk}/finalize/')
+    assert response.status_code == 409
+    assert response['Upload-Offset'] == '5'
+    assert not Document.objects.exists()
+
+
+def test_chunk_past_the_declared_size_is_413(api_client, store):
+    session, _ = _start(api_client, store, size=4)
+
+    response = _patch(api_client, session, 0, b'too long')
+    assert response.status_code == 413
+
+
+def test_content_must_match_the_extension(api_client, store):
+    session, _ = _start(api_client, store, filename='report.pdf', size=8)
+
+    response = _patch(api_client, session, 0, b'<html>..')
+    assert response.status_code == 415
+    session.refresh_from_db()
+    assert session.status == 'aborted'
+    assert not os.path.exists(_path(session))
+
+
+def test_abort_deletes_the_partial_file(api_client, store):
+    session, _ = _start(api_client, store)
+    _patch(api_client, session, 0, b'hello')
+
+    assert api_client.delete(f'/api/uploads/{session.pk}/').status_code == 204
+    assert not os.path.exists(_path(session))
+    assert _patch(api_client, session, 5, b'world').status_code == 410
+
+
+def test_cors_allows_and_exposes_the_offset_headers(api_client, store):
+    preflight = api_client.options(
+        '/api/uploads/x/', HTTP_ORIGIN=ORIGIN, HTTP_ACCESS_CONTROL_REQUEST_METHOD='PATCH',
+        HTTP_ACCESS_CONTROL_REQUEST_HEADERS='upload-offset,content-type',
+    )
+    assert 'upload-offset' in preflight['Access-Control-Allow-Headers']
+
+    _, response = _start(api_client, store)
+    exposed = response['Access-Control-Expose-Headers']
+    assert 'Upload-Offset' in exposed and 'Upload-Length' in exposed
+
+
+def test_abandoned_sessions_expire_with_their_files(api_client, store, settings):
+    settings.DOCUMENT_UPLOAD_SESSION_TTL = 3600
+    fresh, _ = _start(api_client, store)
+    abandoned, _ = _start(api_client, store)
+    _patch(api_client, abandoned, 0, b'hello')
+    UploadSession.objects.filter(pk=abandoned.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+
+    assert run_cleanups()['expired_uploads'] == 1
+    abandoned.refresh_from_db()
+    assert abandoned.status == 'aborted'
+    assert not os.path.exists(_path(abandoned))
+    assert os.path.exists(_path(fresh))
+    assert expire_sessions() == 0
@@ -0,0 +1,121 @@
+"""
+Warm results for each store's most asked queries.
+"""
+from datetime import timedelta
+
+import pytest
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from documents import warmup
+from documents.backends import get_service
+from documents.gc import RateLimiter
+from documents.models import Document, Query, QueryTextRollup, VectorStore
+from documents.rollups import EPOCH, buckets, query_hash
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def shared_cache(settings, monkeypatch):
+    """Treat the test cache as one every process shares, and warm up without waiting"""
+    settings.VECTOR_STORE_BACKEND = 'local'
+    monkeypatch.setattr(warmup, 'PER_PROCESS_CACHES', ())
+    monkeypatch.setattr(warmup, '_limiter', RateLimiter(0))
+
+
+@pytest.fixture
+def document(store):
+    return Document.objects.create(
+        title='Doc', vector_store=store, status='completed', openai_file_id='file-1',
+        file=ContentFile(b'alpha and beta', name='doc.txt'),
+    )
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Searches that reach the backend, by whether they are recorded"""
+    calls = []
+    service = get_service()
+    search = service.search_vector_store
+
+    def spy(*args, **kwargs):
+        calls.append(kwargs.get('record', True))
+        return search(*args, **kwargs)
+
+    monkeypatch.setattr(service, 'search_vector_store', spy)
+    return calls
+
+
+def _asked(store, text, count, days_ago=0):
+    day = dict(buckets(timezone.now() - timedelta(days=days_ago)))['day']
+    for granularity, bucket in (('day', day), ('total', EPOCH)):
+        QueryTextRollup.objects.update_or_create(
+            vector_store=store, granularity=granularity, bucket=bucket, query_hash=query_hash(text),
+            defaults={'query_text': text, 'count': count},
+        )
+
+
+def _search(api_client, store, query, **data):
+    response = api_client.post(f'/api/vector-stores/{store.pk}/search/', {'query': query, **data}, format='json')
+    assert response.status_code == 200
+    return response.data
+
+
+def test_recent_queries_weigh_more(store):
+    _asked(store, 'alpha', 10, days_ago=10)
+    _asked(store, 'beta', 4)
+    _asked(store, 'gamma', 1)
+    # Fourteen days back is out of the window
+    _asked(store, 'delta', 100, days_ago=20)
+
+    assert warmup.top_queries(store.pk) == ['beta', 'gamma', 'alpha']
+    assert warmup.top_queries(store.pk, limit=1) == ['beta']
+
+
+def test_warm_results_answer_searches(api_client, store, document, upstream):
+    _asked(store, 'alpha', 3)
+
+    assert warmup.warm_store(store.pk) == 1
+    # Warm-up searches are not recorded as queries
+    assert upstream == [False] and not Query.objects.exists()
+
+    data = _search(api_client, store, 'ALPHA')
+    assert upstream == [False]
+    assert data['results']['search_query'] == 'ALPHA'
+    # The row is there as soon as the response is
+    assert api_client.get(f"/api/queries/{data['query_id']}/").data['query_text'] == 'ALPHA'
+
+    # Filtered searches and other page sizes go upstream
+    _search(api_client, store, 'alpha', max_results=5)
+    _search(api_client, store, 'alpha', filters={'type': 'eq', 'key': 'team', 'value': 'a'})
+    assert upstream == [False, True, True]
+
+
+def test_document_changes_drop_warm_results(api_client, store, document, upstream,
+                                            django_capture_on_commit_callbacks):
+    _asked(store, 'alpha', 3)
+    warmup.warm_store(store.pk)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        document.status = 'failed'
+        document.save()
+    _search(api_client, store, 'alpha')
+    assert upstream == [False, True]
+
+
+def test_stores_without_searchable_documents_are_not_warmed(upstream):
+    store = VectorStore.objects.create(name='Empty', openai_vector_store_id='vs_empty')
+    _asked(store, 'alpha', 3)
+
+    assert warmup.warm_store(store.pk) == 0
+    assert upstream == []
+
+
+def test_per_process_caches_keep_nothing(settings, monkeypatch, store, document, upstream):
+    monkeypatch.setattr(warmup, 'PER_PROCESS_CACHES', (settings.CACHES['default']['BACKEND'],))
+    _asked(store, 'alpha', 3)
+
+    assert not warmup.available()
+    assert warmup.warm_store(store.pk) == 0
+    assert upstream == []
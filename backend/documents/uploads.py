@@ -0,0 +1,128 @@
+"""
+Resumable document uploads
+
+A tus-like protocol: the client creates an UploadSession, PATCHes the bytes
+in order with an Upload-Offset header, and finalizes the session into a
+Document. Chunks go straight into the file's final location under
+MEDIA_ROOT, so finalizing never copies data, and bytes that reached the disk
+before a dropped connection are kept so the client can resume from there.
+"""
+import os
+from datetime import timedelta
+from typing import Optional
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from .models import Document, UploadSession
+
+BLOCK_SIZE = 1024 * 1024
+# A session left in 'writing' this long belongs to a request that died
+STALE_WRITE = timedelta(minutes=2)
+
+# Leading bytes expected for binary formats, checked on the first chunk
+MAGIC_NUMBERS = {
+    '.pdf': (b'%PDF',),
+    '.docx': (b'PK\x03\x04',),
+    '.xlsx': (b'PK\x03\x04',),
+    '.pptx': (b'PK\x03\x04',),
+    '.doc': (b'\xd0\xcf\x11\xe0',),
+}
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def reserve_file(filename: str) -> str:
+    """Create an empty file for an upload and return its storage name"""
+    upload_to = Document._meta.get_field('file').upload_to
+    name = default_storage.generate_filename(os.path.join(upload_to, os.path.basename(filename)))
+    while True:
+        name = default_storage.get_available_name(name)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # Exclusive create, so two sessions never share a file
+            with open(path, 'xb'):
+                return name
+        except FileExistsError:
+            continue
+
+
+def discard_file(session: UploadSession) -> None:
+    try:
+        os.remove(default_storage.path(session.file_name))
+    except FileNotFoundError:
+        pass
+
+
+def check_magic(filename: str, head: bytes) -> None:
+    signatures = MAGIC_NUMBERS.get(os.path.splitext(filename)[1].lower())
+    if not signatures:
+        return
+    for signature in signatures:
+        if head.startswith(signature) or signature.startswith(head):
+            return
+    raise UploadError("File content does not match its extension", 415)
+
+
+def claim(session: UploadSession, offset: int) -> bool:
+    """Lock a session for writing at offset; False if someone else holds it"""
+    stale = timezone.now() - STALE_WRITE
+    claimed = UploadSession.objects.filter(
+        Q(status='active') | Q(status='writing', updated_at__lt=stale),
+        pk=session.pk,
+        offset=offset,
+    ).update(status='writing', updated_at=timezone.now())
+    return bool(claimed)
+
+
+def write_chunk(session: UploadSession, offset: int, stream) -> int:
+    """Append the request body at offset and return the new offset
+
+    The session must have been claimed. Whatever was written is recorded
+    even when reading the body fails half way.
+    """
+    written = 0
+    try:
+        with open(default_storage.path(session.file_name), 'r+b') as handle:
+            handle.seek(offset)
+            # Drop bytes past the offset left by an earlier interrupted chunk
+            handle.truncate()
+            while True:
+                block = stream.read(BLOCK_SIZE)
+                if not block:
+                    break
+                if offset + written + len(block) > session.total_size:
+                    raise UploadError("Chunk goes past the declared upload size", 413)
+                if offset + written == 0:
+                    check_magic(session.filename, block)
+                handle.write(block)
+                written += len(block)
+            handle.flush()
+            os.fsync(handle.fileno())
+    finally:
+        session.offset = offset + written
+        session.status = 'active'
+        UploadSession.objects.filter(pk=session.pk, status='writing').update(
+            status='active', offset=session.offset, updated_at=timezone.now()
+        )
+    return session.offset
+
+
+def expire_sessions(max_age: Optional[int] = None) -> int:
+    """Abort sessions nobody has written to for max_age seconds and delete their files"""
+    max_age = settings.DOCUMENT_UPLOAD_SESSION_TTL if max_age is None else max_age
+    cutoff = timezone.now() - timedelta(seconds=max_age)
+    expired = 0
+    for session in UploadSession.objects.filter(status__in=('active', 'writing'), updated_at__lt=cutoff):
+        # A chunk that arrives in the meantime keeps its session
+        if UploadSession.objects.filter(
+            pk=session.pk, status=session.status, updated_at=session.updated_at
+        ).update(status='aborted', updated_at=timezone.now()):
+            discard_file(session)
+            expired += 1
+    return expired
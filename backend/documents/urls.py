@@ -1,11 +1,13 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import VectorStoreViewSet, DocumentViewSet, QueryViewSet
+from .views import VectorStoreViewSet, DocumentViewSet, QueryViewSet, UploadViewSet, StatsViewSet
 
 router = DefaultRouter()
 router.register(r'vector-stores', VectorStoreViewSet)
 router.register(r'documents', DocumentViewSet)
 router.register(r'queries', QueryViewSet)
+router.register(r'uploads', UploadViewSet)
+router.register(r'stats', StatsViewSet, basename='stats')
 
 urlpatterns = [
     path('api/', include(router.urls)),
@@ -1,22 +1,47 @@
+import io
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from .models import VectorStore, Document, Query
+from django.db import transaction
+from django.db.models import Count
+from .models import VectorStore, Document, Query, UploadSession
 from .serializers import (
-    VectorStoreSerializer, DocumentSerializer, DocumentUploadSerializer,
-    QuerySerializer, VectorStoreSearchSerializer, VectorStoreCreateSerializer
+    VectorStoreSerializer, DocumentSerializer, DocumentUploadSerializer, DocumentChunkSerializer,
+    QuerySerializer, VectorStoreSearchSerializer, VectorStoreCreateSerializer,
+    UploadSessionSerializer, UploadSessionCreateSerializer, StatsQuerySerializer
 )
-# Use alternative service due to OpenAI client issues
-from .alternative_service import AlternativeOpenAIService as OpenAIVectorStoreService
-USE_ALTERNATIVE_SERVICE = True
-print("Using alternative OpenAI service (HTTP-based)")
+from .admission import Overloaded, admit
+from .backends import get_service
+from .conditional import ConditionalGetMixin, queryset_state
+from .deadlines import DeadlineExceeded, check_deadline
+from .downloads import serve_document_file
+from .hydration import hydrate_search_results
+from .ingestion import store_progress
+from .exports import ndjson_response
+from .gc import queue_cleanup
+from .reingest import replace_file
+from .renderers import FastJSONRenderer, PassthroughRenderer
+from .rollups import stats
+from .search import MAX_RESULTS as MAX_SEARCH_RESULTS, full_text_search
+from .stores import get_store
+from .uploads import UploadError, claim, discard_file, write_chunk
+from .warmup import cached_search
 
 
-class VectorStoreViewSet(viewsets.ModelViewSet):
-    queryset = VectorStore.objects.all()
+class VectorStoreViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = VectorStore.objects.annotate(document_total=Count('documents'))
     serializer_class = VectorStoreSerializer
+    modified_fields = ('updated_at',)
+
+    def list_state(self):
+        # document_count moves with the documents, which stamp their store
+        return queryset_state(VectorStore.objects.all(), self.modified_fields + ('documents_changed_at',))
+
+    def object_state(self, obj):
+        return super().object_state(obj) + [obj.document_total]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -31,7 +56,7 @@ class VectorStoreViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         
         try:
-            openai_service = OpenAIVectorStoreService()
+            openai_service = get_service()
             vector_store = openai_service.create_vector_store(
                 name=serializer.validated_data['name'],
                 metadata=serializer.validated_data.get('metadata', {})
@@ -52,7 +77,10 @@ class VectorStoreViewSet(viewsets.ModelViewSet):
         print(f"Search request for vector store: {pk}")
         print(f"Search request data: {request.data}")
         
-        vector_store = self.get_object()
+        # Cached metadata instead of get_object(): no query before the upstream call
+        vector_store = get_store(pk)
+        if vector_store is None:
+            raise Http404
         print(f"Vector store found: {vector_store.name} (ID: {vector_store.id})")
         
         serializer = self.get_serializer(data=request.data)
@@ -64,18 +92,33 @@ class VectorStoreViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            openai_service = OpenAIVectorStoreService()
+            openai_service = get_service()
             print(f"Searching with query: '{serializer.validated_data['query']}'")
             
-            results = openai_service.search_vector_store(
-                vector_store_id=vector_store.openai_vector_store_id,
-                query=serializer.validated_data['query'],
-                max_results=serializer.validated_data.get('max_results', 10)
+            # Popular queries are answered from the results warmed after the last re-index
+            results = cached_search(
+                vector_store,
+                serializer.validated_data['query'],
+                serializer.validated_data.get('max_results', 10),
+                serializer.validated_data.get('filters')
             )
+            if results is None:
+                with admit('interactive', vector_store.id):
+                    results = openai_service.search_vector_store(
+                        vector_store_id=vector_store.openai_vector_store_id,
+                        query=serializer.validated_data['query'],
+                        max_results=serializer.validated_data.get('max_results', 10),
+                        filters=serializer.validated_data.get('filters')
+                    )
             
             print(f"Search completed successfully")
+            results['results'] = hydrate_search_results(results['results'], request)
             return Response(results, status=status.HTTP_200_OK)
+        except (Overloaded, DeadlineExceeded):
+            raise
         except Exception as e:
+            # Backends wrap their errors, timeouts included
+            check_deadline()
             print(f"Search error: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
@@ -84,25 +127,42 @@ class VectorStoreViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def perform_destroy(self, instance):
+        """Delete the store's rows now and its upstream store and files in the background"""
+        file_ids = [
+            file_id
+            for ids in instance.documents.values_list('openai_file_id', 'pending_openai_file_id', 'retired_openai_file_id')
+            for file_id in ids
+        ]
+        with transaction.atomic():
+            instance.delete()
+            queue_cleanup(file_ids=file_ids, vector_store_ids=[instance.openai_vector_store_id])
+
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """Get vector store status from OpenAI"""
         vector_store = self.get_object()
         
         try:
-            openai_service = OpenAIVectorStoreService()
-            status_data = openai_service.get_vector_store_status(vector_store)
+            openai_service = get_service()
+            with admit('interactive', vector_store.pk):
+                status_data = openai_service.get_vector_store_status(vector_store)
+            status_data = {**status_data, 'ingestion': store_progress(vector_store.pk)}
             return Response(status_data, status=status.HTTP_200_OK)
+        except (Overloaded, DeadlineExceeded):
+            raise
         except Exception as e:
+            check_deadline()
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
 
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Document.objects.all()
     serializer_class = DocumentSerializer
+    modified_fields = ('updated_at',)
     parser_classes = [MultiPartParser, FormParser]
 
     def get_serializer_class(self):
@@ -125,20 +185,25 @@ class DocumentViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            # Create document instance
-            document = serializer.save()
-            print(f"Document created: {document.id}")
-            
-            # Process with OpenAI
-            openai_service = OpenAIVectorStoreService()
-            processed_document = openai_service.process_document(
-                document=document,
-                vector_store=document.vector_store
-            )
+            # Take the ingestion slot first, so a refused upload leaves no document behind
+            with admit('background', serializer.validated_data['vector_store_id']):
+                # Create document instance
+                document = serializer.save()
+                print(f"Document created: {document.id}")
+                
+                # Process with OpenAI
+                openai_service = get_service()
+                processed_document = openai_service.process_document(
+                    document=document,
+                    vector_store=document.vector_store
+                )
             
             response_serializer = DocumentSerializer(processed_document)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        except (Overloaded, DeadlineExceeded):
+            raise
         except Exception as e:
+            check_deadline()
             print(f"Error processing document: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
@@ -153,8 +218,9 @@ class DocumentViewSet(viewsets.ModelViewSet):
         document = self.get_object()
         
         try:
-            openai_service = OpenAIVectorStoreService()
-            status_data = openai_service.get_file_status(document)
+            openai_service = get_service()
+            with admit('interactive', document.vector_store_id):
+                status_data = openai_service.get_file_status(document)
             
             # Return updated document data
             serializer = self.get_serializer(document)
@@ -162,29 +228,263 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 'document': serializer.data,
                 'openai_status': status_data
             }, status=status.HTTP_200_OK)
+        except (Overloaded, DeadlineExceeded):
+            raise
         except Exception as e:
+            check_deadline()
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def perform_destroy(self, instance):
+        """Delete the document now and its upstream files in the background"""
+        with transaction.atomic():
+            instance.delete()
+            queue_cleanup(file_ids=[
+                instance.openai_file_id, instance.pending_openai_file_id, instance.retired_openai_file_id
+            ])
+
+    def update(self, request, *args, **kwargs):
+        """Update a document; a new file is re-ingested in the background if its content changed"""
+        self.file_changed = None
+        response = super().update(request, *args, **kwargs)
+        if self.file_changed is not None:
+            response.data['file_changed'] = self.file_changed
+        return response
+
+    def perform_update(self, serializer):
+        upload = serializer.validated_data.pop('file', None)
+        document = serializer.save()
+        if upload is not None:
+            self.file_changed = replace_file(document, upload)
+
+    @action(detail=True, methods=['get'], renderer_classes=[FastJSONRenderer, PassthroughRenderer])
+    def download(self, request, pk=None):
+        """Download the document file, with Range and ETag support"""
+        return serve_document_file(request, self.get_object(), as_attachment=True)
+
+    @action(detail=True, methods=['get'], renderer_classes=[FastJSONRenderer, PassthroughRenderer])
+    def preview(self, request, pk=None):
+        """Show the document file inline, e.g. in a browser PDF viewer"""
+        return serve_document_file(request, self.get_object(), as_attachment=False)
+
+    @action(detail=True, methods=['get'])
+    def chunks(self, request, pk=None):
+        """Get the locally extracted text of a document, optionally for one page"""
+        document = self.get_object()
+        chunks = document.chunks.all()
+        page = request.query_params.get('page')
+        if page and page.isdigit():
+            chunks = chunks.filter(page_number=page)
+        serializer = DocumentChunkSerializer(chunks, many=True)
+        return Response({
+            'extraction_status': document.extraction_status,
+            'page_count': document.page_count,
+            'chunks': serializer.data
+        }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], renderer_classes=[FastJSONRenderer, PassthroughRenderer])
+    def export(self, request):
+        """Stream all matching documents as NDJSON"""
+        return ndjson_response(
+            self.get_queryset(), self.get_serializer_class(), self.get_serializer_context(), 'documents.ndjson'
+        )
+
     def get_queryset(self):
-        """Filter documents by vector store if provided"""
+        """Filter documents by vector store and title search if provided"""
         queryset = Document.objects.all()
         vector_store_id = self.request.query_params.get('vector_store', None)
         if vector_store_id:
             queryset = queryset.filter(vector_store_id=vector_store_id)
+        search = self.request.query_params.get('search', None)
+        if search and self.action in ('list', 'export'):
+            queryset = full_text_search(queryset, search)
+            if self.action == 'list':
+                queryset = queryset[:MAX_SEARCH_RESULTS]
         return queryset
 
 
-class QueryViewSet(viewsets.ReadOnlyModelViewSet):
+class UploadViewSet(viewsets.GenericViewSet):
+    """Resumable uploads: create, PATCH chunks at Upload-Offset, finalize"""
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    # PATCH bodies are raw bytes read from request.stream, never parsed
+    parser_classes = [JSONParser]
+
+    def get_serializer_class(self):
+        if self.action == 'create':
+            return UploadSessionCreateSerializer
+        return UploadSessionSerializer
+
+    def _with_offset(self, response, session):
+        response['Upload-Offset'] = str(session.offset)
+        response['Upload-Length'] = str(session.total_size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def create(self, request):
+        """Start a resumable upload"""
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(
+                {'error': 'Validation failed', 'details': serializer.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        session = serializer.save()
+        response = Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{session.id}/')
+        return self._with_offset(response, session)
+
+    def retrieve(self, request, pk=None):
+        """Get upload progress; HEAD returns just the Upload-Offset header"""
+        session = self.get_object()
+        return self._with_offset(Response(self.get_serializer(session).data), session)
+
+    def partial_update(self, request, pk=None):
+        """Append the request body at the offset given in Upload-Offset"""
+        session = self.get_object()
+        if session.status == 'aborted':
+            return Response({'error': 'Upload was aborted'}, status=status.HTTP_410_GONE)
+        if session.status == 'completed':
+            return Response({'error': 'Upload is already finalized'}, status=status.HTTP_409_CONFLICT)
+
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset header is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if offset != session.offset or not claim(session, offset):
+            session.refresh_from_db()
+            response = Response(
+                {'error': 'Offset does not match the upload', 'offset': session.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+            return self._with_offset(response, session)
+
+        try:
+            write_chunk(session, offset, request.stream or io.BytesIO())
+        except UploadError as e:
+            if e.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE:
+                discard_file(session)
+                session.status = 'aborted'
+                session.save(update_fields=['status', 'updated_at'])
+            return self._with_offset(Response({'error': str(e)}, status=e.status_code), session)
+        except Exception as e:
+            print(f"Upload {session.id} interrupted at {session.offset}: {type(e).__name__}: {e}")
+            return self._with_offset(
+                Response({'error': str(e), 'offset': session.offset}, status=status.HTTP_400_BAD_REQUEST),
+                session
+            )
+
+        return self._with_offset(Response(status=status.HTTP_204_NO_CONTENT), session)
+
+    def destroy(self, request, pk=None):
+        """Abort an upload and delete the partial file"""
+        session = self.get_object()
+        if session.status != 'completed':
+            discard_file(session)
+            session.status = 'aborted'
+            session.save(update_fields=['status', 'updated_at'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Turn a fully received upload into a Document and ingest it"""
+        session = self.get_object()
+        if session.status == 'completed' and session.document_id:
+            return Response(DocumentSerializer(session.document).data, status=status.HTTP_200_OK)
+        if session.status != 'active' or session.offset != session.total_size:
+            return self._with_offset(Response(
+                {'error': 'Upload is not complete', 'offset': session.offset},
+                status=status.HTTP_409_CONFLICT
+            ), session)
+
+        # A refused finalize leaves the session active, so the client can retry it
+        with admit('background', session.vector_store_id):
+            document = Document.objects.create(
+                title=session.title,
+                file=session.file_name,
+                file_size=session.total_size,
+                content_type=session.content_type,
+                vector_store=session.vector_store,
+                attributes=session.attributes,
+            )
+            session.status = 'completed'
+            session.document = document
+            session.save(update_fields=['status', 'document', 'updated_at'])
+
+            try:
+                openai_service = get_service()
+                processed_document = openai_service.process_document(
+                    document=document,
+                    vector_store=document.vector_store
+                )
+                return Response(DocumentSerializer(processed_document).data, status=status.HTTP_201_CREATED)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                check_deadline()
+                print(f"Error processing document: {type(e).__name__}: {e}")
+                return Response(
+                    {'error': str(e)},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+
+class QueryViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Query.objects.all()
     serializer_class = QuerySerializer
+    modified_fields = ('created_at',)
+
+    def object_state(self, obj):
+        # Stored hits are enriched with the documents as they are now
+        hits = (obj.response or {}).get('data')
+        file_ids = {hit.get('file_id') for hit in hits if isinstance(hit, dict)} if isinstance(hits, list) else set()
+        documents = Document.objects.filter(openai_file_id__in=file_ids - {None})
+        return super().object_state(obj) + queryset_state(documents, ('updated_at',))
+
+    def render_object(self, request, instance):
+        """Get a query with its stored hits enriched with local documents"""
+        data = self.get_serializer(instance).data
+        data['response'] = hydrate_search_results(data['response'], request)
+        return Response(data)
+
+    @action(detail=False, methods=['get'], renderer_classes=[FastJSONRenderer, PassthroughRenderer])
+    def export(self, request):
+        """Stream all matching queries, with their responses, as NDJSON"""
+        return ndjson_response(
+            self.get_queryset(), self.get_serializer_class(), self.get_serializer_context(), 'queries.ndjson'
+        )
 
     def get_queryset(self):
-        """Filter queries by vector store if provided"""
+        """Filter queries by vector store and text search if provided"""
         queryset = Query.objects.all()
         vector_store_id = self.request.query_params.get('vector_store', None)
         if vector_store_id:
             queryset = queryset.filter(vector_store_id=vector_store_id)
+        search = self.request.query_params.get('search', None)
+        if search and self.action in ('list', 'export'):
+            queryset = full_text_search(queryset, search)
+            if self.action == 'list':
+                queryset = queryset[:MAX_SEARCH_RESULTS]
         return queryset
+
+
+class StatsViewSet(viewsets.ViewSet):
+    """Dashboard statistics served from the rollup tables"""
+
+    def list(self, request):
+        params = StatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+        return Response(stats(
+            granularity=options['granularity'],
+            periods=options['periods'],
+            vector_store_id=options.get('vector_store'),
+            top=options['top'],
+        ))
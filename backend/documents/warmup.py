@@ -0,0 +1,180 @@
+"""
+Warm results for each store's most asked queries
+
+When the searchable documents of a store change, its warm results are
+dropped at once (a new generation stamp in the shared Django cache makes
+the old entries unreachable), and SEARCH_WARMUP_DELAY seconds later, once a
+burst of changes has settled, a background thread of the web process runs
+the store's top queries again. They are picked from the day rollups of
+query texts (documents.rollups), each day's count weighing half as much
+every SEARCH_WARMUP_HALF_LIFE_DAYS. Warm-up searches share the background
+admission class and a rate budget of their own, and are not recorded as
+queries.
+
+The search endpoint answers an unfiltered search with SEARCH_WARMUP_MAX_RESULTS
+results from a warm page when there is one, and records its Query row like
+any other search. The warm_searches command runs the same
+warm-up for every store, e.g. from cron before SEARCH_WARMUP_TTL runs out.
+
+Only the process that saw a change bumps its generation stamp, so warm
+results are kept and served only when the Django cache is shared by every
+process; with a per-process cache (LocMemCache) searches always go upstream.
+"""
+import heapq
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from .admission import admit
+from .backends import get_service
+from .gc import RateLimiter, has_remote
+from .models import Query, QueryTextRollup
+from .rollups import buckets, query_hash, window_start
+from .stores import get_store
+
+GENERATION_KEY = 'documents:warm-generation:{}'
+# store pk, generation, query hash, max_results
+RESULTS_KEY = 'documents:warm-search:{}:{}:{}:{}'
+
+# Caches that live inside one process, where a generation bump isn't seen by the others
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_limiter = RateLimiter(settings.SEARCH_WARMUP_RATE)
+
+
+def available() -> bool:
+    """Whether warm results can be kept: warm-ups enabled, and a cache all processes share"""
+    return settings.SEARCH_WARMUP_ENABLED and settings.CACHES['default']['BACKEND'] not in PER_PROCESS_CACHES
+
+
+def _generation(vector_store_id) -> str:
+    # A stamp lost to eviction is replaced, which also hides the entries made under it
+    return cache.get_or_set(GENERATION_KEY.format(vector_store_id), lambda: uuid.uuid4().hex, None)
+
+
+def _results_key(vector_store_id, generation: str, query: str, max_results: int) -> str:
+    return RESULTS_KEY.format(vector_store_id, generation, query_hash(query), max_results)
+
+
+def top_queries(vector_store_id, limit: Optional[int] = None, now=None) -> List[str]:
+    """A store's most asked query texts, recent days weighing more"""
+    limit = limit or settings.SEARCH_WARMUP_TOP
+    now = now or timezone.now()
+    today = dict(buckets(now))['day']
+    scores = defaultdict(float)
+    rows = QueryTextRollup.objects.filter(
+        vector_store_id=vector_store_id,
+        granularity='day',
+        bucket__gte=window_start('day', settings.SEARCH_WARMUP_DAYS, now),
+    ).order_by().values_list('query_hash', 'bucket', 'count')
+    for text_hash, bucket, count in rows.iterator():
+        age = (today - bucket).days
+        scores[text_hash] += count * 0.5 ** (age / settings.SEARCH_WARMUP_HALF_LIFE_DAYS)
+
+    top = heapq.nlargest(limit, scores, key=scores.get)
+    labels = dict(
+        QueryTextRollup.objects.filter(vector_store_id=vector_store_id, granularity='total', query_hash__in=top)
+        .values_list('query_hash', 'query_text')
+    )
+    return [labels[text_hash] for text_hash in top if text_hash in labels]
+
+
+def warm_store(vector_store_id, limit: Optional[int] = None, service=None) -> int:
+    """Run a store's top queries and keep their results; returns how many were kept"""
+    store = get_store(vector_store_id)
+    if store is None or not store.completed_documents or not available():
+        return 0
+    service = service or get_service()
+    generation = _generation(store.id)
+    max_results = settings.SEARCH_WARMUP_MAX_RESULTS
+    warmed = 0
+    for query in top_queries(store.id, limit):
+        _limiter.acquire()
+        try:
+            with admit('background', store.id, shed=False):
+                page = service.search_vector_store(
+                    store.openai_vector_store_id, query, max_results, record=False
+                )['results']
+        except Exception as e:
+            print(f"Warm-up search failed for vector store {store.id}: {e}")
+            continue
+        if _generation(store.id) != generation:
+            # The documents changed again and a newer warm-up is on its way
+            break
+        cache.set(_results_key(store.id, generation, query, max_results), page, settings.SEARCH_WARMUP_TTL)
+        warmed += 1
+    return warmed
+
+
+def cached_search(vector_store, query: str, max_results: int,
+                  filters: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Answer a search from warm results and record it, or None if it must go upstream
+
+    Takes the store's StoreMetadata; returns what search_vector_store would.
+    """
+    if filters or max_results != settings.SEARCH_WARMUP_MAX_RESULTS or not available():
+        return None
+    started = time.perf_counter()
+    page = cache.get(_results_key(vector_store.id, _generation(vector_store.id), query, max_results))
+    if page is None:
+        return None
+    page = {**page, 'search_query': query}
+    query_obj = Query.objects.create(
+        vector_store_id=vector_store.id,
+        query_text=query,
+        response=page,
+        max_results=max_results,
+        latency_ms=(time.perf_counter() - started) * 1000
+    )
+    return {
+        'query_id': str(query_obj.id),
+        'results': page
+    }
+
+
+_pending = set()
+_timer = None
+_lock = threading.Lock()
+
+
+def documents_changed(vector_store_id) -> None:
+    """Drop a store's warm results and warm it again once its documents settle"""
+    cache.set(GENERATION_KEY.format(vector_store_id), uuid.uuid4().hex, None)
+    if available() and has_remote():
+        schedule(vector_store_id)
+
+
+def schedule(vector_store_id) -> None:
+    global _timer
+    with _lock:
+        _pending.add(vector_store_id)
+        if _timer is None:
+            # A daemon timer: a warm-up due at shutdown is simply skipped
+            _timer = threading.Timer(settings.SEARCH_WARMUP_DELAY, _drain)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _drain() -> None:
+    global _timer
+    with _lock:
+        # Stores changed from here on get a timer of their own
+        _timer = None
+        pending = list(_pending)
+        _pending.clear()
+    try:
+        for vector_store_id in pending:
+            try:
+                warm_store(vector_store_id)
+            except Exception as e:
+                print(f"Warm-up failed for vector store {vector_store_id}: {e}")
+    finally:
+        connection.close()
@@ -5,7 +5,7 @@ import { Icon } from '@iconify/react';
 import StatCard from '../components/StatCard';
 import RecentQueriesCard from '../components/RecentQueriesCard';
 import { Stats } from '../types';
-import { getDocuments } from '../services/api';
+import { getStats } from '../services/api';
 
 const Dashboard: React.FC = () => {
   const navigate = useNavigate();
@@ -18,27 +18,13 @@ const Dashboard: React.FC = () => {
     const fetchStats = async () => {
       try {
         setIsLoading(true);
-        // En un caso real, habría un endpoint específico para estadísticas
-        // Aquí simulamos con datos de ejemplo
-        let documents = [];
+        // El servidor devuelve los totales ya agregados, sin descargar documentos ni consultas
+        const { totals } = await getStats();
         
-        try {
-          documents = await getDocuments();
-        } catch (apiError) {
-          console.warn('No se pudo conectar con la API, usando datos de ejemplo:', apiError);
-          // Proporcionar datos de ejemplo en caso de error de API
-          documents = [
-            { id: '1', name: 'Documento 1.pdf', status: 'vectorized' },
-            { id: '2', name: 'Documento 2.docx', status: 'pending' },
-            { id: '3', name: 'Documento 3.pdf', status: 'vectorized' }
-          ];
-        }
-        
-        // Simulamos datos de estadísticas
-        const mockStats: Stats = {
-          totalDocuments: documents.length,
-          pendingDocuments: documents.filter(doc => doc.status === 'pending').length,
-          totalQueries: 24,
+        const dashboardStats: Stats = {
+          totalDocuments: totals.documents_uploaded,
+          pendingDocuments: totals.documents_in_progress,
+          totalQueries: totals.query_count,
           recentQueries: [
             {
               id: '1',
@@ -57,7 +43,7 @@ const Dashboard: React.FC = () => {
           ]
         };
         
-        setStats(mockStats);
+        setStats(dashboardStats);
         setError(null);
       } catch (err) {
         console.error('Error al cargar estadísticas:', err);
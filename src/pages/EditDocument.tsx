@@ -96,8 +96,8 @@ const EditDocument: React.FC = () => {
 
             const response = await editDocument(id, formData);
 
-            // Simular advertencia de hash igual (en un caso real, esto vendría del backend)
-            if (Math.random() > 0.7) {
+            // El backend no reprocesa un archivo con el mismo hash que el actual
+            if (response.file_changed === false) {
                 setHashWarning(true);
                 setIsSubmitting(false);
                 return;
@@ -244,8 +244,8 @@ const EditDocument: React.FC = () => {
                                 <div>
                                     <h3 className="font-medium text-warning-700">Advertencia de hash</h3>
                                     <p className="text-warning-700 text-sm">
-                                        El archivo que intentas subir parece ser idéntico al actual (mismo hash).
-                                        Si deseas continuar, el documento será procesado nuevamente.
+                                        El archivo que intentas subir es idéntico al actual (mismo hash).
+                                        El documento no se ha procesado nuevamente.
                                     </p>
                                 </div>
                             </div>
@@ -59,8 +59,8 @@ const QueryResults: React.FC = () => {
                         console.log('Processing result:', result);
                         return {
                             id: `${result.file_id}_${index}`,
-                            documentId: result.file_id,
-                            documentName: result.filename || 'Documento sin nombre',
+                            documentId: result.document?.id ?? result.file_id,
+                            documentName: result.document?.title || result.filename || 'Documento sin nombre',
                             content: result.content ? result.content.map(block => block.text).join(' ') : 'Contenido no disponible',
                             score: result.score || 0
                         };
@@ -11,9 +11,12 @@ import {
     addToast
 } from '@heroui/react';
 import { Icon } from '@iconify/react';
-import { uploadDocument, getProjects, createProject } from '../services/api';
+import { uploadDocument, uploadDocumentResumable, getProjects, createProject } from '../services/api';
 import { Project } from '../types';
 
+// A partir de este tamaño se usa la subida reanudable por partes
+const RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+
 const UploadDocument: React.FC = () => {
     const navigate = useNavigate();
     const [file, setFile] = React.useState<File | null>(null);
@@ -138,12 +141,12 @@ const UploadDocument: React.FC = () => {
             return;
         }
 
-        // Validar tamaño (máximo 25MB)
-        const maxSize = 25 * 1024 * 1024; // 25MB en bytes
+        // Validar tamaño (máximo 512MB)
+        const maxSize = 512 * 1024 * 1024; // 512MB en bytes, límite de OpenAI por archivo
         if (file.size > maxSize) {
             addToast({
                 title: 'Archivo demasiado grande',
-                description: 'El tamaño máximo permitido es 25MB',
+                description: 'El tamaño máximo permitido es 512MB',
                 color: 'danger'
             });
             return;
@@ -152,12 +155,18 @@ const UploadDocument: React.FC = () => {
         try {
             setIsUploading(true);
 
-            const formData = new FormData();
-            formData.append('file', file);
-            formData.append('title', title.trim());
-            formData.append('vector_store_id', selectedProject);
-
-            const response = await uploadDocument(formData);
+            let response;
+            if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+                // Archivos grandes: subida por partes que se puede reanudar
+                response = await uploadDocumentResumable(file, title.trim(), selectedProject);
+            } else {
+                const formData = new FormData();
+                formData.append('file', file);
+                formData.append('title', title.trim());
+                formData.append('vector_store_id', selectedProject);
+
+                response = await uploadDocument(formData);
+            }
 
             addToast({
                 title: 'Documento subido',
@@ -340,7 +349,7 @@ const UploadDocument: React.FC = () => {
                                     Arrastra y suelta tu archivo aquí o haz clic para seleccionar
                                 </p>
                                 <p className="text-default-500 mt-2">
-                                    PDF, DOCX, DOC, TXT o MD (máximo 25MB)
+                                    PDF, DOCX, DOC, TXT o MD (máximo 512MB)
                                 </p>
                             </div>
                         )}
@@ -354,7 +363,7 @@ const UploadDocument: React.FC = () => {
                         </h3>
                         <ul className="list-disc list-inside space-y-1 text-default-600 text-sm">
                             <li>Se permiten archivos PDF, DOCX, DOC, TXT y MD.</li>
-                            <li>El tamaño máximo permitido es de 25MB.</li>
+                            <li>El tamaño máximo permitido es de 512MB.</li>
                             <li>El archivo será procesado por OpenAI y añadido al proyecto seleccionado.</li>
                             <li>El proceso puede tardar unos minutos dependiendo del tamaño del documento.</li>
                             <li>Una vez subido, podrás ver el estado de procesamiento en la lista de documentos.</li>
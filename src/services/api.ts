@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { AttributeFilter, StatsResponse } from '../types';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000/api';
 
@@ -8,6 +9,8 @@ const api = axios.create({
     headers: {
         'Content-Type': 'application/json',
     },
+    // Envía la cookie que mantiene las lecturas en la base principal tras una escritura
+    withCredentials: true,
 });
 
 // Interceptor para manejar errores
@@ -40,10 +43,11 @@ export async function deleteProject(id: string) {
     return response.data;
 }
 
-export async function searchInProject(projectId: string, query: string, maxResults = 10) {
+export async function searchInProject(projectId: string, query: string, maxResults = 10, filters?: AttributeFilter) {
     const response = await api.post(`/vector-stores/${projectId}/search/`, {
         query,
-        max_results: maxResults
+        max_results: maxResults,
+        ...(filters ? { filters } : {})
     });
     return response.data;
 }
@@ -82,8 +86,67 @@ export async function uploadDocument(formData: FormData) {
     return response.data;
 }
 
+// Resumable uploads: the file is sent in chunks and a dropped connection
+// resumes from the last byte the server stored instead of starting over.
+const UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
+
+// A missing header (e.g. not exposed over CORS) must not read as offset NaN
+function uploadOffset(headers: Record<string, any>): number {
+    const value = headers['upload-offset'];
+    const offset = value === undefined || value === '' ? NaN : Number(value);
+    if (!Number.isFinite(offset)) {
+        throw new Error(`Invalid Upload-Offset header: ${value}`);
+    }
+    return offset;
+}
+
+export async function uploadDocumentResumable(
+    file: File,
+    title: string,
+    vectorStoreId: string,
+    onProgress?: (uploaded: number, total: number) => void,
+) {
+    const { data: session } = await api.post('/uploads/', {
+        vector_store_id: vectorStoreId,
+        title,
+        filename: file.name,
+        size: file.size,
+        content_type: file.type,
+    });
+
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        try {
+            const chunk = file.slice(offset, offset + UPLOAD_CHUNK_SIZE);
+            const response = await api.patch(`/uploads/${session.id}/`, chunk, {
+                headers: {
+                    'Content-Type': 'application/offset+octet-stream',
+                    'Upload-Offset': String(offset),
+                },
+            });
+            offset = uploadOffset(response.headers);
+            retries = 0;
+            onProgress?.(offset, file.size);
+        } catch (error: any) {
+            if (retries >= UPLOAD_MAX_RETRIES || error.response?.status === 415) {
+                throw error;
+            }
+            retries += 1;
+            await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** retries));
+            // Ask the server how much it kept before retrying
+            const progress = await api.head(`/uploads/${session.id}/`);
+            offset = uploadOffset(progress.headers);
+        }
+    }
+
+    const response = await api.post(`/uploads/${session.id}/finalize/`);
+    return response.data;
+}
+
 export async function editDocument(id: string, data: any) {
-    const response = await api.put(`/documents/${id}/`, data);
+    const response = await api.patch(`/documents/${id}/`, data);
     return response.data;
 }
 
@@ -97,6 +160,15 @@ export async function getDocumentStatus(id: string) {
     return response.data;
 }
 
+// URLs the browser can open directly (served with Range/ETag support)
+export function getDocumentDownloadUrl(id: string) {
+    return `${API_URL}/documents/${id}/download/`;
+}
+
+export function getDocumentPreviewUrl(id: string) {
+    return `${API_URL}/documents/${id}/preview/`;
+}
+
 // Query functions
 export async function getQueries(vectorStoreId?: string) {
     const params = vectorStoreId ? { vector_store: vectorStoreId } : {};
@@ -109,6 +181,12 @@ export async function getQuery(id: string) {
     return response.data;
 }
 
+// Stats functions
+export async function getStats(params: { granularity?: 'hour' | 'day'; periods?: number; vector_store?: string } = {}) {
+    const response = await api.get<StatsResponse>('/stats/', { params });
+    return response.data;
+}
+
 // Legacy functions for backward compatibility
 export async function getQuestionEmbedding(question: string) {
     // This function may need to be updated to use vector store search
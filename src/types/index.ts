@@ -53,6 +53,17 @@ export interface SearchResult {
     score: number;
     attributes: Record<string, any>;
     content: ContentBlock[];
+    // Local document for the hit, null when the file is unknown locally
+    document?: SearchResultDocument | null;
+}
+
+export interface SearchResultDocument {
+    id: string;
+    title: string;
+    content_type: string;
+    attributes: Record<string, any>;
+    status: Document['status'];
+    download_url: string;
 }
 
 export interface ContentBlock {
@@ -60,6 +71,15 @@ export interface ContentBlock {
     text: string;
 }
 
+// Attribute filters for search (see backend/documents/filters.py)
+export type AttributeValue = string | number | boolean;
+
+export type AttributeFilter =
+    | { type: 'eq' | 'ne' | 'gt' | 'gte' | 'lt' | 'lte'; key: string; value: AttributeValue }
+    | { type: 'in' | 'nin'; key: string; values: AttributeValue[] }
+    | { type: 'range'; key: string; gt?: AttributeValue; gte?: AttributeValue; lt?: AttributeValue; lte?: AttributeValue }
+    | { type: 'and' | 'or'; filters: AttributeFilter[] };
+
 // Legacy types for backward compatibility
 export interface QueryResult {
     id: string;
@@ -93,4 +113,28 @@ export interface Stats {
     recentQueries: Query[];
     vectorStores: VectorStore[];
 }
+
+// Respuesta de /api/stats/ (agregados precalculados en el servidor)
+export interface StatsCounters {
+    query_count: number;
+    distinct_queries: number;
+    documents_uploaded: number;
+    bytes_uploaded: number;
+    documents_completed: number;
+    documents_failed: number;
+}
+
+export interface StatsResponse {
+    granularity: 'hour' | 'day';
+    start: string;
+    totals: StatsCounters & { documents_in_progress: number };
+    series: (StatsCounters & { bucket: string })[];
+    top_queries: { query_text: string; count: number }[];
+    latency_ms: {
+        samples: number;
+        p50: number | null;
+        p95: number | null;
+        p99: number | null;
+    };
+}
   
\ No newline at end of file